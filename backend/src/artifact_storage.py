@@ -0,0 +1,186 @@
+"""
+Storage backends for processed videos, graphs and comparison results
+
+Artifacts are uploaded through a StorageBackend, which retries failed uploads
+with exponential backoff, runs asynchronous uploads on a bounded pool of
+threads, and returns each artifact's public URL. FirebaseStorage writes to the
+Firebase bucket; LocalStorage copies into a directory, so the pipeline can be
+run and load-tested without the real bucket.
+
+The server and job workers pick a backend with storage_from_env:
+    STORAGE_BACKEND       'firebase' (default) or 'local'
+    LOCAL_STORAGE_ROOT    directory for the local backend
+    LOCAL_STORAGE_URL     base URL the local directory is served from (file:// URLs if unset)
+"""
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', '4'))
+UPLOAD_RETRIES = int(os.environ.get('UPLOAD_RETRIES', '3'))
+UPLOAD_BACKOFF = float(os.environ.get('UPLOAD_BACKOFF', '0.5'))  # seconds before the first retry
+
+
+class StorageBackend:
+    """
+    Uploads with retries and bounded concurrency; subclasses implement _put
+    (one upload attempt, returning the URL) and url_for
+    """
+    name = 'storage'
+
+    def __init__(self, workers=UPLOAD_WORKERS, retries=UPLOAD_RETRIES, backoff=UPLOAD_BACKOFF):
+        self.workers = max(1, workers)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {'uploads': 0, 'bytes': 0, 'retries': 0, 'failures': 0, 'seconds': 0.0}
+
+    def _put(self, local_path, remote_path, content_type):
+        raise NotImplementedError
+
+    def url_for(self, remote_path):
+        """URL remote_path is (or will be, once uploaded) served from"""
+        raise NotImplementedError
+
+    def check(self):
+        """Raise if the backend can't be written to"""
+
+    def upload(self, local_path, remote_path, content_type=None):
+        """Upload a file, retrying with backoff on failure; returns its URL"""
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                url = self._put(local_path, remote_path, content_type)
+                break
+            except (FileNotFoundError, ValueError):
+                raise  # A missing local file or a bad path won't succeed on retry
+            except Exception as e:
+                if attempt == self.retries:
+                    self._count(failures=1)
+                    logger.error(f"Upload of {remote_path} failed after {attempt + 1} attempts: {str(e)}")
+                    raise
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                logger.warning(f"Upload of {remote_path} failed ({str(e)}); retrying in {delay:.2f}s")
+                self._count(retries=1)
+                time.sleep(delay)
+        self._count(uploads=1, bytes=os.path.getsize(local_path), seconds=time.perf_counter() - start)
+        return url
+
+    def upload_async(self, local_path, remote_path, content_type=None):
+        """Queue an upload on the backend's thread pool; returns a Future of the URL"""
+        with self._lock:
+            # Created on first use; job workers and spawned processes get their own
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='upload')
+        return self._executor.submit(self.upload, local_path, remote_path, content_type)
+
+    def upload_many(self, files):
+        """Upload (local_path, remote_path, content_type) triples concurrently; returns their URLs in order"""
+        futures = [self.upload_async(*item) for item in files]
+        return [future.result() for future in futures]
+
+    def _count(self, **amounts):
+        with self._lock:
+            for key, amount in amounts.items():
+                self._stats[key] += amount
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['seconds'] = round(stats['seconds'], 3)
+        stats.update(backend=self.name, workers=self.workers, retries_per_upload=self.retries)
+        return stats
+
+
+class FirebaseStorage(StorageBackend):
+    """Public blobs in a Firebase storage bucket"""
+    name = 'firebase'
+
+    def __init__(self, bucket, **kwargs):
+        super().__init__(**kwargs)
+        self.bucket = bucket
+
+    def _put(self, local_path, remote_path, content_type):
+        blob = self.bucket.blob(remote_path)
+        blob.upload_from_filename(local_path, content_type=content_type)
+        blob.make_public()
+        return blob.public_url
+
+    def url_for(self, remote_path):
+        return self.bucket.blob(remote_path).public_url
+
+    def check(self):
+        if not self.bucket.exists():
+            raise RuntimeError(f"Storage bucket {self.bucket.name} does not exist")
+
+
+class LocalStorage(StorageBackend):
+    """Files under a local directory, for tests, benchmarks and load tests"""
+    name = 'local'
+
+    def __init__(self, root, base_url=None, **kwargs):
+        super().__init__(**kwargs)
+        self.root = Path(root).resolve()
+        self.base_url = base_url.rstrip('/') if base_url else None
+
+    def path_for(self, remote_path):
+        path = (self.root / remote_path).resolve()
+        if self.root not in path.parents:
+            raise ValueError(f"Storage path escapes the storage root: {remote_path}")
+        return path
+
+    def _put(self, local_path, remote_path, content_type):
+        path = self.path_for(remote_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Copy next to the destination, then rename, so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix='.upload-')
+        os.close(fd)
+        try:
+            shutil.copyfile(local_path, temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return self.url_for(remote_path)
+
+    def url_for(self, remote_path):
+        if self.base_url:
+            return f'{self.base_url}/{remote_path}'
+        return self.path_for(remote_path).as_uri()
+
+    def check(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        if not os.access(self.root, os.W_OK):
+            raise PermissionError(f"Storage root {self.root} is not writable")
+
+
+def as_storage(storage_or_bucket):
+    """A StorageBackend as is; anything else is taken to be a Firebase bucket"""
+    if isinstance(storage_or_bucket, StorageBackend):
+        return storage_or_bucket
+    return FirebaseStorage(storage_or_bucket)
+
+
+def storage_from_env(get_bucket):
+    """
+    The backend chosen by STORAGE_BACKEND
+
+    get_bucket is only called for the Firebase backend, so the local backend
+    never initializes Firebase.
+    """
+    backend = os.environ.get('STORAGE_BACKEND', 'firebase')
+    if backend == 'local':
+        return LocalStorage(os.environ.get('LOCAL_STORAGE_ROOT', os.path.join(os.getcwd(), 'storage')),
+                            os.environ.get('LOCAL_STORAGE_URL'))
+    if backend == 'firebase':
+        return FirebaseStorage(get_bucket())
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -0,0 +1,206 @@
+"""
+Score many user landmark files against one reference
+
+The reference is compiled once (see compiled_reference) and every worker
+process memory maps the same compiled file, so workers share its pages and
+only the user side is prepared per file. User files are scored in parallel
+and each result is appended to a CSV or JSONL file as soon as it is ready.
+Re-running the same command after an interruption skips the users already in
+the results file.
+
+Run from backend/src:
+    python batch_compare.py reference.npz users/ --results scores.jsonl
+    python batch_compare.py reference.npz manifest.txt --results scores.csv --workers 8
+    python batch_compare.py reference.ref.npz users/ --results scores.jsonl
+"""
+import csv
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from compare_landmarks import pose_sequence_from, calculate_pose_similarity
+from compiled_reference import CompiledReference, compile_reference_file, is_compiled_reference_path
+from body_parts import PART_NAMES
+from reference_index import LANDMARK_EXTENSIONS
+
+RESULT_FIELDS = ('user', 'frames', 'overall_similarity', 'timing_alignment') + PART_NAMES + ('error',)
+
+
+def find_user_files(source):
+    """
+    Landmark files to score: every .npz/.json file under a directory, or the
+    paths listed in a manifest file (one per line, relative to the manifest,
+    blank lines and # comments ignored)
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, name) for name in files
+                         if name.endswith(LANDMARK_EXTENSIONS) and not is_compiled_reference_path(name))
+        return sorted(paths)
+
+    base = os.path.dirname(source)
+    paths = []
+    with open(source, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                paths.append(line if os.path.isabs(line) else os.path.join(base, line))
+    return paths
+
+
+def _results_format(path):
+    return 'csv' if path.endswith('.csv') else 'jsonl'
+
+
+def completed_users(results_path):
+    """
+    Users already scored in an existing results file
+
+    A run killed mid-write can leave a partial last line; it is cut off here
+    so that appending continues from a clean line boundary.
+    """
+    if not os.path.exists(results_path):
+        return set()
+    with open(results_path, 'rb+') as f:
+        content = f.read()
+        complete = content.rfind(b'\n') + 1
+        if complete < len(content):
+            f.truncate(complete)
+    lines = content[:complete].decode().splitlines()
+
+    if _results_format(results_path) == 'csv':
+        return {row['user'] for row in csv.DictReader(lines)}
+    users = set()
+    for line in lines:
+        if line.strip():
+            users.add(json.loads(line)['user'])
+    return users
+
+
+# Per-process state of scoring workers, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(reference_path, dtw_window, visibility_weighted, subsequence):
+    _worker['reference'] = CompiledReference.load(reference_path)
+    _worker['subsequence'] = subsequence
+    _worker['dtw_window'] = dtw_window
+    _worker['visibility_weighted'] = visibility_weighted
+
+
+def score_user(user_path):
+    """One results row for a user landmark file, scored against the worker's reference"""
+    row = {field: None for field in RESULT_FIELDS}
+    row['user'] = user_path
+    try:
+        # The per-file diagnostics are noise across thousands of files
+        user_seq = pose_sequence_from(user_path, verbose=False)
+        comparison = calculate_pose_similarity(
+            user_seq, _worker['reference'], _worker['dtw_window'], _worker['visibility_weighted'],
+            _worker['subsequence'], verbose=False
+        )
+        row['frames'] = len(user_seq)
+        row['error'] = comparison.get('error')
+        row['overall_similarity'] = comparison['overall_similarity']
+        row['timing_alignment'] = comparison['timing_alignment']
+        for part in PART_NAMES:
+            row[part] = comparison['key_points_analysis'].get(part)
+    except Exception as e:
+        row['error'] = str(e)
+    return row
+
+
+def score_batch(ref_landmarks, user_paths, results_path, workers=None, dtw_window=None,
+                visibility_weighted=False, subsequence=False, max_in_flight=None):
+    """
+    Score user_paths against ref_landmarks, appending one row per user to results_path
+
+    ref_landmarks may be a compiled reference (.ref.npz); anything else is
+    compiled into a temporary file for the run. Users already present in
+    results_path are skipped, so an interrupted run can simply be restarted.
+    Returns (scored, skipped) counts.
+    """
+    done = completed_users(results_path)
+    todo = [path for path in user_paths if path not in done]
+    if not todo:
+        return 0, len(user_paths)
+
+    if is_compiled_reference_path(ref_landmarks):
+        return _score_batch(ref_landmarks, todo, results_path, workers, dtw_window, visibility_weighted,
+                            subsequence, max_in_flight), len(user_paths) - len(todo)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Compiled with the reference's frame rate, which sets the default DTW band
+        reference_path = compile_reference_file(ref_landmarks, os.path.join(tmp, 'reference.ref.npz'),
+                                                visibility_weighted)
+        scored = _score_batch(reference_path, todo, results_path, workers, dtw_window, visibility_weighted,
+                              subsequence, max_in_flight)
+    return scored, len(user_paths) - len(todo)
+
+
+def _score_batch(reference_path, todo, results_path, workers, dtw_window, visibility_weighted, subsequence,
+                 max_in_flight):
+    """Score todo against a compiled reference file; returns how many were scored"""
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 4
+    fmt = _results_format(results_path)
+    write_header = fmt == 'csv' and (not os.path.exists(results_path) or os.path.getsize(results_path) == 0)
+
+    scored = 0
+    with open(results_path, 'a', newline='') as out, ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker,
+        initargs=(reference_path, dtw_window, visibility_weighted, subsequence)
+    ) as executor:
+        writer = csv.DictWriter(out, fieldnames=RESULT_FIELDS) if fmt == 'csv' else None
+        if write_header:
+            writer.writeheader()
+
+        queued = iter(todo)
+        running = set()
+        while True:
+            # Keep a bounded number of files in flight so results stream out steadily
+            for path in queued:
+                running.add(executor.submit(score_user, path))
+                if len(running) >= max_in_flight:
+                    break
+            if not running:
+                break
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                row = future.result()
+                if writer:
+                    writer.writerow(row)
+                else:
+                    out.write(json.dumps(row) + '\n')
+                scored += 1
+            out.flush()
+            print(f"Scored {scored}/{len(todo)}", end='\r', flush=True)
+    print()
+    return scored
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Score a corpus of user landmark files against one reference')
+    parser.add_argument('ref_landmarks', help='Path to reference video landmarks (.npz, JSON or compiled .ref.npz)')
+    parser.add_argument('users', help='Directory of user landmark files, or a manifest listing them')
+    parser.add_argument('--results', required=True, help='Results file to append to (.csv or .jsonl)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per core)')
+    parser.add_argument('--dtw-window', type=int, help='Sakoe-Chiba band for DTW alignment, in frames')
+    parser.add_argument('--visibility-weighted', action='store_true',
+                        help='Weight joints by visibility when aligning')
+    parser.add_argument('--subsequence', action='store_true',
+                        help='Score each user against the best-matching section of the reference only')
+    args = parser.parse_args()
+
+    user_paths = find_user_files(args.users)
+    scored, skipped = score_batch(args.ref_landmarks, user_paths, args.results, workers=args.workers,
+                                  dtw_window=args.dtw_window, visibility_weighted=args.visibility_weighted,
+                                  subsequence=args.subsequence)
+    print(f"Scored {scored} users ({skipped} already in {args.results})")
+
+
+if __name__ == "__main__":
+    main()
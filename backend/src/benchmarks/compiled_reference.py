@@ -0,0 +1,63 @@
+"""
+Per-attempt scoring cost with and without a precompiled reference
+
+Scores the same user clips against a reference passed as a raw pose sequence
+(prepared again on every call) and as a CompiledReference loaded by memory
+map, checks that the scores agree, and reports time per attempt.
+
+Run from backend/src:
+    python -m benchmarks.compiled_reference [--ref-frames 3000] [--user-frames 900] [--attempts 20]
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from benchmarks.similarity import synthetic_landmarks
+from compare_landmarks import pose_sequence_from, calculate_pose_similarity
+from compiled_reference import CompiledReference
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark scoring against a compiled reference')
+    parser.add_argument('--ref-frames', type=int, default=3000)
+    parser.add_argument('--user-frames', type=int, default=900)
+    parser.add_argument('--attempts', type=int, default=20)
+    parser.add_argument('--subsequence', action='store_true')
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        ref_seq = pose_sequence_from(synthetic_landmarks(args.ref_frames, seed=1))
+        users = [pose_sequence_from(synthetic_landmarks(args.user_frames, seed=10 + i))
+                 for i in range(args.attempts)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'reference.ref.npz')
+        start = time.perf_counter()
+        CompiledReference.compile(ref_seq).save(path)
+        compile_ms = (time.perf_counter() - start) * 1000
+        compiled = CompiledReference.load(path)
+
+        timings = {}
+        scores = {}
+        for name, reference in (('raw', ref_seq), ('compiled', compiled)):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                scores[name] = [calculate_pose_similarity(user, reference, subsequence=args.subsequence)
+                                for user in users]
+            timings[name] = (time.perf_counter() - start) * 1000 / args.attempts
+
+        drift = max(abs(a['overall_similarity'] - b['overall_similarity'])
+                    for a, b in zip(scores['raw'], scores['compiled']))
+        del compiled  # Release the memory map before the directory is removed
+
+    print(f"{args.attempts} attempts of {args.user_frames} frames against {args.ref_frames} reference frames "
+          f"(compiled and saved in {compile_ms:.1f} ms)")
+    print(f"raw: {timings['raw']:.2f} ms/attempt, compiled: {timings['compiled']:.2f} ms/attempt "
+          f"({timings['raw'] / timings['compiled']:.2f}x), max score difference {drift:.2e}")
+
+
+if __name__ == "__main__":
+    main()
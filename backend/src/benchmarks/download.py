@@ -0,0 +1,123 @@
+"""
+Benchmark video ingest against a local stand-in for the storage server
+
+Serves two synthetic "videos" over HTTP/1.1 from a local server that adds a
+fixed setup delay to every new connection (standing in for the TCP + TLS
+handshake to Firebase Storage) and caps each connection's bandwidth. Compares
+the original ingest (sequential requests.get, 8 KB chunks, a new connection
+per file) with downloads.download_in_background (concurrent, pooled session,
+large chunks, checksum verified).
+
+Run from backend/src:
+    python -m benchmarks.download [--size-mb 20] [--mbps 200] [--connect-ms 150]
+"""
+import argparse
+import base64
+import hashlib
+import os
+import socket
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from downloads import download_in_background, http_session
+
+
+def make_handler(files, connect_delay, bytes_per_second):
+    class StorageHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, like the real storage server
+
+        def setup(self):
+            time.sleep(connect_delay)  # Once per connection, not per request
+            super().setup()
+
+        def do_GET(self):
+            body = files.get(self.path)
+            if body is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'video/mp4')
+            self.send_header('Content-Length', str(len(body)))
+            md5 = base64.b64encode(hashlib.md5(body).digest()).decode()
+            self.send_header('x-goog-hash', f'md5={md5}')
+            self.end_headers()
+            step = 64 * 1024
+            for offset in range(0, len(body), step):
+                start = time.perf_counter()
+                self.wfile.write(body[offset:offset + step])
+                # Throttle to the configured per-connection bandwidth
+                remaining = step / bytes_per_second - (time.perf_counter() - start)
+                if remaining > 0:
+                    time.sleep(remaining)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StorageHandler
+
+
+def original_download(url, output_path):
+    """The ingest path before the pooled, concurrent downloader"""
+    response = requests.get(url, stream=True)
+    response.raise_for_status()
+    with open(output_path, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=8192):
+            f.write(chunk)
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark video downloads against a local storage stand-in')
+    parser.add_argument('--size-mb', type=float, default=20, help='Size of each synthetic video')
+    parser.add_argument('--mbps', type=float, default=200, help='Per-connection bandwidth in megabits/s')
+    parser.add_argument('--connect-ms', type=float, default=150, help='Setup delay of each new connection')
+    parser.add_argument('--repeat', type=int, default=3, help='Requests to simulate (connections can be reused)')
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    files = {
+        '/user_video.mp4': os.urandom(size),
+        '/reference_video.mp4': os.urandom(size)
+    }
+    handler = make_handler(files, args.connect_ms / 1000, args.mbps * 1e6 / 8)
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = {name: f'http://127.0.0.1:{port}{name}' for name in files}
+
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = {name: os.path.join(temp_dir, name.lstrip('/')) for name in files}
+            http_session()  # Created once per server process
+
+            print(f"{'request':>8} {'original':>10} {'concurrent':>11} {'first ready':>12} {'speedup':>8}")
+            for attempt in range(args.repeat):
+                start = time.perf_counter()
+                for name in files:
+                    original_download(urls[name], paths[name])
+                original_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                futures = [download_in_background(urls[name], paths[name]) for name in files]
+                downloads = [future.result() for future in futures]
+                concurrent_time = time.perf_counter() - start
+                # Processing of the first video can start at this point
+                first_ready = min(download.seconds for download in downloads)
+                for download in downloads:
+                    with open(download.path, 'rb') as f:
+                        assert hashlib.sha256(f.read()).hexdigest() == download.sha256
+
+                print(f"{attempt + 1:>8} {original_time:>9.2f}s {concurrent_time:>10.2f}s {first_ready:>11.2f}s "
+                      f"{original_time / concurrent_time:>7.1f}x")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
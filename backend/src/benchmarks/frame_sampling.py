@@ -0,0 +1,117 @@
+"""
+Speed gained vs score drift for reduced-rate pose detection
+
+With a video, runs process_video at full rate and at each target fps (plain
+and motion-adaptive) and reports the processing time and how far the
+comparison scores move from the full-rate ones. With --landmarks, replays
+sampling on already recorded full-rate landmarks instead (no detector
+needed): frames are dropped as FrameSampler would drop them and filled back
+in by interpolation. Adaptive sampling is replayed with the lag it has in
+process_video, where a stride change reaches the decode thread only after
+--queue-depth + 1 further sampled frames.
+
+Scores are taken against --reference landmarks if given, otherwise against
+the full-rate landmarks themselves.
+
+Run from backend/src:
+    python -m benchmarks.frame_sampling video.mp4 [--reference ref.npz] [--target-fps 30 15 10]
+    python -m benchmarks.frame_sampling --landmarks user.npz [--reference ref.npz] [--queue-depth 4]
+"""
+import argparse
+import collections
+import contextlib
+import io
+import os
+import time
+
+from compare_landmarks import load_landmarks, pose_sequence_from, calculate_pose_similarity
+from frame_sampling import FrameSampler, fill_skipped_frames
+from landmark_store import LandmarkArrays
+
+
+def replay_sampling(landmarks_data, target_fps, adaptive, lag=0):
+    """
+    Landmarks as reduced-rate detection plus interpolation would have produced them
+
+    lag: sampled frames taken before a detection is observed, as the decode
+    thread runs that far ahead of inference in process_video
+    """
+    fps = landmarks_data.get('fps') or 30
+    sampler = FrameSampler(fps, target_fps, adaptive)
+    sampled = []
+    pending = collections.deque()
+    for frame in landmarks_data['frames']:
+        if sampler.take(frame['frame_id']):
+            sampled.append(frame)
+            pending.append(frame)
+            if len(pending) > lag:
+                observed = pending.popleft()
+                sampler.observe(observed['frame_id'], observed['poses'])
+    for observed in pending:
+        sampler.observe(observed['frame_id'], observed['poses'])
+    frames = fill_skipped_frames(sampled, len(landmarks_data['frames']), fps)
+    return dict(landmarks_data, frames=frames), sampler.detected
+
+
+def scores(user_landmarks, ref_seq):
+    result = calculate_pose_similarity(pose_sequence_from(user_landmarks, verbose=False), ref_seq, verbose=False)
+    return result['overall_similarity'], result['timing_alignment']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark frame sampling speed vs score drift')
+    parser.add_argument('video', nargs='?', help='Video to process (requires mediapipe)')
+    parser.add_argument('--landmarks', help='Replay sampling on recorded full-rate landmarks instead')
+    parser.add_argument('--reference', help='Reference landmarks to score against')
+    parser.add_argument('--bbox', nargs=4, type=int, metavar=('X', 'Y', 'WIDTH', 'HEIGHT'))
+    parser.add_argument('--target-fps', nargs='+', type=float, default=[30, 15, 10])
+    parser.add_argument('--queue-depth', type=int, default=int(os.environ.get('PIPELINE_QUEUE_DEPTH', '4')),
+                        help='Pipeline queue depth process_video runs with (sets the replayed adaptive lag)')
+    args = parser.parse_args()
+    if not args.video and not args.landmarks:
+        parser.error('give a video or --landmarks')
+
+    if args.landmarks:
+        with contextlib.redirect_stdout(io.StringIO()):
+            full = load_landmarks(args.landmarks)
+        if isinstance(full, LandmarkArrays):
+            full = full.to_dict()
+        full_time = None
+    else:
+        from train import process_video
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            full = process_video(args.video, None, tuple(args.bbox) if args.bbox else None)
+        full_time = time.perf_counter() - start
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        ref_seq = pose_sequence_from(args.reference) if args.reference else pose_sequence_from(full)
+    base_overall, base_timing = scores(full, ref_seq)
+    total = len(full['frames'])
+    fps = full.get('fps') or 30
+
+    print(f"{total} frames at {fps} fps; full rate: overall {base_overall:.4f}, timing {base_timing:.4f}"
+          + (f", {full_time:.2f}s" if full_time is not None else ""))
+    print(f"{'target':>7} {'adaptive':>9} {'detected':>9} {'time':>8} {'speedup':>8} "
+          f"{'overall drift':>14} {'timing drift':>13}")
+    for target_fps in args.target_fps:
+        for adaptive in (False, True):
+            if args.landmarks:
+                sampled, detected = replay_sampling(full, target_fps, adaptive, lag=args.queue_depth + 1)
+                elapsed = None
+            else:
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    sampled = process_video(args.video, None, tuple(args.bbox) if args.bbox else None,
+                                            queue_depth=args.queue_depth, target_fps=target_fps,
+                                            adaptive_sampling=adaptive)
+                elapsed = time.perf_counter() - start
+                detected = sampled['sampling']['detected_frames']
+            overall, timing = scores(sampled, ref_seq)
+            timing_text = f"{elapsed:>7.2f}s {full_time / elapsed:>7.1f}x" if elapsed else f"{'-':>8} {total / detected:>7.1f}x"
+            print(f"{target_fps:>7g} {str(adaptive):>9} {detected:>9} {timing_text} "
+                  f"{overall - base_overall:>+14.4f} {timing - base_timing:>+13.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Per-frame cost of preparing decoded frames for the landmarker
+
+Compares the original preparation (crop, full-resolution BGR to RGB
+conversion, a fresh array per frame) with FramePreprocessor (recycled
+buffers, downscale before converting) on synthetic frames, so decoding cost
+is left out.
+
+Run from backend/src:
+    python -m benchmarks.preprocess [--size 3840 2160] [--bbox X Y W H] [--frames 300]
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from frame_preprocess import FramePreprocessor, DETECTION_MAX_SIDE
+from pipeline import max_in_flight
+
+
+class FakeCapture:
+    """Stands in for cv2.VideoCapture, copying one synthetic frame into the caller's buffer"""
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def read(self, image=None):
+        if image is None or image.shape != self.frame.shape:
+            return True, self.frame.copy()
+        np.copyto(image, self.frame)
+        return True, image
+
+
+def original_prepare(cap, x, y, width, height):
+    ret, frame = cap.read()
+    frame = frame[y:y + height, x:x + width]
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark frame preprocessing before pose detection')
+    parser.add_argument('--size', nargs=2, type=int, default=[3840, 2160], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--bbox', nargs=4, type=int, metavar=('X', 'Y', 'WIDTH', 'HEIGHT'))
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--max-side', type=int, default=DETECTION_MAX_SIDE)
+    args = parser.parse_args()
+
+    width, height = args.size
+    frame = np.random.default_rng(0).integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    crop = tuple(args.bbox) if args.bbox else (0, 0, width, height)
+    cap = FakeCapture(frame)
+
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        original_prepare(cap, *crop)
+    original_ms = (time.perf_counter() - start) * 1000 / args.frames
+
+    preprocessor = FramePreprocessor(crop, (width, height), max_in_flight(1), args.max_side)
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        preprocessor.read(cap)
+    new_ms = (time.perf_counter() - start) * 1000 / args.frames
+
+    print(f"{width}x{height} frames, crop {crop[2]}x{crop[3]} -> detection "
+          f"{preprocessor.detection_width}x{preprocessor.detection_height}")
+    print(f"original: {original_ms:.2f} ms/frame, preprocessor: {new_ms:.2f} ms/frame "
+          f"({original_ms / new_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Compare MediaPipe IMAGE and VIDEO running modes on the same clip
+
+Run from backend/src:
+    python -m benchmarks.running_mode path/to/video.mp4 [--bbox X Y W H]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from train import process_video
+from detector_pool import RUNNING_MODE_IMAGE, RUNNING_MODE_VIDEO
+
+
+def first_pose_array(landmarks_data):
+    """(frames, 33, 3) array of the first pose per frame, NaN where no pose was found"""
+    frames = landmarks_data['frames']
+    coords = np.full((len(frames), 33, 3), np.nan, dtype=np.float32)
+    for i, frame in enumerate(frames):
+        if frame['poses']:
+            coords[i] = [[lm['x'], lm['y'], lm['z']] for lm in frame['poses'][0]['landmarks']]
+    return coords
+
+
+def run_mode(video_path, bbox, running_mode, temp_dir):
+    output_path = os.path.join(temp_dir, f'{running_mode}.mp4')
+    start = time.perf_counter()
+    data = process_video(video_path, output_path, bbox, running_mode=running_mode)
+    elapsed = time.perf_counter() - start
+    return data, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark IMAGE vs VIDEO running mode')
+    parser.add_argument('video', help='Path to the input video file')
+    parser.add_argument('--bbox', nargs=4, type=int, metavar=('X', 'Y', 'WIDTH', 'HEIGHT'))
+    args = parser.parse_args()
+    bbox = tuple(args.bbox) if args.bbox else None
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        image_data, image_time = run_mode(args.video, bbox, RUNNING_MODE_IMAGE, temp_dir)
+        video_data, video_time = run_mode(args.video, bbox, RUNNING_MODE_VIDEO, temp_dir)
+
+    frames = len(image_data['frames'])
+    image_coords = first_pose_array(image_data)
+    video_coords = first_pose_array(video_data)
+    both = ~np.isnan(image_coords[:, 0, 0]) & ~np.isnan(video_coords[:, 0, 0])
+    presence_agreement = np.mean(np.isnan(image_coords[:, 0, 0]) == np.isnan(video_coords[:, 0, 0]))
+
+    print(f"Frames: {frames}")
+    print(f"IMAGE mode: {frames / image_time:.1f} frames/sec ({image_time:.2f}s)")
+    print(f"VIDEO mode: {frames / video_time:.1f} frames/sec ({video_time:.2f}s)")
+    print(f"Speedup: {image_time / video_time:.2f}x")
+    print(f"Pose presence agreement: {presence_agreement:.2%}")
+    if both.any():
+        errors = np.linalg.norm(image_coords[both] - video_coords[both], axis=-1)
+        print(f"Mean landmark distance (m): {errors.mean():.4f}")
+        print(f"95th percentile landmark distance (m): {np.percentile(errors, 95):.4f}")
+
+
+if __name__ == "__main__":
+    main()
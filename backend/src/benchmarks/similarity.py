@@ -0,0 +1,105 @@
+"""
+Microbenchmark for extract_pose_sequence and frame-by-frame similarity
+
+Times the vectorized implementations in compare_landmarks against the
+original per-frame Python loops on synthetic example-style landmarks, and
+checks that both produce the same numbers.
+
+Run from backend/src:
+    python -m benchmarks.similarity [--frames 1000 10000 100000]
+"""
+import argparse
+import contextlib
+import io
+import time
+
+import numpy as np
+from scipy.spatial.distance import cosine
+
+from compare_landmarks import extract_pose_sequence, rowwise_cosine_similarity
+from landmark_store import from_dict
+
+
+def synthetic_landmarks(num_frames, seed=0, missing_every=17):
+    """Landmarks dict shaped like process_video output, with some frames lacking a pose"""
+    rng = np.random.default_rng(seed)
+    values = rng.normal(scale=0.3, size=(num_frames, 33, 4))
+    values[..., 3] = rng.random((num_frames, 33))
+    frames = []
+    for i in range(num_frames):
+        poses = []
+        if i % missing_every:
+            poses.append({'landmarks': [
+                {'x': float(x), 'y': float(y), 'z': float(z), 'visibility': float(v)}
+                for x, y, z, v in values[i]
+            ]})
+        frames.append({'frame_id': i, 'timestamp': i / 30, 'poses': poses})
+    return {'fps': 30, 'frames': frames}
+
+
+def loop_extract(landmarks_data):
+    """The original nested-loop extract_pose_sequence"""
+    sequences = []
+    for frame in landmarks_data.get('frames', []):
+        if frame.get('poses'):
+            landmarks = []
+            for lm in frame['poses'][0].get('landmarks', []):
+                landmarks.extend([
+                    float(lm.get('x', 0)),
+                    float(lm.get('y', 0)),
+                    float(lm.get('z', 0)),
+                    float(lm.get('visibility', 0))
+                ])
+            sequences.append(landmarks)
+    return np.array(sequences, dtype=np.float32)
+
+
+def loop_similarity(user_seq_norm, ref_seq_norm):
+    """The original per-frame scipy cosine loop"""
+    similarities = []
+    for i in range(min(len(user_seq_norm), len(ref_seq_norm))):
+        if np.all(np.isfinite(user_seq_norm[i])) and np.all(np.isfinite(ref_seq_norm[i])):
+            similarities.append(1 - cosine(user_seq_norm[i], ref_seq_norm[i]))
+    return np.array(similarities)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark vectorized pose similarity')
+    parser.add_argument('--frames', nargs='+', type=int, default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'frames':>8} {'extract loop':>13} {'extract vec':>12} {'extract npz':>12} "
+          f"{'sim loop':>10} {'sim vec':>10} {'speedup':>8}")
+    for num_frames in args.frames:
+        user_data = synthetic_landmarks(num_frames, seed=1)
+        ref_data = synthetic_landmarks(num_frames, seed=2)
+
+        expected_seq, extract_loop_time = timed(loop_extract, user_data)
+        user_seq, extract_vec_time = timed(extract_pose_sequence, user_data)
+        assert np.array_equal(expected_seq, user_seq), "extract_pose_sequence output changed"
+        arrays_seq, extract_npz_time = timed(extract_pose_sequence, from_dict(user_data))
+        assert np.array_equal(expected_seq, arrays_seq), "LandmarkArrays pose sequence differs"
+
+        ref_seq = loop_extract(ref_data)
+        user_norm = user_seq / (np.linalg.norm(user_seq, axis=1, keepdims=True) + 1e-7)
+        ref_norm = ref_seq / (np.linalg.norm(ref_seq, axis=1, keepdims=True) + 1e-7)
+        n = min(len(user_norm), len(ref_norm))
+
+        expected_sim, sim_loop_time = timed(loop_similarity, user_norm, ref_norm)
+        similarities, sim_vec_time = timed(rowwise_cosine_similarity, user_norm[:n], ref_norm[:n])
+        assert np.allclose(expected_sim, similarities, rtol=1e-6, atol=1e-6), "similarities changed"
+
+        speedup = (extract_loop_time + sim_loop_time) / (extract_vec_time + sim_vec_time)
+        print(f"{num_frames:>8} {extract_loop_time:>12.3f}s {extract_vec_time:>11.3f}s {extract_npz_time:>11.4f}s "
+              f"{sim_loop_time:>9.3f}s {sim_vec_time:>9.3f}s {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
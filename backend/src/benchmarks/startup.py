@@ -0,0 +1,66 @@
+"""
+Import-time profile of server startup
+
+For each startup mode, starts a fresh interpreter under `python -X importtime`
+that imports server and answers one /api/hello request, and reports the time
+to that first liveness answer and the slowest imports on the way (cumulative
+microseconds from -X importtime). Background warm-up keeps running after the
+answer; its stage timings are reported by /api/ready instead.
+
+Run from backend/src:
+    python -m benchmarks.startup [--modes background eager] [--top 15]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+CHILD = '''
+import os
+import time
+start = time.perf_counter()
+import server
+status = server.app.test_client().get('/api/hello').status_code
+print(f"LIVE {time.perf_counter() - start:.3f} {status}", flush=True)
+os._exit(0)
+'''
+
+
+def parse_importtime(stderr):
+    """(module, self us, cumulative us) for each line -X importtime wrote"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def profile(mode, top):
+    env = dict(os.environ, STARTUP_MODE=mode)
+    child = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD], env=env,
+                           capture_output=True, text=True)
+    live = [line for line in child.stdout.splitlines() if line.startswith('LIVE')]
+    if not live:
+        print(f"{mode}: server did not start\n{child.stderr[-2000:]}")
+        return
+    _, seconds, status = live[0].split()
+    imports = parse_importtime(child.stderr)
+    print(f"{mode}: /api/hello answered {status} after {float(seconds):.2f}s "
+          f"({len(imports)} modules imported before serving)")
+    for name, self_us, cumulative_us in sorted(imports, key=lambda entry: -entry[2])[:top]:
+        print(f"  {cumulative_us / 1000:>9.1f} ms cumulative {self_us / 1000:>8.1f} ms self  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile server imports up to the first liveness answer')
+    parser.add_argument('--modes', nargs='+', default=['background', 'eager'], choices=['background', 'eager'])
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports to list')
+    args = parser.parse_args()
+    for mode in args.modes:
+        profile(mode, args.top)
+
+
+if __name__ == "__main__":
+    main()
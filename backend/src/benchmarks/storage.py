@@ -0,0 +1,84 @@
+"""
+Serial vs concurrent artifact uploads
+
+Uploads the files a /api/train request produces (two processed videos, the
+results JSON and optionally the graph) to LocalStorage with a simulated
+per-upload round-trip latency and a simulated transient failure rate, first
+one after another as the endpoint used to, then all at once through the
+backend's upload pool, as run_training now queues them.
+
+Run from backend/src:
+    python -m benchmarks.storage [--latency 0.3] [--failure-rate 0.1] [--requests 5]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from artifact_storage import LocalStorage, UPLOAD_WORKERS
+
+ARTIFACTS = (
+    ('user_video.mp4', 8 * 1024 * 1024, 'video/mp4'),
+    ('reference_video.mp4', 8 * 1024 * 1024, 'video/mp4'),
+    ('comparison_results.json', 64 * 1024, 'application/json'),
+    ('similarity_graph.png', 100 * 1024, 'image/png')
+)
+
+
+class SlowStorage(LocalStorage):
+    """LocalStorage with a network-like round trip and occasional transient failures"""
+
+    def __init__(self, root, latency, failure_rate, **kwargs):
+        super().__init__(root, **kwargs)
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def _put(self, local_path, remote_path, content_type):
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise ConnectionError('simulated transient failure')
+        return super()._put(local_path, remote_path, content_type)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark serial vs concurrent artifact uploads')
+    parser.add_argument('--latency', type=float, default=0.3, help='Simulated seconds per upload round trip')
+    parser.add_argument('--failure-rate', type=float, default=0.1, help='Fraction of attempts that fail')
+    parser.add_argument('--requests', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=UPLOAD_WORKERS)
+    args = parser.parse_args()
+    random.seed(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for name, size, content_type in ARTIFACTS:
+            path = os.path.join(tmp, name)
+            with open(path, 'wb') as f:
+                f.write(os.urandom(size))
+            files.append((path, name, content_type))
+
+        results = {}
+        for mode in ('serial', 'concurrent'):
+            storage = SlowStorage(os.path.join(tmp, mode), args.latency, args.failure_rate,
+                                  workers=args.workers, backoff=0.05)
+            start = time.perf_counter()
+            for request in range(args.requests):
+                items = [(path, f'request_{request}/{name}', content_type) for path, name, content_type in files]
+                if mode == 'serial':
+                    for item in items:
+                        storage.upload(*item)
+                else:
+                    storage.upload_many(items)
+            results[mode] = ((time.perf_counter() - start) / args.requests, storage.stats())
+
+    print(f"{len(ARTIFACTS)} artifacts per request, {args.latency * 1000:.0f} ms round trip, "
+          f"{args.failure_rate:.0%} of attempts failing")
+    for mode, (seconds, stats) in results.items():
+        print(f"{mode:>10}: {seconds * 1000:7.0f} ms/request ({stats['uploads']} uploads, "
+              f"{stats['retries']} retries, {stats['failures']} failures)")
+    print(f"speedup: {results['serial'][0] / results['concurrent'][0]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
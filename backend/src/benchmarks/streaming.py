@@ -0,0 +1,80 @@
+"""
+Replay recorded landmarks through the streaming scorer, one frame at a time
+
+Each frame is timed end to end as the WebSocket endpoint handles it: parsing
+the client's landmark list, the online DTW step and scoring, and encoding
+the JSON reply. Reports latency percentiles against the 30 ms per-frame
+budget and compares the final running scores with batch
+calculate_pose_similarity on the same clips.
+
+Run from backend/src:
+    python -m benchmarks.streaming [user.npz reference.npz] [--frames 3000]
+"""
+import argparse
+import contextlib
+import io
+import json
+import time
+
+import numpy as np
+
+from benchmarks.similarity import synthetic_landmarks
+from compare_landmarks import pose_sequence_from, calculate_pose_similarity
+from streaming import StreamingReference, StreamingScorer
+
+FRAME_BUDGET_MS = 30.0
+
+
+def client_frames(seq):
+    """Frames as a client would send them: 33 [x, y, z, visibility] lists each"""
+    return [row.reshape(33, 4).tolist() for row in seq]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark streaming scoring by replaying landmark files')
+    parser.add_argument('user_landmarks', nargs='?', help='Recorded user landmarks (.npz or JSON)')
+    parser.add_argument('ref_landmarks', nargs='?', help='Reference landmarks (.npz or JSON)')
+    parser.add_argument('--frames', type=int, default=3000, help='Length of the synthetic clips')
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        if args.user_landmarks and args.ref_landmarks:
+            user_seq = pose_sequence_from(args.user_landmarks)
+            ref_seq = pose_sequence_from(args.ref_landmarks)
+        else:
+            ref_seq = pose_sequence_from(synthetic_landmarks(args.frames, seed=2))
+            # The user follows the reference at a slightly slower tempo
+            index = np.round(np.linspace(0, len(ref_seq) - 1, int(len(ref_seq) * 1.1))).astype(int)
+            user_seq = ref_seq[index] + np.random.default_rng(3).normal(scale=0.02, size=(len(index), 132))
+
+    start = time.perf_counter()
+    reference = StreamingReference(ref_seq)
+    prepare_ms = (time.perf_counter() - start) * 1000
+
+    scorer = StreamingScorer(reference)
+    latencies = []
+    for message in client_frames(user_seq):
+        start = time.perf_counter()
+        json.dumps(scorer.push(message))
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies = np.array(latencies)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        batch = calculate_pose_similarity(np.asarray(user_seq, dtype=np.float32), ref_seq)
+    running = scorer.running()
+
+    print(f"Replayed {len(user_seq)} frames against a {len(ref_seq)}-frame reference "
+          f"(reference prepared in {prepare_ms:.1f} ms)")
+    print(f"Per-frame latency: p50 {np.percentile(latencies, 50):.2f} ms, "
+          f"p95 {np.percentile(latencies, 95):.2f} ms, max {latencies.max():.2f} ms "
+          f"(budget {FRAME_BUDGET_MS:.0f} ms: {'ok' if np.percentile(latencies, 95) < FRAME_BUDGET_MS else 'EXCEEDED'})")
+    print(f"Overall similarity: streaming {running['overall_similarity']:.4f}, "
+          f"batch {batch['overall_similarity']:.4f}")
+    print(f"Timing alignment:   streaming {running['timing_alignment']:.4f}, "
+          f"batch {batch['timing_alignment']:.4f}")
+    for part, score in running['key_points_analysis'].items():
+        print(f"  {part:<6} streaming {score:.4f}, batch {batch['key_points_analysis'][part]:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Body parts scored by compare_landmarks, as landmark indices and as column
+indices into a flattened (132,) x, y, z, visibility pose row
+"""
+import numpy as np
+
+VALUES_PER_LANDMARK = 4
+
+# Landmark indices of each body part scored in key_points_analysis
+KEY_POINTS = {
+    'arms': [11, 13, 15, 12, 14, 16],  # shoulders, elbows, wrists
+    'legs': [23, 25, 27, 24, 26, 28],  # hips, knees, ankles
+    'torso': [11, 12, 23, 24],  # shoulders and hips
+    'head': [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]  # face landmarks
+}
+PART_NAMES = tuple(KEY_POINTS)
+
+# Columns of each part in a flattened pose row
+PART_COLUMNS = {
+    part: np.array([idx * VALUES_PER_LANDMARK + k for idx in indices for k in range(VALUES_PER_LANDMARK)])
+    for part, indices in KEY_POINTS.items()
+}
+
+# Every part's columns back to back (parts in PART_NAMES order) and where each
+# part starts within them, so all parts are summed in one gather and one
+# np.add.reduceat: part_sums(rows) has one column per part
+PART_GATHER = np.concatenate([PART_COLUMNS[part] for part in PART_NAMES])
+PART_STARTS = np.cumsum([0] + [len(PART_COLUMNS[part]) for part in PART_NAMES[:-1]])
+
+
+def part_sums(rows):
+    """(n, parts) sums of each part's columns of (n, 132) rows"""
+    return np.add.reduceat(rows[:, PART_GATHER], PART_STARTS, axis=1)
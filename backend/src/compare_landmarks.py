@@ -1,36 +1,52 @@
 import json
+import itertools
 import numpy as np
-from scipy.spatial.distance import cosine
-from dtaidistance import dtw
-import matplotlib.pyplot as plt
 import os
-from scipy.spatial.distance import euclidean
-from fastdtw import fastdtw
+from pose_dtw import dtw_align, subsequence_align, frame_features, window_frames
+from landmark_store import LandmarkArrays, load_landmark_arrays, is_landmark_arrays_path
+from body_parts import PART_NAMES, part_sums
+from compiled_reference import CompiledReference, is_compiled_reference_path, normalize_rows
 
-def load_landmarks(filepath):
-    """Load landmarks from JSON file with error handling and diagnostic logging"""
+DEFAULT_FPS = 30
+DEFAULT_TIMELINE_WINDOW = DEFAULT_FPS  # user video frames per part_timelines window
+DEFAULT_SERIES_POINTS = 300  # most points in similarity_series
+
+def load_landmarks(filepath, verbose=True):
+    """
+    Load landmarks with error handling and diagnostic logging
+
+    .npz files (see landmark_store) are memory mapped and returned as
+    LandmarkArrays; anything else is parsed as JSON and returned as a dict.
+    verbose=False skips the diagnostics printed to stdout.
+    """
     try:
         if not os.path.exists(filepath):
             raise FileNotFoundError(f"Landmark file not found: {filepath}")
+        
+        if is_landmark_arrays_path(filepath):
+            data = load_landmark_arrays(filepath)
+            total_frames = data.num_frames
+            frames_with_poses = data.frames_with_poses
+        else:
+            with open(filepath, 'r') as f:
+                data = json.load(f)
+                
+            # Validate data structure
+            if 'frames' not in data:
+                raise ValueError("Invalid landmark file format: 'frames' key missing")
             
-        with open(filepath, 'r') as f:
-            data = json.load(f)
-            
-        # Validate data structure
-        if 'frames' not in data:
-            raise ValueError("Invalid landmark file format: 'frames' key missing")
+            total_frames = len(data['frames'])
+            frames_with_poses = sum(1 for frame in data['frames'] if frame.get('poses'))
         
         # Add diagnostic information
-        total_frames = len(data['frames'])
-        frames_with_poses = sum(1 for frame in data['frames'] if frame.get('poses'))
-        
-        print(f"\nDiagnostic info for {os.path.basename(filepath)}:")
-        print(f"Total frames: {total_frames}")
-        print(f"Frames with poses: {frames_with_poses}")
-        print(f"Percentage of frames with poses: {(frames_with_poses/total_frames)*100:.2f}%\n")
-        
-        if frames_with_poses == 0:
-            print(f"WARNING: No poses detected in {filepath}")
+        if verbose:
+            print(f"\nDiagnostic info for {os.path.basename(filepath)}:")
+            print(f"Total frames: {total_frames}")
+            print(f"Frames with poses: {frames_with_poses}")
+            print(f"Percentage of frames with poses: {(frames_with_poses/max(total_frames, 1))*100:.2f}%\n")
+            
+            if frames_with_poses == 0:
+                print(f"WARNING: No poses detected in {filepath}")
             
         return data
         
@@ -39,176 +55,451 @@ def load_landmarks(filepath):
     except Exception as e:
         raise RuntimeError(f"Error loading landmarks: {str(e)}")
 
-def extract_pose_sequence(landmarks_data):
-    """Extract pose sequence with diagnostic logging"""
+def _pose_row(pose):
+    """Flatten one pose, zeroing any landmark with missing or non-numeric values"""
+    landmarks = []
+    for lm in pose.get('landmarks', []):
+        try:
+            landmarks.extend([
+                float(lm.get('x', 0)),
+                float(lm.get('y', 0)),
+                float(lm.get('z', 0)),
+                float(lm.get('visibility', 0))
+            ])
+        except (TypeError, ValueError):
+            # Handle invalid landmark data
+            landmarks.extend([0.0, 0.0, 0.0, 0.0])
+    return landmarks
+
+def _quiet(*args, **kwargs):
+    """Stands in for print when diagnostics are turned off"""
+
+def rowwise_cosine_similarity(a, b):
+    """
+    1 - scipy.spatial.distance.cosine for each pair of rows of a and b
+
+    Computed in float64 and clipped the same way scipy clips the distance, so
+    results match calling cosine row by row.
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    dot = np.einsum('ij,ij->i', a, b)
+    norms = np.sqrt(np.einsum('ij,ij->i', a, a) * np.einsum('ij,ij->i', b, b))
+    return cosine_from_dot(dot, norms)
+
+def cosine_from_dot(dot, norms):
+    """Cosine similarity from dot products and products of norms, clipped like rowwise_cosine_similarity"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distance = np.clip(1.0 - dot / norms, 0.0, 2.0)
+    return 1.0 - distance
+
+def windowed_means(frames, values, window, num_frames):
+    """
+    Mean of each column of values (steps, columns) over windows of `window`
+    consecutive frames, where frames gives each step's frame. Non-finite values
+    are left out; windows with nothing to average are NaN.
+    """
+    num_windows = max(1, -(-num_frames // window))
+    columns = values.shape[1]
+    finite = np.isfinite(values)
+    # One bincount over (window, column) cells
+    cells = ((frames // window)[:, None] * columns + np.arange(columns)).ravel()
+    totals = np.bincount(cells, weights=np.where(finite, values, 0.0).ravel(), minlength=num_windows * columns)
+    counts = np.bincount(cells, weights=finite.ravel(), minlength=num_windows * columns)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (totals / counts).reshape(num_windows, columns)
+
+def _compact(values):
+    """Scores rounded for the response, with None for windows that had none"""
+    return [round(float(value), 4) if np.isfinite(value) else None for value in values]
+
+def lttb(x, y, max_points):
+    """
+    Indices of at most max_points points of the series (x, y) that keep its
+    visual shape, chosen by largest-triangle-three-buckets: the first and last
+    points, plus from each of max_points - 2 equal buckets in between the
+    point forming the largest triangle with the previous pick and the mean of
+    the next bucket
+    """
+    n = len(x)
+    if n <= max_points:
+        return np.arange(n)
+    if max_points < 3:
+        return np.array([0, n - 1])[:max(max_points, 0)]
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for b in range(max_points - 2):
+        start, end = edges[b], edges[b + 1]
+        if b + 2 < len(edges):
+            next_x, next_y = x[end:edges[b + 2]].mean(), y[end:edges[b + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[b + 1] = a
+    return selected
+
+def similarity_series(frames, similarities, max_points=DEFAULT_SERIES_POINTS):
+    """Frame-by-frame similarity downsampled for plotting, as compact parallel lists"""
+    frames = np.asarray(frames)
+    similarities = np.asarray(similarities, dtype=np.float64)
+    keep = lttb(frames, similarities, max_points)
+    return {
+        'frames': frames[keep].tolist(),
+        'similarity': np.round(similarities[keep], 4).tolist(),
+        'total_frames': int(len(frames))
+    }
+
+def render_similarity_graph(comparison, output_path):
+    """
+    Plot frame-by-frame similarity to a PNG
+
+    Off the request path: callers render on demand or in the background.
+    matplotlib is imported here, and the figure is built without pyplot so
+    rendering holds no global state.
+    """
+    from matplotlib.figure import Figure
+    frames = comparison.get('frame_by_frame')
+    if frames:
+        x = [f['frame'] for f in frames]
+        y = [f['similarity'] for f in frames]
+    else:
+        series = comparison.get('similarity_series') or {'frames': [], 'similarity': []}
+        x, y = series['frames'], series['similarity']
+    figure = Figure(figsize=(12, 6))
+    axes = figure.add_subplot()
+    axes.plot(x, y)
+    axes.set_title('Frame-by-Frame Pose Similarity')
+    axes.set_xlabel('Frame')
+    axes.set_ylabel('Similarity Score')
+    axes.grid(True)
+    figure.savefig(output_path)
+    return output_path
+
+def compact_comparison(comparison):
+    """
+    The comparison for storage as JSON: frame_by_frame as parallel lists
+    rather than one dict per frame, similarities rounded to 4 places
+    """
+    compact = dict(comparison)
+    frames = comparison.get('frame_by_frame') or []
+    compact['frame_by_frame'] = {
+        'frame': [f['frame'] for f in frames],
+        'ref_frame': [f['ref_frame'] for f in frames],
+        'similarity': [round(f['similarity'], 4) for f in frames]
+    }
+    return compact
+
+def extract_pose_sequence(landmarks_data, verbose=True):
+    """Extract pose sequence with diagnostic logging (skipped with verbose=False)"""
     try:
-        sequences = []
-        for frame_idx, frame in enumerate(landmarks_data.get('frames', [])):
-            if frame.get('poses'):  # Use get() for safer access
-                pose = frame['poses'][0]
-                landmarks = []
-                for lm in pose.get('landmarks', []):
-                    try:
-                        landmarks.extend([
-                            float(lm.get('x', 0)),
-                            float(lm.get('y', 0)),
-                            float(lm.get('z', 0)),
-                            float(lm.get('visibility', 0))
-                        ])
-                    except (TypeError, ValueError):
-                        # Handle invalid landmark data
-                        landmarks.extend([0.0, 0.0, 0.0, 0.0])
-                
-                sequences.append(landmarks)
+        if isinstance(landmarks_data, LandmarkArrays):
+            sequences = landmarks_data.pose_sequence()
+        else:
+            poses = [frame['poses'][0] for frame in landmarks_data.get('frames', []) if frame.get('poses')]
+            if len({len(pose.get('landmarks', [])) for pose in poses}) > 1:
+                raise ValueError("Poses have different numbers of landmarks")
+            try:
+                # Stream every value into one flat array, then reshape to (frames, 132)
+                values = itertools.chain.from_iterable(
+                    (lm.get('x', 0), lm.get('y', 0), lm.get('z', 0), lm.get('visibility', 0))
+                    for pose in poses for lm in pose.get('landmarks', [])
+                )
+                sequences = np.fromiter(values, dtype=np.float32).reshape(len(poses), -1)
+            except (TypeError, ValueError):
+                # Handle invalid landmark data one landmark at a time
+                sequences = np.array([_pose_row(pose) for pose in poses], dtype=np.float32)
         
         # Add diagnostic information
-        print(f"Extracted sequence length: {len(sequences)}")
-        if len(sequences) == 0:
-            print("WARNING: No valid pose sequences extracted!")
+        if verbose:
+            print(f"Extracted sequence length: {len(sequences)}")
+            if len(sequences) == 0:
+                print("WARNING: No valid pose sequences extracted!")
         
-        return np.array(sequences, dtype=np.float32)
+        return sequences
         
     except Exception as e:
-        print(f"Error in sequence extraction: {str(e)}")
+        if verbose:
+            print(f"Error in sequence extraction: {str(e)}")
         return np.array([])  # Return empty array on error
 
-def calculate_pose_similarity(user_seq, ref_seq):
-    """Calculate similarity between two pose sequences with better error handling"""
+def calculate_pose_similarity(user_seq, ref_seq, dtw_window=None, visibility_weighted=False, subsequence=False,
+                              timeline_window=DEFAULT_TIMELINE_WINDOW, verbose=True, user_frames=None,
+                              ref_frames=None, ref_fps=None, dtw_window_seconds=None):
+    """
+    Calculate similarity between two pose sequences with better error handling
+
+    dtw_window: Sakoe-Chiba band (in frames) for the timing alignment; None
+        spans dtw_window_seconds (pose_dtw.DEFAULT_WINDOW_SECONDS if None) of
+        the reference at ref_fps
+    visibility_weighted: weight each joint's DTW distance by its visibility
+    subsequence: the user practised only part of the reference; find the
+        best-matching stretch of the reference (results['reference_window'])
+        and score against that stretch only
+
+    timeline_window: user video frames per entry of results['part_timelines'],
+        which holds the overall and per-part similarity of each window
+    user_frames: video frame of each row of user_seq (see pose_frames);
+        frames without a pose have no row, so frame_by_frame,
+        similarity_series and the timeline windows are given in video frames
+        rather than rows. None takes rows to be consecutive frames.
+    ref_frames, ref_fps: the same for the reference, and its frame rate, for
+        frame_by_frame's ref_frame and reference_window; a CompiledReference
+        brings its own if it was compiled with them
+
+    results['similarity_series'] is frame_by_frame downsampled to at most
+    DEFAULT_SERIES_POINTS points, small enough to return for plotting.
+
+    ref_seq may be a CompiledReference, so the reference side is not
+    prepared again for every user scored against it.
+
+    verbose=False skips the diagnostics printed to stdout; callers on the
+    request path use it rather than redirecting the process-wide stdout.
+    """
+    log = print if verbose else _quiet
     results = {
         'frame_by_frame': [],
         'overall_similarity': 0.0,
         'timing_alignment': 0.0,
-        'key_points_analysis': {}
+        'key_points_analysis': {},
+        'part_timelines': {},
+        'similarity_series': {'frames': [], 'similarity': [], 'total_frames': 0}
     }
     
     # Add diagnostic information
-    print("\nSequence Information:")
-    print(f"User sequence shape: {user_seq.shape if len(user_seq) > 0 else 'Empty'}")
-    print(f"Reference sequence shape: {ref_seq.shape if len(ref_seq) > 0 else 'Empty'}")
+    log("\nSequence Information:")
+    log(f"User sequence shape: {user_seq.shape if len(user_seq) > 0 else 'Empty'}")
+    log(f"Reference sequence shape: {ref_seq.shape if len(ref_seq) > 0 else 'Empty'}")
     
     if len(user_seq) == 0:
-        print("ERROR: User sequence is empty - no poses detected")
+        log("ERROR: User sequence is empty - no poses detected")
         results['error'] = "No poses detected in user video"
         return results
         
     if len(ref_seq) == 0:
-        print("ERROR: Reference sequence is empty - no poses detected")
+        log("ERROR: Reference sequence is empty - no poses detected")
         results['error'] = "No poses detected in reference video"
         return results
     
     # Normalize sequences to handle different scales
-    user_seq_norm = user_seq / (np.linalg.norm(user_seq, axis=1, keepdims=True) + 1e-7)
-    ref_seq_norm = ref_seq / (np.linalg.norm(ref_seq, axis=1, keepdims=True) + 1e-7)
-    
-    # Frame-by-frame similarity
-    min_frames = min(len(user_seq), len(ref_seq))
-    similarities = []
-    for i in range(min_frames):
-        if np.all(np.isfinite(user_seq_norm[i])) and np.all(np.isfinite(ref_seq_norm[i])):
-            similarity = 1 - cosine(user_seq_norm[i], ref_seq_norm[i])
-            similarities.append(similarity)
-            results['frame_by_frame'].append({
-                'frame': i,
-                'similarity': float(similarity)
-            })
-    
-    # Overall similarity (average of frame-by-frame)
-    if similarities:
-        results['overall_similarity'] = float(np.mean(similarities))
-    
-    # DTW for timing alignment
+    user_seq_norm = normalize_rows(user_seq)
+    reference = ref_seq if isinstance(ref_seq, CompiledReference) else CompiledReference.compile(ref_seq)
+    if ref_frames is None:
+        ref_frames = reference.frames if reference.frames is not None else np.arange(len(reference))
+    ref_frames = np.asarray(ref_frames, dtype=np.int64)
+    ref_fps = ref_fps or reference.meta.get('fps') or DEFAULT_FPS
+    
+    # Align once over all 33 joints; every metric below is scored along this
+    # warping path, so tempo differences don't misalign frames
     try:
-        # Use x,y,z coordinates
-        user_coords = user_seq_norm[:, :3]  # Take x,y,z from first landmark
-        ref_coords = ref_seq_norm[:, :3]
-        
-        # Calculate DTW distance using fastdtw
-        distance, _ = fastdtw(user_coords, ref_coords, dist=euclidean)
-        results['timing_alignment'] = float(1.0 / (1.0 + distance))
+        user_features = frame_features(user_seq_norm, visibility_weighted)
+        ref_features, ref_features_sq = reference.dtw_features(visibility_weighted)
+        if subsequence:
+            alignment = subsequence_align(user_features, ref_features, y_sq=ref_features_sq)
+        else:
+            if dtw_window is None:
+                dtw_window = window_frames(dtw_window_seconds, ref_fps)
+            alignment = dtw_align(user_features, ref_features, window=dtw_window, y_sq=ref_features_sq)
+        path = alignment.path
+        results['timing_alignment'] = float(1.0 / (1.0 + alignment.normalized_distance))
+        results['dtw'] = alignment.summary()
+        if subsequence:
+            # Matched rows of the reference, reported as video frames and times
+            start, end = int(ref_frames[path[0, 1]]), int(ref_frames[path[-1, 1]])
+            results['reference_window'] = {
+                'start_frame': start,
+                'end_frame': end,
+                'frames': end - start + 1,
+                'start_seconds': round(start / ref_fps, 3),
+                'end_seconds': round(end / ref_fps, 3)
+            }
         
     except Exception as e:
-        print(f"DTW calculation failed: {str(e)}")
+        log(f"DTW calculation failed: {str(e)}")
         results['timing_alignment'] = 0.0
+        # Fall back to pairing frames by index
+        min_frames = min(len(user_seq), len(ref_seq))
+        path = np.stack([np.arange(min_frames), np.arange(min_frames)], axis=1)
     
-    # Analyze key body parts
-    key_points = {
-        'arms': [11, 13, 15, 12, 14, 16],  # shoulders, elbows, wrists
-        'legs': [23, 25, 27, 24, 26, 28],  # hips, knees, ankles
-        'torso': [11, 12, 23, 24],  # shoulders and hips
-        'head': [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]  # face landmarks
-    }
+    user_frames = np.arange(len(user_seq)) if user_frames is None else np.asarray(user_frames, dtype=np.int64)
+    user_steps = np.asarray(user_seq_norm[path[:, 0]], dtype=np.float64)
+    ref_rows = path[:, 1]
+    # Products of matched values; the reference's norms are precompiled
+    products = user_steps * reference.norm[ref_rows]
+    user_squares = user_steps * user_steps
     
-    for part_name, indices in key_points.items():
-        part_indices = []
-        for idx in indices:
-            part_indices.extend([idx * 4, idx * 4 + 1, idx * 4 + 2, idx * 4 + 3])
-        
-        user_part = user_seq_norm[:, part_indices]
-        ref_part = ref_seq_norm[:, part_indices]
-        
-        # Calculate mean pose for each part
-        user_part_mean = np.nanmean(user_part, axis=0)
-        ref_part_mean = np.nanmean(ref_part, axis=0)
-        
-        # Replace NaN values with 0
-        user_part_mean = np.nan_to_num(user_part_mean)
-        ref_part_mean = np.nan_to_num(ref_part_mean)
-        
-        if np.all(np.isfinite(user_part_mean)) and np.all(np.isfinite(ref_part_mean)):
-            similarity = 1 - cosine(user_part_mean, ref_part_mean)
-            results['key_points_analysis'][part_name] = float(similarity)
-        else:
-            results['key_points_analysis'][part_name] = 0.0
+    # Frame-by-frame similarity along the path, averaged over the reference
+    # frames each user frame is matched with
+    step_similarities = cosine_from_dot(products.sum(axis=1),
+                                        np.sqrt(user_squares.sum(axis=1)) * reference.norms[ref_rows])
+    valid = np.isfinite(step_similarities)
+    user_rows = path[valid, 0]
+    counts = np.bincount(user_rows, minlength=len(user_seq))
+    totals = np.bincount(user_rows, weights=step_similarities[valid], minlength=len(user_seq))
+    first_match = np.full(len(user_seq), -1)
+    first_match[path[::-1, 0]] = path[::-1, 1]
+    matched = np.flatnonzero(counts)
+    frame_similarities = totals[matched] / counts[matched]
+    # Reported against the user's video frames, which skip frames without a pose
+    results['frame_by_frame'] = [
+        {'frame': int(user_frames[i]), 'ref_frame': int(ref_frames[first_match[i]]), 'similarity': float(similarity)}
+        for i, similarity in zip(matched, frame_similarities)
+    ]
+    results['similarity_series'] = similarity_series(user_frames[matched], frame_similarities)
+    
+    # Overall similarity (average over the whole path, so neither clip's tail is dropped)
+    if valid.any():
+        results['overall_similarity'] = float(np.mean(step_similarities[valid]))
+    
+    # Analyze key body parts: similarity of every part at every aligned pair
+    # of frames, all parts in one pass over the static gather tables
+    part_norms = np.sqrt(part_sums(user_squares)) * reference.part_norms[ref_rows]
+    part_similarities = cosine_from_dot(part_sums(products), part_norms)
+    finite = np.isfinite(part_similarities)
+    part_totals = np.where(finite, part_similarities, 0.0).sum(axis=0)
+    part_counts = finite.sum(axis=0)
+    for p, part_name in enumerate(PART_NAMES):
+        results['key_points_analysis'][part_name] = float(part_totals[p] / part_counts[p]) if part_counts[p] else 0.0
+    
+    # The same scores over consecutive windows of the user's video frames
+    window = max(1, int(timeline_window))
+    timelines = windowed_means(user_frames[path[:, 0]], np.column_stack([step_similarities, part_similarities]),
+                               window, int(user_frames[-1]) + 1)
+    results['part_timelines'] = {'window_frames': window, 'overall': _compact(timelines[:, 0])}
+    for p, part_name in enumerate(PART_NAMES):
+        results['part_timelines'][part_name] = _compact(timelines[:, p + 1])
     
     return results
 
-def compare_videos(user_landmarks_path, ref_landmarks_path, output_dir=None):
-    """Compare landmarks between user and reference videos"""
-    # Load landmarks
-    user_data = load_landmarks(user_landmarks_path)
-    ref_data = load_landmarks(ref_landmarks_path)
-    
-    # Extract pose sequences
-    user_seq = extract_pose_sequence(user_data)
-    ref_seq = extract_pose_sequence(ref_data)
+def pose_frames(landmarks, seq):
+    """
+    Video frame of each row of seq, the pose sequence extracted from landmarks
+
+    Frames without a pose have no row in the sequence; rows of an already
+    extracted sequence are taken to be consecutive frames.
+    """
+    if isinstance(landmarks, LandmarkArrays) and landmarks.present.shape[1]:
+        frames = np.flatnonzero(landmarks.present[:, 0])
+    elif isinstance(landmarks, CompiledReference) and landmarks.frames is not None:
+        frames = np.asarray(landmarks.frames, dtype=np.int64)
+    elif isinstance(landmarks, dict):
+        frames = np.array([frame.get('frame_id', i) for i, frame in enumerate(landmarks.get('frames', []))
+                           if frame.get('poses')], dtype=np.int64)
+    else:
+        frames = np.arange(len(seq))
+    if len(frames) != len(seq):
+        frames = np.arange(len(seq))  # Extraction failed; seq is empty
+    return frames
+
+def pose_sequence_from(landmarks, verbose=True, with_frames=False):
+    """
+    Pose sequence for any landmark source compare_videos accepts: a landmark
+    file path, a landmarks dict as returned by process_video, LandmarkArrays,
+    or an already extracted (frames, 132) pose sequence
+
+    A CompiledReference, or the path of a saved one, is returned as such;
+    calculate_pose_similarity accepts it as the reference. verbose is passed
+    on to load_landmarks and extract_pose_sequence. with_frames returns
+    (sequence, pose_frames) instead.
+    """
+    if isinstance(landmarks, (str, os.PathLike)) and is_compiled_reference_path(landmarks):
+        landmarks = CompiledReference.load(landmarks)
+    elif isinstance(landmarks, (str, os.PathLike)):
+        landmarks = load_landmarks(landmarks, verbose)
+    if isinstance(landmarks, (np.ndarray, CompiledReference)):
+        seq = landmarks
+    else:
+        seq = extract_pose_sequence(landmarks, verbose)
+    return (seq, pose_frames(landmarks, seq)) if with_frames else seq
+
+def landmarks_fps(landmarks):
+    """Frame rate recorded with a landmarks dict, LandmarkArrays or CompiledReference, DEFAULT_FPS if unknown"""
+    if isinstance(landmarks, (LandmarkArrays, CompiledReference)):
+        landmarks = landmarks.meta
+    if isinstance(landmarks, dict):
+        return landmarks.get('fps') or DEFAULT_FPS
+    return DEFAULT_FPS
+
+def compare_videos(user_landmarks, ref_landmarks, output_dir=None, dtw_window=None, visibility_weighted=False,
+                   subsequence=False, timeline_seconds=1.0, render_graph=False, dtw_window_seconds=None):
+    """
+    Compare landmarks between user and reference videos
+
+    Both sides may be file paths or in-memory landmarks (see pose_sequence_from),
+    so callers that just ran process_video can skip the disk round-trip.
+    part_timelines windows span timeline_seconds of the user's video, frames
+    without a pose included. The DTW band is dtw_window frames if given,
+    otherwise dtw_window_seconds of the reference video.
+
+    With output_dir, the compact comparison (see compact_comparison) is saved
+    there as comparison_results.json, and with render_graph also the
+    similarity_graph.png plot.
+    """
+    # Load landmarks and extract pose sequences
+    if isinstance(user_landmarks, (str, os.PathLike)):
+        user_landmarks = load_landmarks(user_landmarks)
+    user_seq, user_frames = pose_sequence_from(user_landmarks, with_frames=True)
+    if isinstance(ref_landmarks, (str, os.PathLike)) and is_compiled_reference_path(ref_landmarks):
+        ref_landmarks = CompiledReference.load(ref_landmarks)
+    elif isinstance(ref_landmarks, (str, os.PathLike)):
+        ref_landmarks = load_landmarks(ref_landmarks)
+    ref_seq, ref_frames = pose_sequence_from(ref_landmarks, with_frames=True)
     
     # Calculate similarity
-    comparison = calculate_pose_similarity(user_seq, ref_seq)
+    timeline_window = max(1, int(round(landmarks_fps(user_landmarks) * timeline_seconds)))
+    comparison = calculate_pose_similarity(user_seq, ref_seq, dtw_window, visibility_weighted, subsequence,
+                                           timeline_window, user_frames=user_frames, ref_frames=ref_frames,
+                                           ref_fps=landmarks_fps(ref_landmarks), dtw_window_seconds=dtw_window_seconds)
+    comparison['part_timelines']['window_seconds'] = timeline_seconds
     
-    # Generate visualization if output directory is provided
+    # Save results (and the plot, if asked for) if output directory is provided
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
         
         # Plot frame-by-frame similarity
-        plt.figure(figsize=(12, 6))
-        plt.plot([f['similarity'] for f in comparison['frame_by_frame']])
-        plt.title('Frame-by-Frame Pose Similarity')
-        plt.xlabel('Frame')
-        plt.ylabel('Similarity Score')
-        plt.grid(True)
-        plt.savefig(os.path.join(output_dir, 'similarity_graph.png'))
-        plt.close()
+        if render_graph:
+            render_similarity_graph(comparison, os.path.join(output_dir, 'similarity_graph.png'))
         
         # Save detailed results
         with open(os.path.join(output_dir, 'comparison_results.json'), 'w') as f:
-            json.dump(comparison, f, indent=2)
+            json.dump(compact_comparison(comparison), f, separators=(',', ':'))
     
     return comparison
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description='Compare pose landmarks between two videos')
-    parser.add_argument('user_landmarks', help='Path to user video landmarks JSON')
-    parser.add_argument('ref_landmarks', help='Path to reference video landmarks JSON')
+    parser.add_argument('user_landmarks', help='Path to user video landmarks (.npz or JSON)')
+    parser.add_argument('ref_landmarks', help='Path to reference video landmarks (.npz, JSON or compiled .ref.npz)')
     parser.add_argument('--output', help='Output directory for visualizations')
+    parser.add_argument('--dtw-window', type=int, help='Sakoe-Chiba band for DTW alignment, in frames')
+    parser.add_argument('--dtw-window-seconds', type=float,
+                        help='Sakoe-Chiba band for DTW alignment, in seconds (used without --dtw-window)')
+    parser.add_argument('--visibility-weighted', action='store_true',
+                        help='Weight joints by visibility when aligning')
+    parser.add_argument('--subsequence', action='store_true',
+                        help='Score against the best-matching section of the reference only')
+    parser.add_argument('--timeline-window', type=float, default=1.0,
+                        help='Seconds per window of the per-part timelines')
     args = parser.parse_args()
     
-    results = compare_videos(args.user_landmarks, args.ref_landmarks, args.output)
+    results = compare_videos(args.user_landmarks, args.ref_landmarks, args.output,
+                             dtw_window=args.dtw_window, visibility_weighted=args.visibility_weighted,
+                             subsequence=args.subsequence, timeline_seconds=args.timeline_window,
+                             render_graph=bool(args.output), dtw_window_seconds=args.dtw_window_seconds)
     
     print("\nComparison Results:")
     print("==================")
     print(f"Overall Similarity: {results['overall_similarity']:.2%}")
     print(f"Timing Alignment: {results['timing_alignment']:.2%}")
+    if 'reference_window' in results:
+        window = results['reference_window']
+        print(f"Matched reference frames {window['start_frame']}-{window['end_frame']} "
+              f"({window['start_seconds']:.2f}s-{window['end_seconds']:.2f}s)")
     print("\nKey Points Analysis:")
     for part, score in results['key_points_analysis'].items():
         print(f"- {part.title()}: {score:.2%}")
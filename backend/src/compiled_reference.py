@@ -0,0 +1,162 @@
+"""
+Reference side of pose scoring, prepared once and reused for every attempt
+
+calculate_pose_similarity needs the same things from a reference on every
+call: its normalized pose rows, their DTW features, and the length of each
+row and of each body part's slice of it. A CompiledReference holds all of
+them, so scoring a user against it only does work on the user side.
+
+Saved as an uncompressed .npz (like landmark_store files) so that loading
+memory maps the arrays, and worker processes scoring the same reference share
+its pages:
+    norm         float32 (frames, 132)         normalized x, y, z, visibility rows
+    features     float64 (frames, 99)          pose_dtw.frame_features of norm
+    features_sq  float64 (frames,)             squared length of each feature row
+    norms        float64 (frames,)             length of each normalized row
+    part_norms   float64 (frames, parts)       length of each body part's columns,
+                                               in body_parts.PART_NAMES order
+    frames       int64   (frames,)             optional, video frame of each row
+                                               (frames without a pose have no row)
+    meta         0-d str                       JSON: format version, parts,
+                                               visibility_weighted, source, fps
+
+Run from backend/src:
+    python compiled_reference.py reference.npz [reference.ref.npz] [--visibility-weighted]
+"""
+import json
+
+import numpy as np
+
+from body_parts import PART_NAMES, part_sums
+from landmark_store import load_npz
+from pose_dtw import frame_features
+
+COMPILED_REFERENCE_SUFFIX = '.ref.npz'
+FORMAT_VERSION = 1
+
+
+def normalize_rows(seq):
+    """Pose rows scaled to unit length, as calculate_pose_similarity compares them"""
+    return seq / (np.linalg.norm(seq, axis=1, keepdims=True) + 1e-7)
+
+
+def _row_norms(rows):
+    rows = np.asarray(rows, dtype=np.float64)
+    return np.sqrt(np.einsum('ij,ij->i', rows, rows))
+
+
+class CompiledReference:
+    """Precomputed reference arrays (see module docstring for the layout)"""
+
+    def __init__(self, norm, features, features_sq, norms, part_norms, meta=None, frames=None):
+        self.norm = norm
+        self.features = features
+        self.features_sq = features_sq
+        self.norms = norms
+        self.part_norms = part_norms
+        self.meta = meta or {}
+        self.frames = frames
+
+    @classmethod
+    def compile(cls, ref_seq, visibility_weighted=False, source=None, frames=None, fps=None):
+        """
+        Compile a (frames, 132) reference pose sequence
+
+        frames optionally gives the video frame of each row and fps the
+        video's frame rate, so matches can be reported in video frames.
+        """
+        norm = normalize_rows(np.asarray(ref_seq))
+        features = frame_features(norm, visibility_weighted)
+        squares = np.asarray(norm, dtype=np.float64) ** 2
+        part_norms = np.sqrt(part_sums(squares)) if len(norm) else np.zeros((0, len(PART_NAMES)))
+        meta = {
+            'version': FORMAT_VERSION,
+            'parts': list(PART_NAMES),
+            'visibility_weighted': bool(visibility_weighted)
+        }
+        if source is not None:
+            meta['source'] = str(source)
+        if fps is not None:
+            meta['fps'] = fps
+        if frames is not None:
+            frames = np.asarray(frames, dtype=np.int64)
+        return cls(norm, features, np.einsum('ij,ij->i', features, features), _row_norms(norm), part_norms, meta,
+                   frames)
+
+    @property
+    def visibility_weighted(self):
+        return self.meta.get('visibility_weighted', False)
+
+    @property
+    def shape(self):
+        return self.norm.shape
+
+    def __len__(self):
+        return len(self.norm)
+
+    def dtw_features(self, visibility_weighted=False):
+        """(features, squared norms) for DTW, recomputed only if compiled with the other weighting"""
+        if visibility_weighted == self.visibility_weighted:
+            return self.features, self.features_sq
+        features = frame_features(self.norm, visibility_weighted)
+        return features, np.einsum('ij,ij->i', features, features)
+
+    def save(self, path):
+        """Write the compiled reference to an uncompressed .npz file"""
+        members = {
+            'norm': np.ascontiguousarray(self.norm),
+            'features': np.ascontiguousarray(self.features, dtype=np.float64),
+            'features_sq': np.ascontiguousarray(self.features_sq, dtype=np.float64),
+            'norms': np.ascontiguousarray(self.norms, dtype=np.float64),
+            'part_norms': np.ascontiguousarray(self.part_norms, dtype=np.float64),
+            'meta': np.array(json.dumps(self.meta))
+        }
+        if self.frames is not None:
+            members['frames'] = np.ascontiguousarray(self.frames, dtype=np.int64)
+        # np.savez appends .npz to names without it; write through a file object instead
+        with open(path, 'wb') as f:
+            np.savez(f, **members)
+        return path
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a compiled reference; arrays are memory mapped unless mmap=False"""
+        arrays = load_npz(path, mmap)
+        meta = json.loads(str(arrays['meta']))
+        if meta.get('version') != FORMAT_VERSION or tuple(meta.get('parts', ())) != PART_NAMES:
+            raise ValueError(f"Compiled reference {path} is out of date; compile it again")
+        return cls(arrays['norm'], arrays['features'], arrays['features_sq'], arrays['norms'],
+                   arrays['part_norms'], meta, arrays.get('frames'))
+
+
+def is_compiled_reference_path(path):
+    return str(path).endswith(COMPILED_REFERENCE_SUFFIX)
+
+
+def compile_reference_file(landmarks_path, output_path=None, visibility_weighted=False):
+    """Compile a reference landmark file (.npz or JSON) and save it next to it by default"""
+    from compare_landmarks import load_landmarks, pose_sequence_from, landmarks_fps
+    landmarks = load_landmarks(landmarks_path)
+    ref_seq, frames = pose_sequence_from(landmarks, with_frames=True)
+    if len(ref_seq) == 0:
+        raise ValueError(f"No poses found in reference {landmarks_path}")
+    if output_path is None:
+        base = str(landmarks_path)
+        for extension in ('.npz', '.json'):
+            if base.endswith(extension):
+                base = base[:-len(extension)]
+        output_path = base + COMPILED_REFERENCE_SUFFIX
+    CompiledReference.compile(ref_seq, visibility_weighted, source=landmarks_path, frames=frames,
+                              fps=landmarks_fps(landmarks)).save(output_path)
+    return output_path
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Precompile a reference for repeated scoring')
+    parser.add_argument('landmarks', help='Reference landmarks (.npz or JSON)')
+    parser.add_argument('output', nargs='?', help=f'Output path (default: <landmarks>{COMPILED_REFERENCE_SUFFIX})')
+    parser.add_argument('--visibility-weighted', action='store_true',
+                        help='Store visibility-weighted DTW features')
+    args = parser.parse_args()
+    print(f"Compiled reference written to {compile_reference_file(args.landmarks, args.output, args.visibility_weighted)}")
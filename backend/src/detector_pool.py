@@ -0,0 +1,228 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from mediapipe.tasks import python
+from mediapipe.tasks.python import vision
+
+MODEL_ASSET_PATH = os.environ.get('POSE_MODEL_PATH', 'pose_landmarker_lite.task')
+DEFAULT_POOL_SIZE = int(os.environ.get('POSE_DETECTOR_POOL_SIZE', '2'))
+
+RUNNING_MODE_IMAGE = 'image'
+RUNNING_MODE_VIDEO = 'video'
+_RUNNING_MODES = {
+    RUNNING_MODE_IMAGE: vision.RunningMode.IMAGE,
+    RUNNING_MODE_VIDEO: vision.RunningMode.VIDEO,
+}
+
+# Detection profiles: 'scoring' requests only what compare_landmarks consumes
+# (first pose, no masks); 'full' keeps every pose and the segmentation masks
+# for debugging.
+PROFILE_SCORING = 'scoring'
+PROFILE_FULL = 'full'
+DETECTION_PROFILES = {
+    PROFILE_SCORING: {'num_poses': 1, 'output_segmentation_masks': False},
+    PROFILE_FULL: {'num_poses': 5, 'output_segmentation_masks': True},
+}
+
+
+class PooledDetector:
+    """
+    PoseLandmarker wrapper that hides the IMAGE/VIDEO mode difference
+
+    In VIDEO mode MediaPipe requires timestamps to increase monotonically over
+    the lifetime of the landmarker, so each new stream is shifted past the last
+    timestamp the detector has seen. That lets a pooled detector be reused for
+    any number of videos.
+    """
+
+    def __init__(self, landmarker, running_mode, profile):
+        self.landmarker = landmarker
+        self.running_mode = running_mode
+        self.profile = profile
+        self._stream_offset_ms = 0
+        self._last_timestamp_ms = -1
+
+    def begin_stream(self):
+        """Start a new video; its timestamps restart from 0"""
+        self._stream_offset_ms = self._last_timestamp_ms + 1
+
+    def detect(self, mp_image, timestamp_ms=0):
+        if self.running_mode == RUNNING_MODE_IMAGE:
+            return self.landmarker.detect(mp_image)
+        timestamp_ms = max(self._stream_offset_ms + int(timestamp_ms), self._last_timestamp_ms + 1)
+        self._last_timestamp_ms = timestamp_ms
+        return self.landmarker.detect_for_video(mp_image, timestamp_ms)
+
+    def close(self):
+        self.landmarker.close()
+
+
+def create_detector(running_mode=RUNNING_MODE_IMAGE, profile=PROFILE_SCORING):
+    """Build a PoseLandmarker with the settings used by process_video"""
+    if running_mode not in _RUNNING_MODES:
+        raise ValueError(f"Unknown running mode: {running_mode}")
+    if profile not in DETECTION_PROFILES:
+        raise ValueError(f"Unknown detection profile: {profile}")
+    base_options = python.BaseOptions(model_asset_path=MODEL_ASSET_PATH)
+    options = vision.PoseLandmarkerOptions(
+        base_options=base_options,
+        running_mode=_RUNNING_MODES[running_mode],
+        min_pose_detection_confidence=0.5,
+        min_pose_presence_confidence=0.5,
+        min_tracking_confidence=0.5,
+        **DETECTION_PROFILES[profile]
+    )
+    return PooledDetector(vision.PoseLandmarker.create_from_options(options), running_mode, profile)
+
+
+class DetectorPool:
+    """
+    Process-wide pool of warm PoseLandmarker instances
+
+    Detectors are built once (see warm()) and checked out per job. If the pool
+    is empty a fresh detector is built and counted as a miss; it is kept on
+    return as long as the pool is below its configured size.
+    """
+
+    def __init__(self, running_mode=RUNNING_MODE_IMAGE, profile=PROFILE_SCORING,
+                 size=DEFAULT_POOL_SIZE, factory=create_detector):
+        self.running_mode = running_mode
+        self.profile = profile
+        self.size = max(1, int(size))
+        self._factory = lambda: factory(running_mode, profile)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self.hits = 0
+        self.misses = 0
+        self.warmup_seconds = None
+
+    def warm(self):
+        """Fill the pool up to its configured size and record how long it took"""
+        start = time.perf_counter()
+        with self._lock:
+            missing = self.size - self._created
+            self._created += max(0, missing)
+        for _ in range(max(0, missing)):
+            self._idle.put(self._factory())
+        self.warmup_seconds = time.perf_counter() - start
+        return self.warmup_seconds
+
+    def acquire(self):
+        try:
+            detector = self._idle.get_nowait()
+            with self._lock:
+                self.hits += 1
+            return detector
+        except queue.Empty:
+            with self._lock:
+                self.misses += 1
+                self._created += 1
+            return self._factory()
+
+    def release(self, detector):
+        if self._idle.qsize() < self.size:
+            self._idle.put(detector)
+            return
+        with self._lock:
+            self._created -= 1
+        detector.close()
+
+    @contextmanager
+    def checkout(self):
+        """Context manager yielding a detector that is returned to the pool afterwards"""
+        detector = self.acquire()
+        try:
+            yield detector
+        finally:
+            self.release(detector)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running_mode': self.running_mode,
+                'profile': self.profile,
+                'size': self.size,
+                'idle': self._idle.qsize(),
+                'created': self._created,
+                'hits': self.hits,
+                'misses': self.misses,
+                'warmup_seconds': self.warmup_seconds
+            }
+
+    def close(self):
+        while True:
+            try:
+                detector = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+            detector.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_detector_pool(running_mode=RUNNING_MODE_IMAGE, profile=PROFILE_SCORING):
+    """Return the process-wide detector pool for a running mode and profile, creating it on first use"""
+    key = (running_mode, profile)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = DetectorPool(running_mode, profile)
+        return _pools[key]
+
+
+def all_pool_stats():
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {f'{pool.running_mode}/{pool.profile}': pool.stats() for pool in pools}
+
+
+def worker_pool_report():
+    """This process's pool stats tagged with its pid, for a worker task to return with its result"""
+    return {'pid': os.getpid(), 'pools': all_pool_stats()}
+
+
+class WorkerPoolStats:
+    """
+    Detector pool stats of worker processes, as each last reported them
+
+    Worker pools live in other processes, so the server can't read them with
+    all_pool_stats(): worker tasks return worker_pool_report() alongside their
+    result and the server records it here. Reports from the recording process
+    itself (workers run as threads) are skipped, as all_pool_stats() has them.
+    """
+
+    def __init__(self):
+        self._reports = {}
+        self._lock = threading.Lock()
+
+    def record(self, report):
+        if report['pid'] == os.getpid():
+            return
+        with self._lock:
+            self._reports[report['pid']] = report['pools']
+
+    def report(self):
+        """Per-worker pool stats plus totals for each pool over all workers"""
+        with self._lock:
+            reports = dict(self._reports)
+        totals = {}
+        for pools in reports.values():
+            for name, stats in pools.items():
+                total = totals.setdefault(name, {'workers': 0, 'size': 0, 'idle': 0, 'created': 0,
+                                                 'hits': 0, 'misses': 0, 'warmup_seconds': None})
+                total['workers'] += 1
+                for key in ('size', 'idle', 'created', 'hits', 'misses'):
+                    total[key] += stats[key]
+                if stats['warmup_seconds'] is not None:
+                    total['warmup_seconds'] = max(total['warmup_seconds'] or 0.0, stats['warmup_seconds'])
+        return {
+            'workers': {str(pid): pools for pid, pools in sorted(reports.items())},
+            'totals': totals
+        }
@@ -0,0 +1,103 @@
+import base64
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get('DOWNLOAD_CHUNK_SIZE', str(1024 * 1024)))
+DOWNLOAD_WORKERS = int(os.environ.get('DOWNLOAD_WORKERS', '4'))
+DOWNLOAD_TIMEOUT = float(os.environ.get('DOWNLOAD_TIMEOUT', '60'))
+
+
+class Download:
+    """A finished download: where it went, how big it was and its content hash"""
+
+    def __init__(self, path, size, sha256, seconds):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.seconds = seconds
+
+
+_session = None
+_session_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix='download')
+
+
+def http_session():
+    """
+    Shared requests session, so repeated downloads from the same storage host
+    reuse keep-alive connections instead of paying for a new TLS handshake
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504),
+                            allowed_methods=('GET',))
+            adapter = HTTPAdapter(pool_connections=DOWNLOAD_WORKERS, pool_maxsize=DOWNLOAD_WORKERS,
+                                  max_retries=retries)
+            _session = requests.Session()
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+def _expected_md5(headers):
+    """MD5 digest advertised by Google Cloud Storage (x-goog-hash: crc32c=...,md5=...), if any"""
+    for part in headers.get('x-goog-hash', '').split(','):
+        name, _, value = part.strip().partition('=')
+        if name == 'md5' and value:
+            return base64.b64decode(value)
+    return None
+
+
+def download_video(url, output_path, expected_sha256=None, chunk_size=DOWNLOAD_CHUNK_SIZE, session=None):
+    """
+    Download video from URL to local path
+
+    The body is streamed to disk in chunk_size pieces and hashed on the way.
+    The download is rejected (ValueError) if it is shorter than the advertised
+    Content-Length, if its MD5 differs from the storage server's x-goog-hash,
+    or if its SHA-256 differs from expected_sha256.
+
+    Returns a Download; its sha256 lets callers (e.g. the landmark cache)
+    skip hashing the file again.
+    """
+    start = time.perf_counter()
+    session = session or http_session()
+    sha256 = hashlib.sha256()
+    with session.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        expected_md5 = _expected_md5(response.headers)
+        # Content-Encoding would make the advertised length and hash refer to the encoded bytes
+        encoded = response.headers.get('Content-Encoding', 'identity') != 'identity'
+        md5 = hashlib.md5() if expected_md5 is not None and not encoded else None
+
+        size = 0
+        with open(output_path, 'wb', buffering=chunk_size) as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+                sha256.update(chunk)
+                if md5 is not None:
+                    md5.update(chunk)
+                size += len(chunk)
+
+        content_length = response.headers.get('Content-Length')
+        if content_length is not None and not encoded and size != int(content_length):
+            raise ValueError(f"Incomplete download of {url}: got {size} of {content_length} bytes")
+    if md5 is not None and md5.digest() != expected_md5:
+        raise ValueError(f"Checksum mismatch for {url}: MD5 differs from the storage server's")
+    digest = sha256.hexdigest()
+    if expected_sha256 and digest != expected_sha256.lower():
+        raise ValueError(f"Checksum mismatch for {url}: expected SHA-256 {expected_sha256}, got {digest}")
+    return Download(output_path, size, digest, time.perf_counter() - start)
+
+
+def download_in_background(url, output_path, expected_sha256=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """Start download_video on the shared download threads and return its Future"""
+    return _executor.submit(download_video, url, output_path, expected_sha256, chunk_size)
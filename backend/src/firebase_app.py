@@ -0,0 +1,43 @@
+import os
+import logging
+import firebase_admin
+from firebase_admin import credentials, storage
+
+logger = logging.getLogger(__name__)
+
+SERVICE_ACCOUNT_PATH = os.path.join(os.path.dirname(__file__), 'serviceAccountKey.json')
+
+def init_firebase(check_connection=True):
+    """
+    Initialize the Firebase Admin SDK (once per process) and return the storage bucket
+    
+    Used by the Flask server and by job worker processes, which each need their
+    own Firebase app.
+    """
+    try:
+        if not firebase_admin._apps:
+            if not os.path.exists(SERVICE_ACCOUNT_PATH):
+                raise FileNotFoundError(f"Firebase credentials file not found at {SERVICE_ACCOUNT_PATH}")
+            
+            cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
+            firebase_admin.initialize_app(cred, {
+                'storageBucket': 'motionmaster-fa7ea.firebasestorage.app',  # Updated bucket name
+                'databaseURL': 'https://motionmaster-fa7ea.firebaseio.com'
+            })
+        bucket = storage.bucket()
+        logger.info("Firebase initialized successfully")
+        
+        # Test bucket connection
+        if check_connection:
+            try:
+                bucket.exists()
+                logger.info("Successfully connected to Firebase Storage bucket")
+            except Exception as e:
+                logger.error(f"Failed to connect to Firebase Storage bucket: {str(e)}")
+                raise
+        
+        return bucket
+    
+    except Exception as e:
+        logger.error(f"Failed to initialize Firebase: {str(e)}")
+        raise
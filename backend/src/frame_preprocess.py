@@ -0,0 +1,89 @@
+"""
+Decode-side frame preparation for pose detection
+
+FramePreprocessor reads each frame into a recycled buffer, crops it to the
+bbox as a view, scales the crop down so its longer side is at most
+DETECTION_MAX_SIDE pixels (the landmarker works on a much smaller input
+anyway), and converts only that small image to RGB, into another recycled
+buffer. No per-frame arrays are allocated once the rings are full.
+"""
+import os
+
+import cv2
+import numpy as np
+
+DETECTION_MAX_SIDE = int(os.environ.get('DETECTION_MAX_SIDE', '640'))
+
+
+class BufferRing:
+    """
+    Fixed set of reusable arrays handed out round-robin
+
+    count must exceed the number of buffers that can still be in use when
+    one is handed out again (see pipeline.max_in_flight).
+    """
+
+    def __init__(self, count):
+        self.count = max(1, int(count))
+        self._buffers = []
+        self._next = 0
+
+    def next(self, shape, dtype=np.uint8):
+        if len(self._buffers) < self.count:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers.append(buffer)
+            return buffer
+        buffer = self._buffers[self._next]
+        if buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = self._buffers[self._next] = np.empty(shape, dtype=dtype)
+        self._next = (self._next + 1) % self.count
+        return buffer
+
+
+def detection_size(width, height, max_side=DETECTION_MAX_SIDE):
+    """(width, height) to run detection at: scaled down to fit max_side, never up"""
+    scale = min(1.0, max_side / max(width, height)) if max_side else 1.0
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+
+class FramePreprocessor:
+    """
+    Turns decoded frames into RGB images ready for the landmarker
+
+    crop: (x, y, width, height) region of the frame to keep
+    frame_size: (width, height) of the decoded frames
+    ring_size: frames that may be in flight downstream at once
+    max_side: longest side of the detection image (0 keeps the crop size)
+    """
+
+    def __init__(self, crop, frame_size, ring_size, max_side=DETECTION_MAX_SIDE):
+        self.x, self.y, self.width, self.height = crop
+        self.frame_width, self.frame_height = frame_size
+        self.detection_width, self.detection_height = detection_size(self.width, self.height, max_side)
+        self.scaled = (self.detection_width, self.detection_height) != (self.width, self.height)
+        self._frames = BufferRing(ring_size)
+        self._scaled = BufferRing(ring_size)
+        self._rgb = BufferRing(ring_size)
+
+    def read(self, cap):
+        """
+        Decode the next frame
+
+        Returns (ok, rgb, crop): rgb is the detection image and crop a BGR view
+        of the full-resolution crop (for drawing on). Both stay valid until
+        ring_size more frames have been read.
+        """
+        frame = self._frames.next((self.frame_height, self.frame_width, 3))
+        ok, frame = cap.read(frame)
+        if not ok:
+            return False, None, None
+        crop = frame[self.y:self.y + self.height, self.x:self.x + self.width]
+        if self.scaled:
+            # Shrink first so the colour conversion only touches the small image
+            small = cv2.resize(crop, (self.detection_width, self.detection_height),
+                               dst=self._scaled.next((self.detection_height, self.detection_width, 3)),
+                               interpolation=cv2.INTER_AREA)
+        else:
+            small = crop
+        rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=self._rgb.next(small.shape))
+        return True, rgb, crop
@@ -0,0 +1,141 @@
+"""
+Frame sampling for pose detection on high frame rate videos
+
+FrameSampler decides which decoded frames go through the landmarker: every
+stride-th frame for a target detection rate, optionally dropping to denser
+sampling while the pose is moving quickly. fill_skipped_frames then gives the
+frames in between interpolated landmarks, so the landmarks keep one entry per
+video frame and extract_pose_sequence still sees a uniform timeline.
+"""
+import numpy as np
+
+from landmark_store import LANDMARK_VALUES
+
+# Mean joint displacement (world landmarks, metres per frame) above which
+# adaptive sampling starts to detect more densely than the target rate
+DEFAULT_MOTION_THRESHOLD = 0.01
+
+
+class FrameSampler:
+    """
+    Chooses the frames to run detection on
+
+    target_fps: detection rate to aim for (None detects every frame)
+    adaptive: shorten the stride, down to every frame, in proportion to how
+        fast the pose moved between the last two detections
+
+    In process_video, take() runs in the decode thread and observe() in the
+    inference thread, so a stride change only applies to frames decoded after
+    the detection that caused it: up to queue_depth + 1 pipeline items later
+    (sampled frames when only landmarks are recorded, every frame when
+    rendering). benchmarks/frame_sampling.py replays sampling with that lag.
+    """
+
+    def __init__(self, fps, target_fps=None, adaptive=False, motion_threshold=DEFAULT_MOTION_THRESHOLD):
+        self.fps = fps
+        self.target_fps = target_fps
+        self.adaptive = adaptive
+        self.motion_threshold = motion_threshold
+        self.base_stride = max(1, int(round(fps / target_fps))) if target_fps else 1
+        self.stride = self.base_stride
+        self.detected = 0
+        self._next = 0
+        self._last = None  # (frame id, (33, 3) coordinates) of the last detected pose
+
+    @property
+    def active(self):
+        """Whether any frames may be skipped"""
+        return self.base_stride > 1
+
+    def take(self, frame_id):
+        """True if frame_id should be run through the landmarker"""
+        if frame_id < self._next:
+            return False
+        self._next = frame_id + self.stride
+        return True
+
+    def observe(self, frame_id, poses):
+        """Record the poses detected on a sampled frame (frame_landmarks output)"""
+        # Counted here rather than in take(), which also sees the index past the last frame
+        self.detected += 1
+        if not self.adaptive or not poses:
+            return
+        coords = np.array([[lm['x'], lm['y'], lm['z']] for lm in poses[0]['landmarks']], dtype=np.float64)
+        if self._last is not None and self._last[1].shape == coords.shape:
+            last_frame, last_coords = self._last
+            motion = np.linalg.norm(coords - last_coords, axis=1).mean() / max(frame_id - last_frame, 1)
+            # Fast movement gets a proportionally shorter stride
+            stride = int(self.base_stride * self.motion_threshold / max(motion, 1e-9))
+            self.stride = min(max(stride, 1), self.base_stride)
+        self._last = (frame_id, coords)
+
+    def summary(self, total_frames):
+        return {
+            'target_fps': self.target_fps,
+            'adaptive': self.adaptive,
+            'detected_frames': self.detected,
+            'total_frames': total_frames
+        }
+
+
+def _pose_array(pose):
+    return np.array([[lm.get(key, 0) or 0 for key in LANDMARK_VALUES] for lm in pose['landmarks']],
+                    dtype=np.float64)
+
+
+def _lerp_poses(poses_a, poses_b, arrays_a, arrays_b, t):
+    """Poses a fraction t of the way from poses_a to poses_b, keeping any id fields"""
+    poses = []
+    for pose, a, b in zip(poses_a, arrays_a, arrays_b):
+        values = (a + (b - a) * t).tolist()
+        interpolated = {key: value for key, value in pose.items() if key != 'landmarks'}
+        interpolated['landmarks'] = [
+            dict(lm, **dict(zip(LANDMARK_VALUES, row))) for lm, row in zip(pose['landmarks'], values)
+        ]
+        poses.append(interpolated)
+    return poses
+
+
+def fill_skipped_frames(frames, num_frames, fps):
+    """
+    Full per-frame timeline from the frames detection ran on
+
+    frames must be ordered by frame_id. A skipped frame between two frames with
+    the same number of poses gets linearly interpolated landmarks (and image
+    landmarks, if recorded); otherwise it copies the nearer detected frame.
+    Frames before the first detection or after the last repeat it. Filled
+    frames are marked 'interpolated'.
+    """
+    if not frames:
+        return frames
+    filled = [_copy_frame(frames[0], frame_id, fps) for frame_id in range(frames[0]['frame_id'])]
+    arrays = [[_pose_array(pose) for pose in frame['poses']] for frame in frames]
+    for index, frame in enumerate(frames):
+        filled.append(frame)
+        if index + 1 < len(frames):
+            following = frames[index + 1]
+            gap_end = following['frame_id']
+        else:
+            following = None
+            gap_end = num_frames
+        for frame_id in range(frame['frame_id'] + 1, gap_end):
+            t = (frame_id - frame['frame_id']) / (gap_end - frame['frame_id'])
+            if following is not None and frame['poses'] and len(frame['poses']) == len(following['poses']):
+                filler = {'frame_id': frame_id, 'timestamp': frame_id / fps, 'interpolated': True}
+                filler['poses'] = _lerp_poses(frame['poses'], following['poses'], arrays[index], arrays[index + 1], t)
+                if 'image_landmarks' in frame:
+                    a = np.asarray(frame['image_landmarks'], dtype=np.float64)
+                    b = np.asarray(following['image_landmarks'], dtype=np.float64)
+                    filler['image_landmarks'] = (a + (b - a) * t).tolist() if a.shape == b.shape else frame['image_landmarks']
+            else:
+                filler = _copy_frame(frame if following is None or t < 0.5 else following, frame_id, fps)
+            filled.append(filler)
+    return filled
+
+
+def _copy_frame(frame, frame_id, fps):
+    """A filler for frame_id repeating a detected frame's poses"""
+    filler = {'frame_id': frame_id, 'timestamp': frame_id / fps, 'interpolated': True, 'poses': frame['poses']}
+    if 'image_landmarks' in frame:
+        filler['image_landmarks'] = frame['image_landmarks']
+    return filler
@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+JOB_DB_PATH = os.environ.get('JOB_DB_PATH', os.path.join('cache', 'jobs.sqlite3'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+JOB_MAX_QUEUED = int(os.environ.get('JOB_MAX_QUEUED', '32'))
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+def _boot_id():
+    """Identifier of the running boot (Linux), so a pid from before a reboot never looks alive"""
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def current_owner():
+    """(host, pid, boot id) identifying this server process as the owner of the jobs it submits"""
+    return socket.gethostname(), os.getpid(), _boot_id()
+
+
+def _owner_alive(host, pid, boot):
+    """
+    Whether the process that submitted a job may still be running
+
+    Only processes on this host can be checked; owners on other hosts sharing
+    the database are assumed alive. Jobs without an owner predate owner
+    tracking and are treated as orphaned.
+    """
+    if pid is None:
+        return False
+    this_host, _, this_boot = current_owner()
+    if host != this_host:
+        return True
+    if boot != this_boot:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Alive, but run by another user
+    return True
+
+
+class JobStore:
+    """
+    SQLite-backed job records shared by the server and its worker processes
+
+    Each call opens its own connection, so the store can be used from any
+    thread or process; WAL mode lets status polls read while workers write.
+    """
+
+    def __init__(self, path=JOB_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    progress REAL NOT NULL DEFAULT 0,
+                    submitted_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    user_id TEXT,
+                    result TEXT,
+                    error TEXT,
+                    owner_host TEXT,
+                    owner_pid INTEGER,
+                    owner_boot TEXT
+                )
+            ''')
+            # Databases created before jobs recorded their owner
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+            for column, kind in (('owner_host', 'TEXT'), ('owner_pid', 'INTEGER'), ('owner_boot', 'TEXT')):
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {kind}')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def create(self, job_id, user_id=None):
+        """Record a queued job, owned by the calling process"""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, status, submitted_at, user_id, owner_host, owner_pid, owner_boot) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, STATUS_QUEUED, time.time(), user_id, *current_owner())
+            )
+
+    def update(self, job_id, **fields):
+        if 'result' in fields and fields['result'] is not None:
+            fields['result'] = json.dumps(fields['result'])
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self._connect() as conn:
+            conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        if job['result']:
+            job['result'] = json.loads(job['result'])
+        return job
+
+    def count(self, status):
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM jobs WHERE status = ?', (status,)).fetchone()[0]
+
+    def fail_orphaned(self, reason):
+        """
+        Mark jobs left queued or running by server processes that have exited as failed
+
+        Jobs of live owners (e.g. other server processes sharing the database)
+        are left alone. Returns the number of jobs failed.
+        """
+        with self._connect() as conn:
+            owners = conn.execute(
+                'SELECT DISTINCT owner_host, owner_pid, owner_boot FROM jobs WHERE status IN (?, ?)',
+                (STATUS_QUEUED, STATUS_RUNNING)
+            ).fetchall()
+            failed = 0
+            for host, pid, boot in owners:
+                if _owner_alive(host, pid, boot):
+                    continue
+                # IS, not =, so jobs without a recorded owner match too
+                failed += conn.execute(
+                    'UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status IN (?, ?) '
+                    'AND owner_host IS ? AND owner_pid IS ? AND owner_boot IS ?',
+                    (STATUS_FAILED, reason, time.time(), STATUS_QUEUED, STATUS_RUNNING, host, pid, boot)
+                ).rowcount
+        return failed
+
+
+# Per-process state of job workers, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(db_path):
+    """Worker process initializer: artifact storage, the landmark cache and warm detectors"""
+    from firebase_app import init_firebase
+    from artifact_storage import storage_from_env
+    from landmark_cache import LandmarkCache
+    from detector_pool import get_detector_pool, RUNNING_MODE_VIDEO
+
+    logging.basicConfig(level=logging.INFO)
+    _worker['store'] = JobStore(db_path)
+    _worker['storage'] = storage_from_env(lambda: init_firebase(check_connection=False))
+    _worker['landmark_cache'] = LandmarkCache()
+    get_detector_pool(RUNNING_MODE_VIDEO).warm()
+    # Jobs already run in their own processes, so each job's two videos share
+    # this worker's detector pool from threads rather than spawning more processes
+    _worker['video_executor'] = ThreadPoolExecutor(max_workers=2, thread_name_prefix='video')
+
+
+def _record_graph(store, job_id, result, graph):
+    """Update a finished job's result with its similarity graph's final status"""
+    result['artifacts'].update(similarity_graph=graph['url'], similarity_graph_status=graph)
+    store.update(job_id, result=result)
+
+
+def _run_job(job_id, json_data):
+    """Run one job in a worker process; returns the worker's detector pool stats"""
+    from training import run_training, when_graph_done
+    from detector_pool import worker_pool_report
+
+    store = _worker['store']
+    store.update(job_id, status=STATUS_RUNNING, started_at=time.time())
+
+    def progress(stage, fraction):
+        store.update(job_id, stage=stage, progress=fraction)
+
+    try:
+        result = run_training(json_data, _worker['storage'], _worker['landmark_cache'], progress,
+                              _worker['video_executor'])
+        if result.get('status') == 'success':
+            store.update(job_id, status=STATUS_SUCCEEDED, result=result, finished_at=time.time())
+            graph = result['artifacts'].get('similarity_graph_status')
+            if graph:
+                # The graph renders after the job finishes; its URL is added to the result once uploaded
+                when_graph_done(graph['id'], lambda status: _record_graph(store, job_id, result, status))
+        else:
+            store.update(job_id, status=STATUS_FAILED, error=result.get('error'),
+                         result=result, finished_at=time.time())
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {str(e)}", exc_info=True)
+        store.update(job_id, status=STATUS_FAILED, error=str(e), finished_at=time.time())
+    return worker_pool_report()
+
+
+class JobQueue:
+    """
+    Bounded pool of worker processes running the /api/train pipeline
+
+    Detection is CPU-bound, so jobs run in separate processes (each with its own
+    warm detector pool). At most max_queued jobs may wait for a worker; further
+    submissions raise QueueFullError so the caller can shed load.
+    """
+
+    def __init__(self, store=None, max_workers=JOB_WORKERS, max_queued=JOB_MAX_QUEUED):
+        self.store = store or JobStore()
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        failed = self.store.fail_orphaned('Server restarted before the job finished')
+        if failed:
+            logger.warning(f"Marked {failed} jobs of exited server processes as failed")
+        from detector_pool import WorkerPoolStats
+        # Detector pools of the worker processes, as reported by each finished job
+        self.pool_stats = WorkerPoolStats()
+        self._lock = threading.Lock()
+        self._pending = 0
+        # spawn, not fork: the server process already runs threads (detector
+        # pool, background writers) that must not be duplicated mid-operation
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.store.path,)
+        )
+
+    def submit(self, json_data):
+        """Queue a job and return its id immediately"""
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queued:
+                raise QueueFullError(f"Job queue is full ({self.max_queued} waiting)")
+            self._pending += 1
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id, json_data.get('userId'))
+        future = self._executor.submit(_run_job, job_id, json_data)
+        future.add_done_callback(lambda f: self._job_finished(job_id, f))
+        return job_id
+
+    def _job_finished(self, job_id, future):
+        with self._lock:
+            self._pending -= 1
+        error = future.exception()
+        if error is not None:
+            # The worker process itself died (the job could not record its failure)
+            logger.error(f"Job {job_id} worker crashed: {str(error)}")
+            self.store.update(job_id, status=STATUS_FAILED, error=str(error), finished_at=time.time())
+            return
+        self.pool_stats.record(future.result())
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            pending = self._pending
+        return {
+            'workers': self.max_workers,
+            'max_queued': self.max_queued,
+            'running': self.store.count(STATUS_RUNNING),
+            'queue_depth': self.store.count(STATUS_QUEUED),
+            'pending': pending
+        }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
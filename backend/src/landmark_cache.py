@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from landmark_store import save_landmark_arrays, write_atomic
+
+DEFAULT_CACHE_DIR = os.environ.get('LANDMARK_CACHE_DIR', os.path.join('cache', 'landmarks'))
+DEFAULT_MAX_BYTES = int(os.environ.get('LANDMARK_CACHE_MAX_BYTES', str(1024 ** 3)))
+CACHE_FORMAT_VERSION = 3  # 3: entries always include image landmarks
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+class LandmarkCache:
+    """
+    Content-addressed on-disk cache of process_video landmark output
+
+    Entries are keyed by the video's content hash plus the bbox and detector
+    settings, so the same reference clip cropped the same way is only ever
+    processed once. The cache is capped at max_bytes; reading an entry bumps
+    its mtime and the least recently used entries are evicted first.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    def key_for(self, video_path, bbox=None, content_hash=None, **settings):
+        """
+        Cache key for a video file, its bbox and any detector settings that change the output
+
+        content_hash, the SHA-256 of the file if the caller already has it
+        (e.g. from downloading it), saves reading the file again.
+        """
+        parts = {
+            'version': CACHE_FORMAT_VERSION,
+            'content': content_hash or hash_file(video_path),
+            'bbox': list(bbox) if bbox else None,
+            'settings': settings
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.root, f'{key}.npz')
+
+    def _meta_path_for(self, key):
+        return os.path.join(self.root, f'{key}.meta')
+
+    def get(self, key):
+        """Return (landmarks_path, metadata) for a cached entry, or None on a miss"""
+        path = self.path_for(key)
+        try:
+            os.utime(path)  # Mark as recently used
+            with open(self._meta_path_for(key), 'r') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path, metadata
+
+    def put(self, key, landmarks_data, **metadata):
+        """Store landmarks (plus metadata such as the processed video URL) and return the entry path"""
+        path = self.path_for(key)
+        # Metadata goes first so a visible data file always has its sidecar
+        write_atomic(self._meta_path_for(key), lambda temp_path: _write_json(temp_path, dict(metadata, key=key)))
+        save_landmark_arrays(path, landmarks_data)
+        self.evict()
+        return path
+
+    def export(self, key, dest):
+        """
+        Make a cached entry's landmarks available at dest, e.g. the per-request
+        path /api/render reads. A hard link where possible (a copy across
+        filesystems), so the file outlives the entry's eviction.
+        """
+        def link(temp_path):
+            os.remove(temp_path)
+            try:
+                os.link(self.path_for(key), temp_path)
+            except OSError:
+                shutil.copyfile(self.path_for(key), temp_path)
+
+        write_atomic(dest, link)
+        return dest
+
+    def _entries(self):
+        """(last used, size in bytes, key) for every complete entry"""
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith('.npz'):
+                continue
+            key = name[:-len('.npz')]
+            try:
+                stat = os.stat(os.path.join(self.root, name))
+                meta_size = os.path.getsize(self._meta_path_for(key))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size + meta_size, key))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, key in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self.path_for(key))
+                    os.remove(self._meta_path_for(key))
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+
+    def stats(self):
+        entries = self._entries()
+        with self._lock:
+            return {
+                'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,258 @@
+"""
+Compact columnar storage for process_video landmarks
+
+A landmark file is an uncompressed .npz archive holding:
+    landmarks        float32 (frames, poses, 33, 4)  x, y, z, visibility
+    present          bool    (frames, poses)         pose detected in that slot
+    timestamps       float64 (frames,)               seconds from the start
+    image_landmarks  float32 (frames, 33, 3)         optional, normalized x, y, visibility
+                                                     of the first pose (for rendering)
+    meta             0-d str                         JSON of the remaining metadata
+
+Members are stored without compression, so load_landmark_arrays can memory
+map them straight out of the archive instead of reading the whole file.
+"""
+import json
+import logging
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NUM_LANDMARKS = 33
+LANDMARK_VALUES = ('x', 'y', 'z', 'visibility')
+
+
+class LandmarkArrays:
+    """Landmarks for one video in array form (see module docstring for the layout)"""
+
+    def __init__(self, landmarks, present, timestamps, meta=None, image_landmarks=None):
+        self.landmarks = landmarks
+        self.present = present
+        self.timestamps = timestamps
+        self.meta = meta or {}
+        self.image_landmarks = image_landmarks
+
+    @property
+    def num_frames(self):
+        return self.landmarks.shape[0]
+
+    @property
+    def frames_with_poses(self):
+        if self.present.shape[1] == 0:
+            return 0
+        return int(np.count_nonzero(self.present[:, 0]))
+
+    def pose_sequence(self):
+        """(frames_with_poses, 132) float32 rows of the first pose, as extract_pose_sequence returns"""
+        if self.present.shape[1] == 0:
+            return np.zeros((0, NUM_LANDMARKS * 4), dtype=np.float32)
+        rows = self.landmarks[self.present[:, 0], 0]
+        return np.ascontiguousarray(rows.reshape(len(rows), NUM_LANDMARKS * 4), dtype=np.float32)
+
+    def to_dict(self):
+        """Rebuild the JSON-style landmarks dict process_video returns"""
+        data = dict(self.meta)
+        frames = []
+        for i in range(self.num_frames):
+            poses = []
+            for p in np.flatnonzero(self.present[i]):
+                poses.append({'landmarks': [
+                    dict(zip(LANDMARK_VALUES, map(float, values))) for values in self.landmarks[i, p]
+                ]})
+            frame = {'frame_id': i, 'timestamp': float(self.timestamps[i]), 'poses': poses}
+            if self.image_landmarks is not None:
+                frame['image_landmarks'] = (
+                    self.image_landmarks[i].tolist() if poses else []
+                )
+            frames.append(frame)
+        data['frames'] = frames
+        return data
+
+
+def from_dict(landmarks_data):
+    """Convert a JSON-style landmarks dict (as written by process_video) to LandmarkArrays"""
+    frames = landmarks_data.get('frames', [])
+    num_poses = max((len(frame.get('poses') or []) for frame in frames), default=0)
+    landmarks = np.zeros((len(frames), num_poses, NUM_LANDMARKS, 4), dtype=np.float32)
+    present = np.zeros((len(frames), num_poses), dtype=bool)
+    timestamps = np.zeros(len(frames), dtype=np.float64)
+    has_image_landmarks = any('image_landmarks' in frame for frame in frames)
+    image_landmarks = np.zeros((len(frames), NUM_LANDMARKS, 3), dtype=np.float32) if has_image_landmarks else None
+
+    fps = landmarks_data.get('fps') or 30
+    for i, frame in enumerate(frames):
+        timestamps[i] = frame.get('timestamp', i / fps)
+        for p, pose in enumerate(frame.get('poses') or []):
+            values = [
+                [lm.get(key, 0) or 0 for key in LANDMARK_VALUES]
+                for lm in pose.get('landmarks', [])[:NUM_LANDMARKS]
+            ]
+            if values:
+                landmarks[i, p, :len(values)] = values
+            present[i, p] = True
+        if has_image_landmarks and frame.get('image_landmarks'):
+            points = frame['image_landmarks'][:NUM_LANDMARKS]
+            image_landmarks[i, :len(points)] = points
+
+    meta = {key: value for key, value in landmarks_data.items() if key != 'frames'}
+    return LandmarkArrays(landmarks, present, timestamps, meta, image_landmarks)
+
+
+def save_landmark_arrays(path, arrays):
+    """Write LandmarkArrays (or a JSON-style landmarks dict) to an uncompressed .npz file"""
+    if isinstance(arrays, dict):
+        arrays = from_dict(arrays)
+    members = {
+        'landmarks': np.ascontiguousarray(arrays.landmarks, dtype=np.float32),
+        'present': np.ascontiguousarray(arrays.present, dtype=bool),
+        'timestamps': np.ascontiguousarray(arrays.timestamps, dtype=np.float64),
+        'meta': np.array(json.dumps(arrays.meta))
+    }
+    if arrays.image_landmarks is not None:
+        members['image_landmarks'] = np.ascontiguousarray(arrays.image_landmarks, dtype=np.float32)
+    # np.savez appends .npz to names without it; write through a file object instead
+    def write(temp_path):
+        with open(temp_path, 'wb') as f:
+            np.savez(f, **members)
+
+    write_atomic(path, write)
+    return path
+
+
+def write_atomic(path, write):
+    """
+    Call write(temp_path) on a temporary file next to path, then move it into
+    place, so readers of path never see a partially written file
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+_background_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='landmark-writer')
+
+
+def persist_in_background(write, *args, **kwargs):
+    """
+    Run a landmark write (e.g. save_landmark_arrays) off the request path
+
+    Writes run one at a time in a background thread; failures are logged
+    rather than raised. Returns the Future so callers can wait if they need to.
+    """
+    def run():
+        try:
+            return write(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Background landmark write failed: {str(e)}")
+            raise
+    return _background_writer.submit(run)
+
+
+def _memmap_member(path, archive, name):
+    """Memory map one stored (uncompressed) .npy member of an .npz archive"""
+    info = archive.getinfo(name)
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(path, 'rb') as f:
+        # Local file header: fixed 30 bytes, then file name and extra field
+        f.seek(info.header_offset + 26)
+        name_length = int.from_bytes(f.read(2), 'little')
+        extra_length = int.from_bytes(f.read(2), 'little')
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        if dtype.hasobject:
+            return None
+        offset = f.tell()
+    if 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape, offset=offset,
+                     order='F' if fortran_order else 'C')
+
+
+def load_npz(path, mmap=True):
+    """
+    All members of an uncompressed .npz file by name
+
+    Numeric members are memory mapped unless mmap=False; 'meta' (and anything
+    else that can't be mapped) is read normally.
+    """
+    with zipfile.ZipFile(path) as archive:
+        names = {name[:-len('.npy')] for name in archive.namelist()}
+        arrays = {}
+        with np.load(path) as npz:
+            for name in names:
+                member = _memmap_member(path, archive, f'{name}.npy') if mmap and name != 'meta' else None
+                arrays[name] = member if member is not None else npz[name]
+    return arrays
+
+
+def load_landmark_arrays(path, mmap=True):
+    """Load a landmark .npz file; large arrays are memory mapped unless mmap=False"""
+    arrays = load_npz(path, mmap)
+    return LandmarkArrays(
+        arrays['landmarks'],
+        arrays['present'],
+        arrays['timestamps'],
+        json.loads(str(arrays['meta'])),
+        arrays.get('image_landmarks')
+    )
+
+
+def is_landmark_arrays_path(path):
+    return str(path).endswith('.npz')
+
+
+def convert_json_file(json_path, output_path=None):
+    """Convert a JSON landmarks file written by older versions of process_video"""
+    output_path = output_path or os.path.splitext(json_path)[0] + '.npz'
+    with open(json_path, 'r') as f:
+        landmarks_data = json.load(f)
+    save_landmark_arrays(output_path, landmarks_data)
+    return output_path
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert JSON landmark files to the compact .npz format')
+    parser.add_argument('paths', nargs='+', help='JSON landmark files or directories containing them')
+    parser.add_argument('--remove', action='store_true', help='Delete each JSON file after converting it')
+    args = parser.parse_args()
+
+    json_paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                json_paths.extend(os.path.join(root, name) for name in files if name.endswith('.json'))
+        else:
+            json_paths.append(path)
+
+    for json_path in sorted(json_paths):
+        try:
+            output_path = convert_json_file(json_path)
+        except Exception as e:
+            print(f"Skipping {json_path}: {e}")
+            continue
+        before = os.path.getsize(json_path)
+        after = os.path.getsize(output_path)
+        print(f"{json_path} -> {output_path} ({before} -> {after} bytes)")
+        if args.remove:
+            os.remove(json_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import queue
+import threading
+import time
+
+_DONE = object()
+_POLL_SECONDS = 0.1
+
+
+class StageStats:
+    """Timing counters for one pipeline stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0     # time spent doing the stage's own work
+        self.starved_seconds = 0.0  # time waiting for input from upstream
+        self.blocked_seconds = 0.0  # time waiting for room downstream (backpressure)
+
+    def as_dict(self):
+        return {
+            'items': self.items,
+            'busy_seconds': round(self.busy_seconds, 4),
+            'starved_seconds': round(self.starved_seconds, 4),
+            'blocked_seconds': round(self.blocked_seconds, 4)
+        }
+
+
+def run_pipeline(source, stages, queue_depth=4, source_name='decode'):
+    """
+    Run a linear pipeline with one thread per stage and bounded queues in between
+
+    source: iterable producing work items (consumed in its own thread)
+    stages: list of (name, fn) pairs; each fn takes the previous stage's output.
+        The last stage's return value is discarded.
+    queue_depth: maximum number of items buffered between two stages. A full
+        queue blocks the upstream stage, so memory stays bounded.
+
+    Every stage runs in a single thread and queues are FIFO, so items reach
+    each stage in the order the source produced them. The first exception
+    raised by any stage stops the pipeline and is re-raised here.
+
+    Returns a dict of per-stage timing stats keyed by stage name.
+    """
+    queue_depth = max(1, int(queue_depth))
+    queues = [queue.Queue(maxsize=queue_depth) for _ in stages]
+    stats = [StageStats(source_name)] + [StageStats(name) for name, _ in stages]
+    stop = threading.Event()
+    errors = []
+
+    def put(q, item, stage_stats):
+        start = time.perf_counter()
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                break
+            except queue.Full:
+                continue
+        stage_stats.blocked_seconds += time.perf_counter() - start
+
+    def get(q, stage_stats):
+        start = time.perf_counter()
+        while not stop.is_set():
+            try:
+                item = q.get(timeout=_POLL_SECONDS)
+                stage_stats.starved_seconds += time.perf_counter() - start
+                return item
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def run_source():
+        stage_stats = stats[0]
+        try:
+            iterator = iter(source)
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    stage_stats.busy_seconds += time.perf_counter() - start
+                stage_stats.items += 1
+                put(queues[0], item, stage_stats)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put(queues[0], _DONE, stage_stats)
+
+    def run_stage(index, fn):
+        stage_stats = stats[index + 1]
+        downstream = queues[index + 1] if index + 1 < len(queues) else None
+        try:
+            while True:
+                item = get(queues[index], stage_stats)
+                if item is _DONE:
+                    break
+                start = time.perf_counter()
+                result = fn(item)
+                stage_stats.busy_seconds += time.perf_counter() - start
+                stage_stats.items += 1
+                if downstream is not None:
+                    put(downstream, result, stage_stats)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            if downstream is not None:
+                put(downstream, _DONE, stage_stats)
+
+    threads = [threading.Thread(target=run_source, name=f'pipeline-{source_name}', daemon=True)]
+    for index, (name, fn) in enumerate(stages):
+        threads.append(threading.Thread(target=run_stage, args=(index, fn),
+                                        name=f'pipeline-{name}', daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return {s.name: s.as_dict() for s in stats}
+
+
+def max_in_flight(num_stages, queue_depth=4):
+    """
+    Upper bound on source items alive at once inside run_pipeline: one being
+    produced, queue_depth waiting in front of each stage and one held by each
+    stage (while it works on it or waits to pass its result on). Buffers
+    recycled after this many items are no longer referenced by any stage.
+    """
+    return num_stages * (max(1, int(queue_depth)) + 1) + 2
+
+
+def bottleneck(stage_stats):
+    """Name of the stage that spent the most time doing work"""
+    if not stage_stats:
+        return None
+    return max(stage_stats, key=lambda name: stage_stats[name]['busy_seconds'])
@@ -0,0 +1,214 @@
+import os
+
+import numpy as np
+
+NUM_LANDMARKS = 33
+# Default Sakoe-Chiba band, in seconds of the sequences being aligned: a fixed
+# band keeps alignment O(n) however long the videos get
+DEFAULT_WINDOW_SECONDS = float(os.environ.get('DTW_WINDOW_SECONDS', '2.0'))
+DEFAULT_FPS = 30
+
+_DIAG, _UP, _LEFT = 0, 1, 2
+_BLOCK_ROWS = 64
+
+
+def frame_features(seq, visibility_weighted=False):
+    """
+    DTW features for a (frames, 132) pose sequence: x, y, z of all 33 joints
+
+    With visibility_weighted, each joint's coordinates are scaled by the square
+    root of its visibility so its contribution to the squared frame distance is
+    weighted by how confidently it was detected.
+    """
+    seq = np.asarray(seq, dtype=np.float64).reshape(len(seq), NUM_LANDMARKS, 4)
+    coords = seq[:, :, :3]
+    if visibility_weighted:
+        coords = coords * np.sqrt(np.clip(seq[:, :, 3:4], 0.0, 1.0))
+    return np.nan_to_num(coords.reshape(len(seq), NUM_LANDMARKS * 3))
+
+
+class DTWResult:
+    """Outcome of dtw_align: total cost, the warping path and the band that was used"""
+
+    def __init__(self, distance, path, window):
+        self.distance = distance
+        self.path = path      # (steps, 2) int array of (x index, y index) pairs
+        self.window = window
+
+    @property
+    def normalized_distance(self):
+        """Average frame distance along the path, comparable between clips of different lengths"""
+        return self.distance / max(len(self.path), 1)
+
+    def summary(self):
+        return {
+            'distance': float(self.distance),
+            'normalized_distance': float(self.normalized_distance),
+            'path_length': int(len(self.path)),
+            'window': int(self.window)
+        }
+
+
+def band_limits(n, m, window):
+    """
+    Per-row column range [lo, hi] of a Sakoe-Chiba band around the diagonal
+    from (0, 0) to (n - 1, m - 1). The window is widened if needed so that
+    consecutive rows overlap and the end point stays reachable.
+    """
+    slope = (m - 1) / (n - 1) if n > 1 else 0.0
+    window = max(int(window), int(np.ceil(max(slope, 1.0))))
+    centers = np.round(np.arange(n) * slope).astype(np.int64)
+    lo = np.clip(centers - window, 0, m - 1)
+    hi = np.clip(centers + window, 0, m - 1)
+    if n == 1:
+        hi[:] = m - 1  # A single frame has to match every frame of y
+    return lo, hi, window
+
+
+def _gather(row, row_lo, columns):
+    """Values of a banded row at the given columns, inf outside the band"""
+    index = columns - row_lo
+    valid = (index >= 0) & (index < len(row))
+    values = np.full(len(columns), np.inf)
+    values[valid] = row[index[valid]]
+    return values
+
+
+def next_row(prev, prev_lo, columns, cost):
+    """
+    One row of the DTW cost recurrence
+
+    prev holds the previous row's cumulative costs starting at column prev_lo;
+    cost holds this row's frame distances at the given (consecutive) columns.
+    Returns the row's cumulative costs and its back-pointers.
+    """
+    cumulative = np.cumsum(cost)
+    up = _gather(prev, prev_lo, columns)
+    diag = _gather(prev, prev_lo, columns - 1)
+    best_prev = np.minimum(diag, up)
+    step = np.where(diag <= up, _DIAG, _UP).astype(np.uint8)
+    # row[j] = min over k <= j of best_prev[k] + cost[k..j]
+    with np.errstate(invalid='ignore'):
+        candidates = best_prev - (cumulative - cost)
+    running = np.minimum.accumulate(candidates)
+    step[running < candidates] = _LEFT
+    return running + cumulative, step
+
+
+def _accumulate(x, y, lo, hi, open_begin=False, y_sq=None):
+    """
+    Banded DTW cost recurrence over rows of x; returns the per-row back-pointers
+    and the cumulative cost of the last row
+
+    With open_begin, row 0 may start at any column of y instead of (0, 0).
+    y_sq may give the squared norms of y's rows if they are already known.
+    """
+    n = len(x)
+    # Only the back-pointers are kept for every row; costs need just the previous row
+    directions = np.zeros((n, int((hi - lo).max()) + 1), dtype=np.uint8)
+    prev = prev_lo = None
+    x_sq = np.einsum('ij,ij->i', x, x)
+    if y_sq is None:
+        y_sq = np.einsum('ij,ij->i', y, y)
+    block = None
+    for i in range(n):
+        if i % _BLOCK_ROWS == 0:
+            # Frame distances for a block of rows in one matrix product
+            block_end = min(i + _BLOCK_ROWS, n)
+            block_lo = lo[i]
+            block_cols = slice(block_lo, hi[block_end - 1] + 1)
+            squared = x_sq[i:block_end, None] + y_sq[None, block_cols] - 2.0 * (x[i:block_end] @ y[block_cols].T)
+            block = np.sqrt(np.maximum(squared, 0.0))
+        columns = np.arange(lo[i], hi[i] + 1)
+        cost = block[i % _BLOCK_ROWS, lo[i] - block_lo:hi[i] - block_lo + 1]
+        if i == 0 and open_begin:
+            row = cost.copy()  # Any column can be the start of the match
+            step = np.full(len(columns), _DIAG, dtype=np.uint8)
+        elif i == 0:
+            row = np.cumsum(cost)  # Row 0 can only be reached from the left
+            step = np.full(len(columns), _LEFT, dtype=np.uint8)
+        else:
+            row, step = next_row(prev, prev_lo, columns, cost)
+        directions[i, :len(columns)] = step
+        prev, prev_lo = row, lo[i]
+    return directions, prev
+
+
+def _backtrack(directions, lo, i, j, open_begin=False):
+    """Walk the back-pointers from (i, j) to the start of the path"""
+    path = []
+    while True:
+        path.append((i, j))
+        if i == 0 and (open_begin or j == 0):
+            break
+        step = directions[i, j - lo[i]]
+        if i == 0 or step == _LEFT:
+            j -= 1
+        elif step == _UP:
+            i -= 1
+        else:
+            i -= 1
+            j -= 1
+    return np.array(path[::-1], dtype=np.int64)
+
+
+def window_frames(seconds=None, fps=None):
+    """Band in frames spanning seconds (default DEFAULT_WINDOW_SECONDS) at fps (default DEFAULT_FPS)"""
+    seconds = DEFAULT_WINDOW_SECONDS if seconds is None else seconds
+    return max(1, int(round(seconds * (fps or DEFAULT_FPS))))
+
+
+def dtw_align(x, y, window=None, y_sq=None, fps=None):
+    """
+    Dynamic time warping between feature sequences x (n, d) and y (m, d)
+
+    Frame distance is euclidean. Only cells inside a Sakoe-Chiba band of
+    +/- window frames around the diagonal are evaluated (window=None uses
+    DEFAULT_WINDOW_SECONDS at fps, see window_frames), so time and memory are
+    O(n * window) rather than O(n * m). Frame distances are computed for
+    blocks of rows with one matrix product, and each row of the cost matrix
+    with whole-array NumPy operations: the left-neighbour recurrence within a
+    row is resolved with a running minimum, which is exact because frame
+    distances are non-negative.
+
+    y_sq optionally gives the squared norms of y's rows, e.g. precomputed for
+    a reference that is aligned against many sequences.
+
+    Returns a DTWResult holding the warping path for reuse by other metrics.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n, m = len(x), len(y)
+    if n == 0 or m == 0:
+        raise ValueError("Cannot align an empty sequence")
+    if window is None:
+        window = window_frames(fps=fps)
+    lo, hi, window = band_limits(n, m, window)
+
+    directions, last_row = _accumulate(x, y, lo, hi, y_sq=y_sq)
+    path = _backtrack(directions, lo, n - 1, m - 1)
+    return DTWResult(float(last_row[-1]), path, window)
+
+
+def subsequence_align(x, y, y_sq=None):
+    """
+    Subsequence DTW: align all of x (n, d) to the best-matching stretch of y (m, d)
+
+    The match may start and end at any frame of y, so a short clip of one
+    section is found inside a long sequence rather than stretched over all of
+    it. Every row spans the whole of y, so time is O(n * m): linear in the
+    length of y for a given x. The matched frames of y are path[0, 1] to
+    path[-1, 1] of the returned DTWResult. y_sq is as for dtw_align.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n, m = len(x), len(y)
+    if n == 0 or m == 0:
+        raise ValueError("Cannot align an empty sequence")
+    lo = np.zeros(n, dtype=np.int64)
+    hi = np.full(n, m - 1, dtype=np.int64)
+
+    directions, last_row = _accumulate(x, y, lo, hi, open_begin=True, y_sq=y_sq)
+    end = int(np.argmin(last_row))
+    path = _backtrack(directions, lo, n - 1, end, open_begin=True)
+    return DTWResult(float(last_row[end]), path, m)
@@ -0,0 +1,90 @@
+"""
+Server warm-up stages and readiness reporting
+
+A Readiness holds named startup stages (importing heavy modules, checking
+storage, starting workers) that run in order, in a background thread or
+inline, while the server already answers liveness checks. report() gives the
+state and duration of every stage for a readiness endpoint.
+"""
+import importlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PENDING, RUNNING, READY, FAILED = 'pending', 'running', 'ready', 'failed'
+
+
+def import_modules(names):
+    """Import each module, returning {name: seconds} (near zero if it was already loaded)"""
+    seconds = {}
+    for name in names:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        seconds[name] = round(time.perf_counter() - start, 3)
+    return seconds
+
+
+class Readiness:
+    """
+    Ordered startup stages and their outcome
+
+    A stage that fails is logged and later stages still run; the server is
+    ready once every required stage has succeeded.
+    """
+
+    def __init__(self):
+        self._stages = []
+        self._status = {}
+        self._lock = threading.Lock()
+        self._created = time.perf_counter()
+        self._finished = None
+        self.thread = None
+
+    def add(self, name, run, required=True):
+        """Add a stage; run() may return details (e.g. a timing breakdown) for the report"""
+        self._stages.append((name, run, required))
+        self._status[name] = {'state': PENDING, 'required': required}
+
+    def run(self):
+        for name, run, _ in self._stages:
+            self._update(name, state=RUNNING)
+            start = time.perf_counter()
+            try:
+                details = run()
+            except Exception as e:
+                logger.error(f"Startup stage {name} failed: {str(e)}")
+                self._update(name, state=FAILED, seconds=round(time.perf_counter() - start, 3), error=str(e))
+            else:
+                logger.info(f"Startup stage {name} finished in {time.perf_counter() - start:.2f}s")
+                self._update(name, state=READY, seconds=round(time.perf_counter() - start, 3))
+                if details is not None:
+                    self._update(name, details=details)
+        self._finished = time.perf_counter()
+
+    def start(self):
+        """Run the stages in a background thread"""
+        self.thread = threading.Thread(target=self.run, name='warm-up', daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def _update(self, name, **fields):
+        with self._lock:
+            self._status[name].update(fields)
+
+    @property
+    def ready(self):
+        with self._lock:
+            return all(status['state'] == READY for status in self._status.values() if status['required'])
+
+    def report(self):
+        with self._lock:
+            stages = {name: dict(status) for name, status in self._status.items()}
+        end = self._finished if self._finished is not None else time.perf_counter()
+        return {
+            'ready': self.ready,
+            'finished': self._finished is not None,
+            'seconds': round(end - self._created, 3),
+            'stages': stages
+        }
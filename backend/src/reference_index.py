@@ -0,0 +1,183 @@
+"""
+Nearest-reference search over a library of reference pose sequences
+
+Each reference is summarised by a fixed-size embedding of its pose sequence:
+the unit-normalized frames (as calculate_pose_similarity normalizes them)
+mean-pooled into EMBEDDING_SEGMENTS consecutive segments, plus the mean and
+standard deviation over the whole clip. Embeddings are L2-normalized, so a
+search is one matrix-vector product over the library. The top-k candidates
+can then be re-ranked with the exact DTW-based calculate_pose_similarity.
+
+Run from backend/src:
+    python reference_index.py build references/ --index reference_index.npz
+    python reference_index.py search reference_index.npz user.npz -k 5 --exact
+"""
+import json
+import os
+
+import numpy as np
+
+from compare_landmarks import pose_sequence_from, calculate_pose_similarity, load_landmarks, landmarks_fps
+from compiled_reference import CompiledReference
+
+DEFAULT_INDEX_PATH = os.environ.get('REFERENCE_INDEX_PATH', 'reference_index.npz')
+EMBEDDING_SEGMENTS = 16
+# Most references a request may ask for; each is re-ranked with full DTW by default
+MAX_NEAREST_K = int(os.environ.get('MAX_NEAREST_K', '20'))
+LANDMARK_EXTENSIONS = ('.npz', '.json')
+
+
+def _unit(vector):
+    return vector / (np.linalg.norm(vector) + 1e-7)
+
+
+def sequence_embedding(seq, segments=EMBEDDING_SEGMENTS):
+    """Fixed-size, L2-normalized float32 embedding of a (frames, 132) pose sequence"""
+    if isinstance(seq, CompiledReference):
+        seq = seq.norm
+    seq = np.nan_to_num(np.asarray(seq, dtype=np.float64))
+    n = len(seq)
+    if n == 0:
+        raise ValueError("Cannot embed an empty pose sequence")
+    seq = seq / (np.linalg.norm(seq, axis=1, keepdims=True) + 1e-7)
+
+    if n >= segments:
+        starts = (np.arange(segments) * n) // segments
+        lengths = np.diff(np.append(starts, n))
+        pooled = np.add.reduceat(seq, starts, axis=0) / lengths[:, None]
+    else:
+        # Fewer frames than segments: repeat frames to fill the timeline
+        pooled = seq[(np.arange(segments) * n) // segments]
+
+    return np.concatenate([
+        _unit(pooled.ravel()),
+        _unit(seq.mean(axis=0)),
+        _unit(seq.std(axis=0))
+    ]).astype(np.float32) / np.sqrt(3.0)
+
+
+class ReferenceIndex:
+    """Embeddings of a reference library with the landmark path of each entry"""
+
+    def __init__(self, ids=None, paths=None, embeddings=None, segments=EMBEDDING_SEGMENTS):
+        self.ids = list(ids or [])
+        self.paths = list(paths or [])
+        self.segments = segments
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, reference_paths, ids=None, segments=EMBEDDING_SEGMENTS):
+        """Embed every reference landmark file; references without poses are skipped"""
+        ids = ids or [os.path.splitext(os.path.basename(path))[0] for path in reference_paths]
+        kept_ids, kept_paths, embeddings = [], [], []
+        for ref_id, path in zip(ids, reference_paths):
+            seq = pose_sequence_from(path, verbose=False)
+            if len(seq) == 0:
+                print(f"Skipping {path}: no poses")
+                continue
+            kept_ids.append(ref_id)
+            kept_paths.append(path)
+            embeddings.append(sequence_embedding(seq, segments))
+        dims = 132 * (segments + 2)
+        matrix = np.stack(embeddings) if embeddings else np.zeros((0, dims), dtype=np.float32)
+        return cls(kept_ids, kept_paths, matrix, segments)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, embeddings=self.embeddings,
+                     meta=np.array(json.dumps({'ids': self.ids, 'paths': self.paths, 'segments': self.segments})))
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            meta = json.loads(str(npz['meta']))
+            embeddings = npz['embeddings']
+        return cls(meta['ids'], meta['paths'], embeddings, meta['segments'])
+
+    def search(self, user_seq, k=5):
+        """Top-k (id, path, embedding similarity) for a user pose sequence, best first"""
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+        if len(self) == 0:
+            return []
+        scores = self.embeddings @ sequence_embedding(user_seq, self.segments)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], self.paths[i], float(scores[i])) for i in top]
+
+
+def nearest_references(user_landmarks, index, k=5, exact=True, dtw_window=None):
+    """
+    Most similar references to a user clip
+
+    The index shortlists k candidates; with exact=True each is then scored with
+    calculate_pose_similarity and the list is re-ranked by overall similarity.
+    Returns dicts with id, path, embedding_similarity and (if exact) comparison.
+    """
+    user_seq = pose_sequence_from(user_landmarks, verbose=False)
+    if len(user_seq) == 0:
+        return []
+    candidates = [
+        {'id': ref_id, 'path': path, 'embedding_similarity': score}
+        for ref_id, path, score in index.search(user_seq, k)
+    ]
+    if not exact:
+        return candidates
+
+    # Runs on the server's request threads: diagnostics are turned off per call,
+    # never by redirecting the process-wide stdout
+    for candidate in candidates:
+        ref_landmarks = load_landmarks(candidate['path'], verbose=False)
+        ref_seq = pose_sequence_from(ref_landmarks, verbose=False)
+        candidate['comparison'] = calculate_pose_similarity(user_seq, ref_seq, dtw_window, verbose=False,
+                                                            ref_fps=landmarks_fps(ref_landmarks))
+    candidates.sort(key=lambda candidate: candidate['comparison']['overall_similarity'], reverse=True)
+    return candidates
+
+
+def main():
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description='Build or query a nearest-reference index')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='Index every landmark file in a directory')
+    build.add_argument('references', help='Directory of reference landmark files (.npz or JSON)')
+    build.add_argument('--index', default=DEFAULT_INDEX_PATH, help='Index file to write (.npz)')
+    build.add_argument('--segments', type=int, default=EMBEDDING_SEGMENTS)
+
+    search = commands.add_parser('search', help='Find the references closest to a user clip')
+    search.add_argument('index', help='Index file written by build')
+    search.add_argument('user_landmarks', help='Path to user video landmarks (.npz or JSON)')
+    search.add_argument('-k', type=int, default=5, help='Number of references to return')
+    search.add_argument('--exact', action='store_true', help='Re-rank the shortlist with full DTW scoring')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        paths = []
+        for root, _, files in os.walk(args.references):
+            paths.extend(os.path.join(root, name) for name in files if name.endswith(LANDMARK_EXTENSIONS))
+        index = ReferenceIndex.build(sorted(paths), segments=args.segments)
+        index.save(args.index)
+        print(f"Indexed {len(index)} references into {args.index}")
+        return
+
+    index = ReferenceIndex.load(args.index)
+    start = time.perf_counter()
+    results = nearest_references(args.user_landmarks, index, args.k, exact=args.exact)
+    elapsed = time.perf_counter() - start
+    for rank, result in enumerate(results, 1):
+        line = f"{rank}. {result['id']} (embedding {result['embedding_similarity']:.3f}"
+        if 'comparison' in result:
+            line += f", overall {result['comparison']['overall_similarity']:.2%}"
+        print(line + ")")
+    print(f"Searched {len(index)} references in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
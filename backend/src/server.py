@@ -1,14 +1,18 @@
 from flask import Flask, jsonify, request
-from train import process_video, process_and_upload_comparison
+from landmark_cache import LandmarkCache
+from landmark_store import load_landmark_arrays
 import os
 import tempfile
-import firebase_admin
-from firebase_admin import credentials, storage, db
+import json
+import threading
+from collections import OrderedDict
+import multiprocessing
 import logging
-import requests
-from compare_landmarks import compare_videos
-from datetime import datetime
+from jobs import JobQueue, QueueFullError
+from readiness import Readiness, import_modules
+from artifact_storage import storage_from_env
 from flask_cors import CORS
+from flask_sock import Sock
 from werkzeug.exceptions import NotFound
 
 # Configure logging
@@ -17,38 +21,120 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+sock = Sock(app)
 
 # Configure output folder
 OUTPUT_FOLDER = 'outputs'
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
-# Initialize Firebase Admin SDK
-try:
-    service_account_path = os.path.join(os.path.dirname(__file__), 'serviceAccountKey.json')
-    if not os.path.exists(service_account_path):
-        raise FileNotFoundError(f"Firebase credentials file not found at {service_account_path}")
-    
-    cred = credentials.Certificate(service_account_path)
-    firebase_admin.initialize_app(cred, {
-        'storageBucket': 'motionmaster-fa7ea.firebasestorage.app',  # Updated bucket name
-        'databaseURL': 'https://motionmaster-fa7ea.firebaseio.com'
-    })
-    bucket = storage.bucket()
-    logger.info("Firebase initialized successfully")
-    
-    # Test bucket connection
-    try:
-        bucket.exists()
-        logger.info("Successfully connected to Firebase Storage bucket")
-    except Exception as e:
-        logger.error(f"Failed to connect to Firebase Storage bucket: {str(e)}")
-        raise
-        
-except Exception as e:
-    logger.error(f"Failed to initialize Firebase: {str(e)}")
-    raise
+# 'background' starts serving at once and warms up behind /api/ready;
+# 'eager' finishes warming up (and fails on a storage error) before serving
+STARTUP_MODE = os.environ.get('STARTUP_MODE', 'background')
+
+# Modules that take seconds to import (mediapipe, cv2, firebase_admin, ...).
+# Endpoints import what they need when called; warm-up imports them all first.
+HEAVY_MODULES = ('firebase_app', 'detector_pool', 'train', 'training', 'downloads',
+                 'compare_landmarks', 'reference_index', 'streaming')
+
+# Firebase storage bucket, initialized on first use
+_bucket = None
+_bucket_lock = threading.Lock()
+
+def get_bucket():
+    global _bucket
+    with _bucket_lock:
+        if _bucket is None:
+            from firebase_app import init_firebase
+            _bucket = init_firebase(check_connection=False)
+        return _bucket
+
+# Where processed videos and results are uploaded (see artifact_storage), set up on first use
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = storage_from_env(get_bucket)
+        return _storage
+
+def check_storage():
+    """Set up artifact storage and confirm it can be written to"""
+    get_storage().check()
+
+def warm_video_stage():
+    """Start the video workers used by /api/train so requests don't pay for model loading"""
+    from train import warm_video_workers
+    warmup_seconds = warm_video_workers()
+    return {'workers': len(warmup_seconds), 'slowest_seconds': round(max(warmup_seconds), 3)}
+
+readiness = Readiness()
+readiness.add('imports', lambda: import_modules(HEAVY_MODULES))
+readiness.add('storage', check_storage)
+readiness.add('video_workers', warm_video_stage, required=False)
+
+# Worker processes re-import this module and must not warm up their own
+if multiprocessing.parent_process() is None:
+    if STARTUP_MODE == 'eager':
+        readiness.run()
+        if not readiness.ready:
+            raise RuntimeError(f"Server warm-up failed: {readiness.report()['stages']}")
+    else:
+        readiness.start()
+
+# Landmarks of shared reference videos, keyed by video content
+landmark_cache = LandmarkCache()
 
-# Sample endpoint
+# Worker processes for asynchronous /api/jobs submissions. Created on first
+# use: workers are spawned processes that re-import this module, and must not
+# start job queues of their own.
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
+
+# Embeddings of the reference library for /api/references/nearest, loaded on first use
+_reference_index = None
+_reference_index_lock = threading.Lock()
+
+def get_reference_index():
+    global _reference_index
+    with _reference_index_lock:
+        if _reference_index is None:
+            from reference_index import ReferenceIndex, DEFAULT_INDEX_PATH
+            _reference_index = ReferenceIndex.load(DEFAULT_INDEX_PATH)
+        return _reference_index
+
+# Prepared references for live scoring sessions, most recently used last
+STREAMING_REFERENCE_CACHE_SIZE = int(os.environ.get('STREAMING_REFERENCE_CACHE_SIZE', '16'))
+_streaming_references = OrderedDict()
+_streaming_references_lock = threading.Lock()
+
+def get_streaming_reference(reference_id):
+    """StreamingReference for a reference in the index, shared by every session using it"""
+    with _streaming_references_lock:
+        if reference_id in _streaming_references:
+            _streaming_references.move_to_end(reference_id)
+            return _streaming_references[reference_id]
+    from compare_landmarks import pose_sequence_from
+    from streaming import StreamingReference
+    index = get_reference_index()
+    if reference_id not in index.ids:
+        raise KeyError(f"Unknown reference: {reference_id}")
+    reference = StreamingReference(pose_sequence_from(index.paths[index.ids.index(reference_id)], verbose=False))
+    with _streaming_references_lock:
+        _streaming_references[reference_id] = reference
+        while len(_streaming_references) > STREAMING_REFERENCE_CACHE_SIZE:
+            _streaming_references.popitem(last=False)
+    return reference
+
+# Sample endpoint; also the liveness check, answered without waiting for warm-up
 @app.route('/api/hello', methods=['GET'])
 def hello():
     return jsonify({
@@ -56,11 +142,22 @@ def hello():
         'status': 'success'
     })
 
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    """Readiness check: 200 once warm-up has finished, 503 before; reports each warm-up stage"""
+    report = readiness.report()
+    return jsonify({
+        'status': 'success' if report['ready'] else 'starting',
+        'startupMode': STARTUP_MODE,
+        'readiness': report
+    }), 200 if report['ready'] else 503
+
 @app.route('/api/test', methods=['GET'])
 def test_connection():
     """Test endpoint to verify API and Firebase connection"""
     try:
         # Test Firebase Storage connection
+        bucket = get_bucket()
         bucket.exists()
         return jsonify({
             'status': 'success',
@@ -75,6 +172,41 @@ def test_connection():
             'firebase_initialized': False
         }), 500
 
+@app.route('/api/stats/detectors', methods=['GET'])
+def detector_stats():
+    """
+    Report detector pool usage (hits, misses, startup time)
+
+    Detection runs in the video workers and job workers, so their pools are
+    reported as of each worker's last task; 'pools' covers this process,
+    which only detects itself with VIDEO_WORKERS=0.
+    """
+    from detector_pool import all_pool_stats, WorkerPoolStats
+    from train import video_worker_pools
+    job_queue = _job_queue  # Not created just to report on it
+    return jsonify({
+        'status': 'success',
+        'pools': all_pool_stats(),
+        'video_workers': video_worker_pools.report(),
+        'job_workers': (job_queue.pool_stats if job_queue else WorkerPoolStats()).report()
+    })
+
+@app.route('/api/stats/storage', methods=['GET'])
+def storage_stats():
+    """Report artifact uploads (count, bytes, retries, failures)"""
+    return jsonify({
+        'status': 'success',
+        'storage': get_storage().stats()
+    })
+
+@app.route('/api/stats/cache', methods=['GET'])
+def cache_stats():
+    """Report reference landmark cache usage"""
+    return jsonify({
+        'status': 'success',
+        'cache': landmark_cache.stats()
+    })
+
 def download_from_firebase(file_path):
     """Download video from Firebase Storage using file path"""
     try:
@@ -84,7 +216,7 @@ def download_from_firebase(file_path):
         temp_file = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
         
         # Get the blob using the file path directly
-        blob = bucket.blob(file_path)
+        blob = get_bucket().blob(file_path)
         
         if not blob.exists():
             logger.error(f"File {file_path} not found in Firebase Storage")
@@ -99,16 +231,6 @@ def download_from_firebase(file_path):
         logger.error(f"Error downloading from Firebase: {str(e)}")
         return None
 
-def download_video(url, output_path):
-    """Download video from URL to local path"""
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-    
-    with open(output_path, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
-    return output_path
-
 @app.route('/api/train', methods=['POST'])
 def train_endpoint():
     try:
@@ -122,116 +244,229 @@ def train_endpoint():
                 'error': 'No JSON data provided'
             }), 400
         
-        logger.info(f"Processing request for user: {json_data.get('userId')}")
+        from training import run_training
+        response = run_training(json_data, get_storage(), landmark_cache)
+        if response['status'] != 'success':
+            return jsonify(response), 500
+        return jsonify(response)
+            
+    except Exception as e:
+        logger.error(f"Error in train_endpoint: {str(e)}", exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'error': str(e)
+        }), 500
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue a training job (same body as /api/train) and return its id right away"""
+    json_data = request.get_json()
+    if not json_data:
+        return jsonify({
+            'status': 'error',
+            'error': 'No JSON data provided'
+        }), 400
+    
+    try:
+        job_id = get_job_queue().submit(json_data)
+    except QueueFullError as e:
+        logger.warning(str(e))
+        return jsonify({
+            'status': 'error',
+            'error': str(e),
+            'queue': get_job_queue().stats()
+        }), 503
+    
+    logger.info(f"Queued job {job_id} for user: {json_data.get('userId')}")
+    return jsonify({
+        'status': 'success',
+        'jobId': job_id,
+        'queue': get_job_queue().stats()
+    }), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Poll a job's status, progress and (once finished) its result"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({
+            'status': 'error',
+            'error': f'Unknown job: {job_id}'
+        }), 404
+    return jsonify({
+        'status': 'success',
+        'job': job
+    })
+
+@app.route('/api/stats/jobs', methods=['GET'])
+def job_stats():
+    """Report worker count, running jobs and queue depth"""
+    return jsonify({
+        'status': 'success',
+        'queue': get_job_queue().stats()
+    })
+
+@app.route('/api/graphs/<graph_id>', methods=['GET'])
+def graph_status_endpoint(graph_id):
+    """Poll a similarity graph requested from /api/train; its URL is given once it has been uploaded"""
+    from training import graph_status
+    graph = graph_status(graph_id)
+    if graph is None:
+        return jsonify({
+            'status': 'error',
+            'error': f'Unknown graph: {graph_id}'
+        }), 404
+    return jsonify({
+        'status': 'success',
+        'graph': graph
+    })
+
+@app.route('/api/render', methods=['POST'])
+def render_endpoint():
+    """Render and upload an annotated video on demand from landmarks stored by /api/train"""
+    from train import render_annotated_video, landmarks_path_for
+    from downloads import download_video
+    try:
+        json_data = request.get_json()
+        if not json_data:
+            return jsonify({
+                'status': 'error',
+                'error': 'No JSON data provided'
+            }), 400
+        
+        user_id = json_data['userId']
+        kind = json_data.get('video', 'user')
+        if kind not in ('user', 'reference'):
+            return jsonify({
+                'status': 'error',
+                'error': "video must be 'user' or 'reference'"
+            }), 400
+        
+        landmarks_path = landmarks_path_for(user_id, kind, json_data.get('timestamp', 'default'))
+        if not os.path.exists(landmarks_path):
+            return jsonify({
+                'status': 'error',
+                'error': 'No stored landmarks for this video'
+            }), 404
+        landmarks_data = load_landmark_arrays(landmarks_path)
+        if landmarks_data.image_landmarks is None:
+            return jsonify({
+                'status': 'error',
+                'error': 'Stored landmarks have no image landmarks to render from; process the video again'
+            }), 409
         
-        # Create temporary directory for processing
         with tempfile.TemporaryDirectory() as temp_dir:
-            logger.info(f"Created temporary directory: {temp_dir}")
-            
-            # Download videos
-            user_video_path = os.path.join(temp_dir, 'user_video.mp4')
-            ref_video_path = os.path.join(temp_dir, 'reference_video.mp4')
-            
-            logger.info("Downloading user video...")
-            download_video(json_data['userVideo']['videoUrl'], user_video_path)
-            logger.info("Downloading reference video...")
-            download_video(json_data['referenceVideo']['videoUrl'], ref_video_path)
-            
-            # Update file paths in JSON data
-            json_data['userVideo']['filePath'] = user_video_path
-            json_data['referenceVideo']['filePath'] = ref_video_path
-            
-            # Process videos and generate landmarks
-            logger.info("Processing videos and generating landmarks...")
-            processing_result = process_and_upload_comparison(json_data, bucket)
-            
-            if processing_result['status'] != 'success':
-                logger.error(f"Processing failed: {processing_result.get('error')}")
-                return jsonify(processing_result), 500
-            
-            # Get paths to landmark files
-            user_landmarks = processing_result['results']['userVideo']['landmarksPath']
-            ref_landmarks = processing_result['results']['referenceVideo']['landmarksPath']
-            
-            logger.info(f"User landmarks path: {user_landmarks}")
-            logger.info(f"Reference landmarks path: {ref_landmarks}")
+            video_path = os.path.join(temp_dir, f'{kind}_video.mp4')
+            output_path = os.path.join(temp_dir, f'processed_{kind}_{user_id}.mp4')
             
-            # Create comparison output directory
-            comparison_dir = os.path.join(processing_result['outputDirectory'], 'comparison')
-            os.makedirs(comparison_dir, exist_ok=True)
-            
-            # Compare landmarks
-            logger.info("Comparing landmarks...")
-            try:
-                comparison_results = compare_videos(
-                    user_landmarks,
-                    ref_landmarks,
-                    output_dir=comparison_dir
-                )
-                logger.info("Landmark comparison completed successfully")
-            except Exception as e:
-                logger.error(f"Error during landmark comparison: {str(e)}")
-                raise
-            
-            # Upload comparison results to Firebase Storage
-            try:
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                comparison_path = f'comparison_results/{json_data["userId"]}/{timestamp}'
-                
-                logger.info("Uploading comparison results to Firebase...")
-                
-                # Upload comparison graph
-                graph_blob = bucket.blob(f'{comparison_path}/similarity_graph.png')
-                graph_blob.upload_from_filename(os.path.join(comparison_dir, 'similarity_graph.png'))
-                graph_blob.make_public()
-                
-                # Upload detailed results JSON
-                results_blob = bucket.blob(f'{comparison_path}/comparison_results.json')
-                results_blob.upload_from_filename(os.path.join(comparison_dir, 'comparison_results.json'))
-                results_blob.make_public()
-                
-                logger.info("Successfully uploaded comparison results to Firebase")
-                
-            except Exception as e:
-                logger.error(f"Error uploading comparison results: {str(e)}")
-                raise
-            
-            # Prepare response
-            response = {
-                'status': 'success',
-                'userId': json_data['userId'],
-                'timestamp': timestamp,
-                'comparison': {
-                    'overall_similarity': comparison_results['overall_similarity'],
-                    'timing_alignment': comparison_results['timing_alignment'],
-                    'key_points_analysis': comparison_results['key_points_analysis']
-                },
-                'videos': {
-                    'user': {
-                        'processed': processing_result['results']['userVideo']['processedUrl'],
-                        'landmarks': processing_result['results']['userVideo']['landmarksPath']
-                    },
-                    'reference': {
-                        'processed': processing_result['results']['referenceVideo']['processedUrl'],
-                        'landmarks': processing_result['results']['referenceVideo']['landmarksPath']
-                    }
-                },
-                'artifacts': {
-                    'similarity_graph': graph_blob.public_url,
-                    'detailed_results': results_blob.public_url
-                }
-            }
-            
-            logger.info("Successfully prepared response")
-            return jsonify(response)
+            logger.info(f"Rendering {kind} video for user {user_id}")
+            download_video(json_data['videoUrl'], video_path)
+            render_annotated_video(video_path, landmarks_data, output_path)
             
+            processed_url = get_storage().upload(output_path, f'processed_videos/{user_id}/{kind}_video.mp4',
+                                                 'video/mp4')
+        
+        return jsonify({
+            'status': 'success',
+            'userId': user_id,
+            'video': kind,
+            'processedUrl': processed_url
+        })
+    
     except Exception as e:
-        logger.error(f"Error in train_endpoint: {str(e)}", exc_info=True)
+        logger.error(f"Error in render_endpoint: {str(e)}", exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'error': str(e)
+        }), 500
+
+@app.route('/api/references/nearest', methods=['POST'])
+def nearest_references_endpoint():
+    """Suggest the reference videos closest to a user video whose landmarks /api/train stored"""
+    from train import landmarks_path_for
+    from reference_index import nearest_references, MAX_NEAREST_K
+    try:
+        json_data = request.get_json()
+        if not json_data:
+            return jsonify({
+                'status': 'error',
+                'error': 'No JSON data provided'
+            }), 400
+        
+        user_id = json_data['userId']
+        k = json_data.get('k', 5)
+        if not isinstance(k, int) or isinstance(k, bool) or k < 1:
+            return jsonify({
+                'status': 'error',
+                'error': 'k must be a positive integer'
+            }), 400
+        landmarks_path = landmarks_path_for(user_id, 'user', json_data.get('timestamp', 'default'))
+        if not os.path.exists(landmarks_path):
+            return jsonify({
+                'status': 'error',
+                'error': 'No stored landmarks for this video'
+            }), 404
+        
+        candidates = nearest_references(
+            load_landmark_arrays(landmarks_path),
+            get_reference_index(),
+            # Every candidate may be re-ranked with full DTW on this request thread
+            k=min(k, MAX_NEAREST_K),
+            exact=json_data.get('exact', True)
+        )
+        references = []
+        for candidate in candidates:
+            reference = {'id': candidate['id'], 'embeddingSimilarity': candidate['embedding_similarity']}
+            if 'comparison' in candidate:
+                reference['overallSimilarity'] = candidate['comparison']['overall_similarity']
+                reference['timingAlignment'] = candidate['comparison']['timing_alignment']
+            references.append(reference)
+        
+        return jsonify({
+            'status': 'success',
+            'userId': user_id,
+            'references': references
+        })
+    
+    except Exception as e:
+        logger.error(f"Error in nearest_references_endpoint: {str(e)}", exc_info=True)
         return jsonify({
             'status': 'error',
             'error': str(e)
         }), 500
 
+@sock.route('/ws/score')
+def score_stream(ws):
+    """
+    Live scoring over a WebSocket
+
+    The client opens with {"referenceId": ...}, then sends one
+    {"landmarks": [...]} message per frame (null when no pose was found) and
+    gets that frame's scores back; {"type": "end"} returns the final summary.
+    """
+    from streaming import StreamingScorer
+    try:
+        init = json.loads(ws.receive())
+        scorer = StreamingScorer(get_streaming_reference(init['referenceId']))
+    except Exception as e:
+        logger.error(f"Error starting score stream: {str(e)}")
+        ws.send(json.dumps({'status': 'error', 'error': str(e)}))
+        return
+    ws.send(json.dumps({'status': 'ready', 'referenceFrames': len(scorer.reference)}))
+    
+    while True:
+        message = ws.receive()
+        if message is None:
+            break
+        try:
+            data = json.loads(message)
+            if data.get('type') == 'end':
+                ws.send(json.dumps({'status': 'done', 'frames': scorer.frames, 'summary': scorer.running()}))
+                break
+            ws.send(json.dumps(scorer.push(data.get('landmarks'))))
+        except Exception as e:
+            ws.send(json.dumps({'status': 'error', 'error': str(e)}))
+
 @app.errorhandler(404)
 def not_found(e):
     return jsonify({
@@ -0,0 +1,155 @@
+"""
+Incremental scoring of a live pose stream against a reference
+
+StreamingScorer takes one frame of landmarks at a time and keeps an online
+DTW alignment against the reference: each frame adds one row of the cost
+matrix, restricted to a window of reference frames around the current match,
+so per-frame work and memory are bounded by the window size rather than by
+the length of either sequence.
+"""
+import numpy as np
+
+from body_parts import KEY_POINTS, PART_COLUMNS
+from compare_landmarks import rowwise_cosine_similarity
+from compiled_reference import CompiledReference
+from pose_dtw import NUM_LANDMARKS, frame_features, next_row
+
+DEFAULT_LOOKAHEAD = 90   # reference frames ahead of the current match (3s at 30 fps)
+DEFAULT_LOOKBEHIND = 15  # reference frames behind it that stay reachable
+
+def landmark_vector(landmarks):
+    """
+    (132,) float64 row for one frame, or None when no pose was detected
+
+    Accepts 33 {'x', 'y', 'z', 'visibility'} dicts (as process_video stores
+    them), 33 [x, y, z, visibility] lists, or a flat list of 132 values.
+    """
+    if landmarks is None or len(landmarks) == 0:
+        return None
+    if isinstance(landmarks[0], dict):
+        landmarks = [
+            (lm.get('x', 0), lm.get('y', 0), lm.get('z', 0), lm.get('visibility', 0)) for lm in landmarks
+        ]
+    vector = np.asarray(landmarks, dtype=np.float64).reshape(-1)
+    if vector.shape != (NUM_LANDMARKS * 4,):
+        raise ValueError(f"Expected {NUM_LANDMARKS} landmarks, got {vector.size // 4}")
+    return vector
+
+
+class StreamingReference:
+    """
+    Reference side of streaming scoring, prepared once and shared read-only
+    by every session scoring against the same reference
+
+    ref_seq may be a CompiledReference, whose arrays are then used as they are.
+    """
+
+    def __init__(self, ref_seq, visibility_weighted=False):
+        self.visibility_weighted = visibility_weighted
+        if isinstance(ref_seq, CompiledReference):
+            if len(ref_seq) == 0:
+                raise ValueError("Reference has no poses")
+            self.norm = ref_seq.norm
+            self.features, self.features_sq = ref_seq.dtw_features(visibility_weighted)
+            return
+        ref_seq = np.asarray(ref_seq, dtype=np.float64)
+        if len(ref_seq) == 0:
+            raise ValueError("Reference has no poses")
+        self.norm = ref_seq / (np.linalg.norm(ref_seq, axis=1, keepdims=True) + 1e-7)
+        self.features = frame_features(self.norm, visibility_weighted)
+        self.features_sq = np.einsum('ij,ij->i', self.features, self.features)
+
+    def __len__(self):
+        return len(self.norm)
+
+
+class StreamingScorer:
+    """
+    Online DTW alignment and running scores for one live session
+
+    push() one frame at a time; each call returns that frame's match in the
+    reference, its overall and per-part similarity, and the running scores
+    so far. Only the previous DTW row and running sums are kept.
+    """
+
+    def __init__(self, reference, lookahead=DEFAULT_LOOKAHEAD, lookbehind=DEFAULT_LOOKBEHIND):
+        if not isinstance(reference, StreamingReference):
+            reference = StreamingReference(reference)
+        self.reference = reference
+        self.lookahead = lookahead
+        self.lookbehind = lookbehind
+        self.frames = 0          # frames received
+        self.scored = 0          # frames with a pose, i.e. DTW rows
+        self.position = 0        # reference frame matched by the last scored frame
+        self._row = None
+        self._row_lo = 0
+        self._similarity_sum = 0.0
+        self._part_sums = dict.fromkeys(KEY_POINTS, 0.0)
+
+    def _window(self):
+        m = len(self.reference)
+        if self._row is None:
+            # The user may start a little into the reference
+            return 0, min(m - 1, self.lookahead)
+        lo = max(self._row_lo, self.position - self.lookbehind)
+        return lo, min(m - 1, max(self.position + self.lookahead, lo))
+
+    def push(self, landmarks):
+        """Score one frame (see landmark_vector for accepted formats)"""
+        frame = self.frames
+        self.frames += 1
+        vector = landmark_vector(landmarks)
+        if vector is None:
+            return {'frame': frame, 'pose': False, 'running': self.running()}
+
+        user_norm = vector / (np.linalg.norm(vector) + 1e-7)
+        features = frame_features(user_norm[None], self.reference.visibility_weighted)[0]
+
+        lo, hi = self._window()
+        columns = np.arange(lo, hi + 1)
+        squared = (features @ features) + self.reference.features_sq[lo:hi + 1] \
+            - 2.0 * (self.reference.features[lo:hi + 1] @ features)
+        cost = np.sqrt(np.maximum(squared, 0.0))
+        if self._row is None:
+            row = cost  # Open beginning: any frame in the first window can be the start
+        else:
+            row, _ = next_row(self._row, self._row_lo, columns, cost)
+        self._row, self._row_lo = row, lo
+        self.position = lo + int(np.argmin(row))
+        self.scored += 1
+
+        ref_row = self.reference.norm[self.position]
+        similarity = float(rowwise_cosine_similarity(user_norm[None], ref_row[None])[0])
+        parts = {}
+        for part, part_columns in PART_COLUMNS.items():
+            parts[part] = float(rowwise_cosine_similarity(
+                user_norm[None, part_columns], ref_row[None, part_columns]
+            )[0])
+            if np.isfinite(parts[part]):
+                self._part_sums[part] += parts[part]
+        if np.isfinite(similarity):
+            self._similarity_sum += similarity
+
+        return {
+            'frame': frame,
+            'pose': True,
+            'ref_frame': self.position,
+            'similarity': similarity,
+            'parts': parts,
+            'running': self.running()
+        }
+
+    def running(self):
+        """Scores over every frame so far, in the shape of calculate_pose_similarity's summary"""
+        if not self.scored:
+            return {'overall_similarity': 0.0, 'timing_alignment': 0.0,
+                    'key_points_analysis': dict.fromkeys(KEY_POINTS, 0.0), 'reference_progress': 0.0}
+        distance = float(self._row[self.position - self._row_lo])
+        # Path length is at least max(i, j) + 1 steps; a mostly diagonal path is close to it
+        path_length = max(self.scored, self.position + 1)
+        return {
+            'overall_similarity': self._similarity_sum / self.scored,
+            'timing_alignment': 1.0 / (1.0 + distance / path_length),
+            'key_points_analysis': {part: total / self.scored for part, total in self._part_sums.items()},
+            'reference_progress': (self.position + 1) / len(self.reference)
+        }
@@ -0,0 +1,53 @@
+"""
+Shared test setup and synthetic landmark data
+
+The helpers are plain functions, imported by the test modules with
+`from conftest import ...`, so the suite doesn't depend on the benchmark
+scripts (which keep their own copies).
+"""
+import os
+import sys
+
+import numpy as np
+
+# Modules in backend/src import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def synthetic_landmarks(num_frames, seed=0, missing_every=17, fps=30):
+    """Landmarks dict shaped like process_video output; every missing_every-th frame has no pose"""
+    rng = np.random.default_rng(seed)
+    values = rng.normal(scale=0.3, size=(num_frames, 33, 4))
+    values[..., 3] = rng.random((num_frames, 33))
+    frames = []
+    for i in range(num_frames):
+        poses = []
+        if i % missing_every:
+            poses.append({'landmarks': [
+                {'x': float(x), 'y': float(y), 'z': float(z), 'visibility': float(v)}
+                for x, y, z, v in values[i]
+            ]})
+        frames.append({'frame_id': i, 'timestamp': i / fps, 'poses': poses})
+    return {'fps': fps, 'frames': frames}
+
+
+def loop_extract(landmarks_data):
+    """The original nested-loop extract_pose_sequence"""
+    sequences = []
+    for frame in landmarks_data.get('frames', []):
+        if frame.get('poses'):
+            landmarks = []
+            for lm in frame['poses'][0].get('landmarks', []):
+                landmarks.extend([
+                    float(lm.get('x', 0)),
+                    float(lm.get('y', 0)),
+                    float(lm.get('z', 0)),
+                    float(lm.get('visibility', 0))
+                ])
+            sequences.append(landmarks)
+    return np.array(sequences, dtype=np.float32)
+
+
+def random_sequences(rng, n, m, d=6):
+    """Two random feature sequences of n and m frames"""
+    return rng.normal(size=(n, d)), rng.normal(size=(m, d))
@@ -0,0 +1,148 @@
+"""
+Regression tests for the vectorized extract_pose_sequence and
+rowwise_cosine_similarity against the per-frame implementations they replaced
+"""
+import warnings
+
+import numpy as np
+import pytest
+from scipy.spatial.distance import cosine
+
+from body_parts import PART_NAMES
+from compare_landmarks import (calculate_pose_similarity, compare_videos, extract_pose_sequence, pose_sequence_from,
+                               rowwise_cosine_similarity)
+from compiled_reference import CompiledReference
+from conftest import synthetic_landmarks, loop_extract
+from landmark_store import from_dict
+from pose_dtw import window_frames
+
+
+def scipy_similarity(a, b):
+    """1 - scipy cosine distance for each pair of rows"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.array([1 - cosine(x, y) for x, y in zip(a, b)])
+
+
+@pytest.mark.parametrize('num_frames', [0, 1, 2, 40, 500])
+def test_extract_pose_sequence_matches_loop(num_frames):
+    # Every 17th frame, starting with the first, has no pose
+    landmarks = synthetic_landmarks(num_frames, seed=num_frames)
+    expected = loop_extract(landmarks)
+    for data in (landmarks, from_dict(landmarks)):
+        sequence = extract_pose_sequence(data, verbose=False)
+        if len(expected):
+            assert sequence.dtype == np.float32
+            assert np.array_equal(sequence, expected)
+        else:
+            assert len(sequence) == 0
+
+
+def test_extract_pose_sequence_zeroes_invalid_values():
+    landmarks = synthetic_landmarks(5, seed=3)
+    landmarks['frames'][1]['poses'][0]['landmarks'][2]['x'] = 'bad'
+    sequence = extract_pose_sequence(landmarks, verbose=False)
+    assert sequence[0, 8:12].tolist() == [0.0, 0.0, 0.0, 0.0]
+    other_rows = np.delete(np.arange(len(sequence)), 0)
+    assert np.array_equal(sequence[other_rows], loop_extract(synthetic_landmarks(5, seed=3))[other_rows])
+
+
+def test_rowwise_cosine_similarity_matches_scipy():
+    rng = np.random.default_rng(0)
+    # float64 rows: scipy keeps float32 input in float32, the vectorized version doesn't
+    a = rng.normal(size=(200, 132))
+    b = rng.normal(size=(200, 132))
+    b[:10] = a[:10]   # identical rows: similarity 1
+    b[10:20] = -a[10:20]  # opposite rows: similarity -1
+    np.testing.assert_allclose(rowwise_cosine_similarity(a, b), scipy_similarity(a, b), rtol=1e-9, atol=1e-12)
+
+
+def test_rowwise_cosine_similarity_zero_and_non_finite_rows():
+    rng = np.random.default_rng(1)
+    a = rng.normal(size=(5, 132))
+    b = rng.normal(size=(5, 132))
+    b[1] = 0.0          # zero row
+    b[2, 7] = np.nan    # non-finite rows
+    a[3, 0] = np.inf
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')  # No divide-by-zero or invalid-value warnings leak out
+        similarities = rowwise_cosine_similarity(a, b)
+    expected = scipy_similarity(a, b)
+    assert not np.isfinite(similarities[1:4]).any()
+    assert not np.isfinite(expected[1:4]).any()
+    np.testing.assert_allclose(similarities[[0, 4]], expected[[0, 4]], rtol=1e-9)
+
+
+def dropout_landmarks(num_frames=300, missing=range(60, 240), seed=0):
+    """A 30 fps clip whose pose is lost for the given frames"""
+    # Generated with one frame too many: synthetic_landmarks' first frame has no pose
+    landmarks = synthetic_landmarks(num_frames + 1, seed=seed, missing_every=num_frames + 1)
+    landmarks['frames'] = landmarks['frames'][1:]
+    for i, frame in enumerate(landmarks['frames']):
+        frame.update(frame_id=i, timestamp=i / landmarks['fps'])
+    for i in missing:
+        landmarks['frames'][i]['poses'] = []
+    return landmarks
+
+
+@pytest.mark.parametrize('convert', [lambda data: data, from_dict], ids=['dict', 'arrays'])
+def test_pose_sequence_from_returns_source_frames(convert):
+    landmarks = convert(dropout_landmarks())
+    seq, frames = pose_sequence_from(landmarks, verbose=False, with_frames=True)
+    assert len(seq) == len(frames) == 120
+    assert frames.tolist() == list(range(60)) + list(range(240, 300))
+
+
+def test_part_timelines_count_video_frames_across_a_pose_dropout():
+    user = dropout_landmarks(seed=1)
+    comparison = compare_videos(user, synthetic_landmarks(300, seed=2), timeline_seconds=1.0)
+    timelines = comparison['part_timelines']
+    assert timelines['window_seconds'] == 1.0
+    assert timelines['window_frames'] == 30
+    # Ten one-second windows; the six spanning frames 60-239 had no pose to score
+    assert len(timelines['overall']) == 10
+    assert [value is None for value in timelines['overall']] == [False] * 2 + [True] * 6 + [False] * 2
+    for part_name in PART_NAMES:
+        assert len(timelines[part_name]) == 10
+
+
+def test_similarity_series_uses_video_frames_across_a_pose_dropout():
+    comparison = compare_videos(dropout_landmarks(seed=1), synthetic_landmarks(300, seed=2))
+    present = set(range(60)) | set(range(240, 300))
+    series = comparison['similarity_series']
+    assert max(series['frames']) == 299
+    assert set(series['frames']) <= present
+    assert series['frames'] == sorted(series['frames'])
+    assert {f['frame'] for f in comparison['frame_by_frame']} == present
+
+
+def test_reference_window_reports_video_frames_and_seconds(tmp_path):
+    reference = dropout_landmarks(seed=3)
+    # The user repeats reference frames 250-289, which come after the dropout
+    user = {'fps': 30, 'frames': [dict(frame, frame_id=i, timestamp=i / 30)
+                                  for i, frame in enumerate(reference['frames'][250:290])]}
+    expected = {'start_frame': 250, 'end_frame': 289, 'frames': 40,
+                'start_seconds': round(250 / 30, 3), 'end_seconds': round(289 / 30, 3)}
+
+    comparison = compare_videos(user, reference, subsequence=True)
+    assert comparison['reference_window'] == expected
+    assert {f['ref_frame'] for f in comparison['frame_by_frame']} == set(range(250, 290))
+
+    # A compiled reference keeps the source frames and frame rate
+    ref_seq, ref_frames = pose_sequence_from(reference, verbose=False, with_frames=True)
+    path = str(tmp_path / 'reference.ref.npz')
+    CompiledReference.compile(ref_seq, frames=ref_frames, fps=30).save(path)
+    assert compare_videos(user, path, subsequence=True)['reference_window'] == expected
+
+
+def test_dtw_band_spans_seconds_of_the_reference():
+    user_seq = pose_sequence_from(synthetic_landmarks(400, seed=1))
+    ref_seq = pose_sequence_from(synthetic_landmarks(400, seed=2))
+
+    def window(**kwargs):
+        return calculate_pose_similarity(user_seq, ref_seq, verbose=False, **kwargs)['dtw']['window']
+
+    assert window(ref_fps=30) == window_frames(fps=30)
+    assert window(ref_fps=60) == window_frames(fps=60)
+    assert window(ref_fps=60, dtw_window_seconds=0.5) == 30
+    assert window(ref_fps=60, dtw_window=12, dtw_window_seconds=0.5) == 12
@@ -0,0 +1,87 @@
+"""
+Filling the frames skipped by FrameSampler
+"""
+import numpy as np
+import pytest
+
+from frame_sampling import FrameSampler, fill_skipped_frames
+
+FPS = 30
+
+
+def detected(frame_id, value=None, image_value=None):
+    """A detected frame whose landmarks all equal value (no pose if value is None)"""
+    poses = []
+    if value is not None:
+        poses.append({'landmarks': [{'x': value, 'y': -value, 'z': 2 * value, 'visibility': 1.0}] * 33})
+    frame = {'frame_id': frame_id, 'timestamp': frame_id / FPS, 'poses': poses}
+    if image_value is not None:
+        frame['image_landmarks'] = [[image_value, image_value, 1.0]] * 33 if poses else []
+    return frame
+
+
+def xs(frame):
+    return [lm['x'] for lm in frame['poses'][0]['landmarks']]
+
+
+def test_interpolates_between_two_detected_frames():
+    frames = [detected(0, 0.0, image_value=0.0), detected(4, 1.0, image_value=0.4)]
+    filled = fill_skipped_frames(frames, 5, FPS)
+
+    assert [frame['frame_id'] for frame in filled] == [0, 1, 2, 3, 4]
+    assert filled[0] is frames[0] and filled[4] is frames[1]
+    for frame_id in (1, 2, 3):
+        frame = filled[frame_id]
+        assert frame['interpolated']
+        assert frame['timestamp'] == pytest.approx(frame_id / FPS)
+        assert xs(frame) == pytest.approx([frame_id / 4] * 33)
+        landmark = frame['poses'][0]['landmarks'][0]
+        assert landmark['y'] == pytest.approx(-frame_id / 4)
+        assert landmark['z'] == pytest.approx(frame_id / 2)
+        assert landmark['visibility'] == pytest.approx(1.0)
+        assert np.allclose(frame['image_landmarks'], [[frame_id / 10, frame_id / 10, 1.0]] * 33)
+    # The detected frames' own landmarks are left alone
+    assert xs(frames[0]) == [0.0] * 33
+
+
+def test_trailing_gap_repeats_the_last_detection():
+    frames = [detected(0, 0.0), detected(3, 1.0)]
+    filled = fill_skipped_frames(frames, 7, FPS)
+
+    assert [frame['frame_id'] for frame in filled] == list(range(7))
+    for frame in filled[4:]:
+        assert frame['interpolated']
+        assert frame['poses'] is frames[1]['poses']
+
+
+def test_leading_gap_repeats_the_first_detection():
+    frames = [detected(2, 0.5), detected(4, 1.0)]
+    filled = fill_skipped_frames(frames, 5, FPS)
+
+    assert [frame['frame_id'] for frame in filled] == list(range(5))
+    for frame in filled[:2]:
+        assert frame['interpolated']
+        assert frame['poses'] is frames[0]['poses']
+    assert xs(filled[3]) == pytest.approx([0.75] * 33)
+
+
+@pytest.mark.parametrize('values', [(None, 1.0), (1.0, None)])
+def test_gap_next_to_a_frame_without_a_pose_is_not_interpolated(values):
+    frames = [detected(0, values[0], image_value=0.5), detected(4, values[1], image_value=0.5)]
+    filled = fill_skipped_frames(frames, 5, FPS)
+
+    # Each filler copies the nearer detected frame, pose or no pose
+    for frame_id, nearest in ((1, frames[0]), (2, frames[1]), (3, frames[1])):
+        assert filled[frame_id]['poses'] is nearest['poses']
+        assert filled[frame_id]['image_landmarks'] is nearest['image_landmarks']
+
+
+def test_no_detections_stay_empty():
+    assert fill_skipped_frames([], 10, FPS) == []
+
+
+def test_sampler_takes_every_stride_frame():
+    sampler = FrameSampler(60, target_fps=15)
+    taken = [frame_id for frame_id in range(20) if sampler.take(frame_id)]
+    assert sampler.active
+    assert taken == [0, 4, 8, 12, 16]
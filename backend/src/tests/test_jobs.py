@@ -0,0 +1,100 @@
+"""
+JobStore owner tracking: failing the jobs of exited server processes on startup
+"""
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from jobs import STATUS_FAILED, STATUS_QUEUED, STATUS_RUNNING, STATUS_SUCCEEDED, JobStore, current_owner
+
+REASON = 'Server restarted before the job finished'
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.sqlite3'))
+
+
+@pytest.fixture(scope='module')
+def dead_pid():
+    """The pid of a process that has exited (and been reaped)"""
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def add_job(store, job_id, status, host, pid, boot):
+    with sqlite3.connect(store.path) as conn:
+        conn.execute(
+            'INSERT INTO jobs (id, status, submitted_at, owner_host, owner_pid, owner_boot) VALUES (?, ?, 0, ?, ?, ?)',
+            (job_id, status, host, pid, boot)
+        )
+
+
+def test_jobs_of_a_live_owner_are_kept(store):
+    store.create('mine')
+    add_job(store, 'other-host', STATUS_RUNNING, 'some-other-host', 1, 'boot')
+
+    assert store.fail_orphaned(REASON) == 0
+    assert store.get('mine')['status'] == STATUS_QUEUED
+    assert store.get('mine')['owner_pid'] == current_owner()[1]
+    assert store.get('other-host')['status'] == STATUS_RUNNING
+
+
+def test_jobs_of_exited_owners_are_failed(store, dead_pid):
+    host, _, boot = current_owner()
+    add_job(store, 'dead-queued', STATUS_QUEUED, host, dead_pid, boot)
+    add_job(store, 'dead-running', STATUS_RUNNING, host, dead_pid, boot)
+    add_job(store, 'before-reboot', STATUS_RUNNING, host, current_owner()[1], 'an earlier boot')
+    add_job(store, 'dead-finished', STATUS_SUCCEEDED, host, dead_pid, boot)
+    store.create('mine')
+
+    assert store.fail_orphaned(REASON) == 3
+    for job_id in ('dead-queued', 'dead-running', 'before-reboot'):
+        job = store.get(job_id)
+        assert job['status'] == STATUS_FAILED
+        assert job['error'] == REASON
+        assert job['finished_at'] is not None
+    assert store.get('dead-finished')['status'] == STATUS_SUCCEEDED
+    assert store.get('mine')['status'] == STATUS_QUEUED
+
+
+def test_legacy_database_gains_owner_columns(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    with sqlite3.connect(path) as conn:
+        conn.execute('''
+            CREATE TABLE jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                stage TEXT,
+                progress REAL NOT NULL DEFAULT 0,
+                submitted_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                user_id TEXT,
+                result TEXT,
+                error TEXT
+            )
+        ''')
+        conn.execute("INSERT INTO jobs (id, status, submitted_at) VALUES ('legacy-queued', 'queued', 0)")
+        conn.execute("INSERT INTO jobs (id, status, submitted_at) VALUES ('legacy-running', 'running', 0)")
+        conn.execute("INSERT INTO jobs (id, status, submitted_at) VALUES ('legacy-done', 'succeeded', 0)")
+
+    store = JobStore(path)
+    with sqlite3.connect(path) as conn:
+        columns = {row[1]: row[2] for row in conn.execute('PRAGMA table_info(jobs)')}
+    assert columns['owner_host'] == 'TEXT'
+    assert columns['owner_pid'] == 'INTEGER'
+    assert columns['owner_boot'] == 'TEXT'
+
+    # Rows from before owner tracking have no owner, so nothing can still be running them
+    assert store.fail_orphaned(REASON) == 2
+    assert store.get('legacy-queued')['status'] == STATUS_FAILED
+    assert store.get('legacy-running')['status'] == STATUS_FAILED
+    assert store.get('legacy-done')['status'] == STATUS_SUCCEEDED
+
+    # Opening the migrated database again is a no-op
+    JobStore(path).create('new')
+    assert store.get('new')['owner_host'] == current_owner()[0]
@@ -0,0 +1,126 @@
+"""
+Landmark .npz storage: dict conversion, memory-mapped loading and its fallbacks
+"""
+import io
+import os
+import zipfile
+
+import numpy as np
+import pytest
+
+from conftest import synthetic_landmarks
+from landmark_store import (from_dict, is_landmark_arrays_path, load_landmark_arrays, load_npz,
+                            save_landmark_arrays, write_atomic)
+
+
+def assert_same_arrays(actual, expected):
+    np.testing.assert_array_equal(actual.landmarks, expected.landmarks)
+    np.testing.assert_array_equal(actual.present, expected.present)
+    np.testing.assert_array_equal(actual.timestamps, expected.timestamps)
+    assert actual.meta == expected.meta
+    if expected.image_landmarks is None:
+        assert actual.image_landmarks is None
+    else:
+        np.testing.assert_array_equal(actual.image_landmarks, expected.image_landmarks)
+
+
+def with_image_landmarks(landmarks_data):
+    for frame in landmarks_data['frames']:
+        frame['image_landmarks'] = [[0.5, 0.25, 1.0]] * 33 if frame['poses'] else []
+    return landmarks_data
+
+
+def write_stored_npz(path, members, extra=b''):
+    """An uncompressed .npz written member by member, with an extra field on every local header"""
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, value in members.items():
+            buffer = io.BytesIO()
+            np.lib.format.write_array(buffer, np.asanyarray(value))
+            info = zipfile.ZipInfo(f'{name}.npy')
+            info.compress_type = zipfile.ZIP_STORED
+            info.extra = extra
+            archive.writestr(info, buffer.getvalue())
+
+
+@pytest.mark.parametrize('image_landmarks', [False, True])
+def test_dict_round_trip(image_landmarks):
+    landmarks_data = synthetic_landmarks(40)
+    if image_landmarks:
+        landmarks_data = with_image_landmarks(landmarks_data)
+    arrays = from_dict(landmarks_data)
+    rebuilt = arrays.to_dict()
+
+    assert [frame['frame_id'] for frame in rebuilt['frames']] == list(range(40))
+    assert [len(frame['poses']) for frame in rebuilt['frames']] == \
+        [len(frame['poses']) for frame in landmarks_data['frames']]
+    assert rebuilt['fps'] == landmarks_data['fps']
+    assert_same_arrays(from_dict(rebuilt), arrays)
+
+
+def test_memmap_load_matches_np_load(tmp_path):
+    path = str(tmp_path / 'video.npz')
+    save_landmark_arrays(path, with_image_landmarks(synthetic_landmarks(50)))
+
+    arrays = load_landmark_arrays(path)
+    assert isinstance(arrays.landmarks, np.memmap)
+    assert isinstance(arrays.image_landmarks, np.memmap)
+    with np.load(path) as npz:
+        for name in ('landmarks', 'present', 'timestamps', 'image_landmarks'):
+            np.testing.assert_array_equal(getattr(arrays, name), npz[name])
+    assert_same_arrays(arrays, load_landmark_arrays(path, mmap=False))
+
+
+def test_compressed_members_fall_back_to_np_load(tmp_path):
+    expected = from_dict(synthetic_landmarks(30))
+    path = str(tmp_path / 'compressed.npz')
+    stored = str(tmp_path / 'stored.npz')
+    save_landmark_arrays(stored, expected)
+    with np.load(stored) as npz:
+        np.savez_compressed(path, **{name: npz[name] for name in npz.files})
+
+    arrays = load_landmark_arrays(path)
+    assert not isinstance(arrays.landmarks, np.memmap)
+    assert_same_arrays(arrays, expected)
+
+
+def test_members_with_an_extra_field_are_mapped_past_it(tmp_path):
+    path = str(tmp_path / 'extra.npz')
+    members = {
+        'landmarks': np.arange(24, dtype=np.float32).reshape(2, 3, 4),
+        'fortran': np.asfortranarray(np.arange(12, dtype=np.float64).reshape(3, 4)),
+        'empty': np.zeros((0, 4), dtype=np.float32),
+    }
+    # A 4-byte field of an unassigned header id, as zip tools may add
+    write_stored_npz(path, members, extra=b'\xfe\xca\x04\x00abcd')
+
+    arrays = load_npz(path)
+    assert isinstance(arrays['landmarks'], np.memmap)
+    for name, value in members.items():
+        np.testing.assert_array_equal(arrays[name], value)
+    assert arrays['empty'].shape == (0, 4)
+
+
+def test_write_atomic_keeps_the_old_file_on_failure(tmp_path):
+    path = str(tmp_path / 'video.npz')
+    save_landmark_arrays(path, synthetic_landmarks(10))
+    before = open(path, 'rb').read()
+
+    def fail(temp_path):
+        with open(temp_path, 'wb') as f:
+            f.write(b'partial')
+        raise OSError('disk full')
+
+    with pytest.raises(OSError):
+        write_atomic(path, fail)
+    assert open(path, 'rb').read() == before
+    assert os.listdir(str(tmp_path)) == ['video.npz']
+
+
+@pytest.mark.parametrize('path, expected', [
+    ('video.npz', True),
+    ('reference.ref.npz', True),
+    ('video.json', False),
+    ('landmarks/video.npz.json', False),
+])
+def test_is_landmark_arrays_path(path, expected):
+    assert is_landmark_arrays_path(path) is expected
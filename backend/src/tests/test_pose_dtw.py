@@ -0,0 +1,139 @@
+"""
+Banded and subsequence DTW against a brute-force O(n * m) cost matrix
+"""
+import numpy as np
+import pytest
+
+from conftest import random_sequences
+from pose_dtw import DEFAULT_WINDOW_SECONDS, band_limits, dtw_align, subsequence_align, window_frames
+
+
+def frame_distances(x, y):
+    return np.linalg.norm(x[:, None, :] - y[None, :, :], axis=2)
+
+
+def brute_force_dtw(x, y, lo=None, hi=None, open_begin=False):
+    """Cumulative cost matrix by the textbook recurrence; cells outside [lo, hi] are inf"""
+    cost = frame_distances(x, y)
+    n, m = cost.shape
+    if lo is not None:
+        columns = np.arange(m)
+        cost = np.where((columns >= lo[:, None]) & (columns <= hi[:, None]), cost, np.inf)
+    total = np.full((n, m), np.inf)
+    for i in range(n):
+        for j in range(m):
+            if i == 0:
+                total[i, j] = cost[i, j] if open_begin or j == 0 else total[i, j - 1] + cost[i, j]
+                continue
+            best = min(total[i - 1, j], total[i - 1, j - 1] if j else np.inf, total[i, j - 1] if j else np.inf)
+            total[i, j] = best + cost[i, j]
+    return total
+
+
+def check_path(result, x, y, start=None, end=None):
+    """The path is a valid warping path whose frame distances sum to result.distance"""
+    path = result.path
+    steps = np.diff(path, axis=0)
+    assert ((steps == [1, 0]) | (steps == [0, 1]) | (steps == [1, 1])).all(axis=1).all()
+    assert path[0, 0] == 0 and path[-1, 0] == len(x) - 1
+    if start is not None:
+        assert path[0, 1] == start
+    if end is not None:
+        assert path[-1, 1] == end
+    path_cost = frame_distances(x, y)[path[:, 0], path[:, 1]].sum()
+    assert path_cost == pytest.approx(result.distance, rel=1e-9, abs=1e-9)
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_dtw_align_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    n, m = rng.integers(1, 150, size=2)
+    x, y = random_sequences(rng, n, m)
+    window = int(rng.integers(1, max(n, m) + 1))
+    result = dtw_align(x, y, window)
+
+    lo, hi, _ = band_limits(n, m, window)
+    expected = brute_force_dtw(x, y, lo, hi)[-1, -1]
+    assert result.distance == pytest.approx(expected, rel=1e-9)
+    check_path(result, x, y, start=0, end=m - 1)
+    assert (result.path[:, 1] >= lo[result.path[:, 0]]).all()
+    assert (result.path[:, 1] <= hi[result.path[:, 0]]).all()
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_dtw_align_full_window_is_unconstrained_dtw(seed):
+    rng = np.random.default_rng(100 + seed)
+    n, m = rng.integers(1, 90, size=2)
+    x, y = random_sequences(rng, n, m)
+    result = dtw_align(x, y, window=max(n, m))
+    assert result.distance == pytest.approx(brute_force_dtw(x, y)[-1, -1], rel=1e-9)
+    check_path(result, x, y, start=0, end=m - 1)
+
+
+@pytest.mark.parametrize('n, m', [(1, 1), (1, 7), (7, 1), (1, 130), (130, 1)])
+def test_dtw_align_single_row_or_column(n, m):
+    rng = np.random.default_rng(n * 1000 + m)
+    x, y = random_sequences(rng, n, m)
+    result = dtw_align(x, y, window=1)
+    # With a single row or column every cell lies on the only path
+    assert result.distance == pytest.approx(frame_distances(x, y).sum(), rel=1e-9)
+    assert len(result.path) == max(n, m)
+    check_path(result, x, y, start=0, end=m - 1)
+
+
+@pytest.mark.parametrize('n', [200, 2000])
+def test_dtw_align_default_window_is_fixed_in_seconds(n):
+    rng = np.random.default_rng(n)
+    x, y = random_sequences(rng, n, n)
+    # The band doesn't grow with the sequences, so long videos stay O(n)
+    assert dtw_align(x, y).window == window_frames() == round(DEFAULT_WINDOW_SECONDS * 30)
+    assert dtw_align(x, y, fps=60).window == window_frames(fps=60) == round(DEFAULT_WINDOW_SECONDS * 60)
+    assert dtw_align(x, y, window=5).window == 5
+
+
+def test_window_frames():
+    assert window_frames(0.5, 60) == 30
+    assert window_frames(0, 30) == 1
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_subsequence_align_matches_brute_force(seed):
+    rng = np.random.default_rng(200 + seed)
+    n, m = rng.integers(1, 100, size=2)
+    x, y = random_sequences(rng, n, m)
+    result = subsequence_align(x, y)
+
+    expected = brute_force_dtw(x, y, open_begin=True)[-1]
+    assert result.distance == pytest.approx(expected.min(), rel=1e-9)
+    check_path(result, x, y, end=int(np.argmin(expected)))
+
+
+@pytest.mark.parametrize('n, m', [(1, 1), (1, 9), (9, 1), (1, 150), (150, 1)])
+def test_subsequence_align_single_row_or_column(n, m):
+    rng = np.random.default_rng(n * 1000 + m + 1)
+    x, y = random_sequences(rng, n, m)
+    result = subsequence_align(x, y)
+    distances = frame_distances(x, y)
+    if n == 1:
+        # One frame matches its single closest frame of y
+        assert result.distance == pytest.approx(distances.min(), rel=1e-9)
+        assert result.path.tolist() == [[0, int(np.argmin(distances))]]
+    else:
+        assert result.distance == pytest.approx(distances.sum(), rel=1e-9)
+    check_path(result, x, y)
+
+
+def test_subsequence_align_finds_embedded_clip():
+    rng = np.random.default_rng(7)
+    y = rng.normal(size=(120, 6))
+    x = y[40:70] + rng.normal(scale=1e-3, size=(30, 6))
+    result = subsequence_align(x, y)
+    assert result.path[0, 1] == 40 and result.path[-1, 1] == 69
+    check_path(result, x, y)
+
+
+def test_empty_sequences_raise():
+    with pytest.raises(ValueError):
+        dtw_align(np.zeros((0, 3)), np.zeros((4, 3)))
+    with pytest.raises(ValueError):
+        subsequence_align(np.zeros((4, 3)), np.zeros((0, 3)))
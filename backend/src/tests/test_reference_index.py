@@ -0,0 +1,49 @@
+"""
+Nearest-reference search: ranking and validation of k
+"""
+import numpy as np
+import pytest
+
+from conftest import synthetic_landmarks
+from compare_landmarks import pose_sequence_from
+from landmark_store import save_landmark_arrays
+from reference_index import ReferenceIndex, nearest_references
+
+
+@pytest.fixture
+def index(tmp_path):
+    paths = []
+    for i in range(20):
+        path = str(tmp_path / f'reference_{i}.npz')
+        save_landmark_arrays(path, synthetic_landmarks(40 + i, seed=i))
+        paths.append(path)
+    return ReferenceIndex.build(paths)
+
+
+def test_search_ranks_the_reference_itself_first(index):
+    user_seq = pose_sequence_from(index.paths[7], verbose=False)
+    results = index.search(user_seq, k=3)
+    assert len(results) == 3
+    assert results[0][0] == 'reference_7'
+    scores = [score for _, _, score in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+@pytest.mark.parametrize('k', [0, -3])
+def test_search_rejects_k_below_one(index, k):
+    user_seq = pose_sequence_from(index.paths[0], verbose=False)
+    with pytest.raises(ValueError):
+        index.search(user_seq, k)
+    with pytest.raises(ValueError):
+        nearest_references(user_seq, index, k=k, exact=False)
+
+
+def test_search_caps_k_at_library_size(index):
+    results = index.search(pose_sequence_from(index.paths[0], verbose=False), k=100)
+    assert len(results) == len(index) == 20
+    assert len({ref_id for ref_id, _, _ in results}) == 20
+
+
+def test_empty_index_returns_nothing():
+    empty = ReferenceIndex(embeddings=np.zeros((0, 132 * 18), dtype=np.float32))
+    assert empty.search(np.ones((5, 132), dtype=np.float32), k=3) == []
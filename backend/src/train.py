@@ -5,64 +5,149 @@ from mediapipe.framework.formats import landmark_pb2
 import numpy as np
 import json
 import mediapipe as mp
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
 import cv2
 import os
 import tempfile
-from firebase_admin import storage
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
+import threading
+import multiprocessing
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from artifact_storage import as_storage
+from pipeline import run_pipeline, bottleneck, max_in_flight
+from frame_preprocess import FramePreprocessor, BufferRing, DETECTION_MAX_SIDE
+from frame_sampling import FrameSampler, fill_skipped_frames
+from landmark_store import (LandmarkArrays, from_dict, save_landmark_arrays, is_landmark_arrays_path,
+                            load_landmark_arrays, persist_in_background)
+from detector_pool import (get_detector_pool, worker_pool_report, WorkerPoolStats, MODEL_ASSET_PATH,
+                           RUNNING_MODE_IMAGE, RUNNING_MODE_VIDEO, PROFILE_SCORING, PROFILE_FULL)
 
+PIPELINE_QUEUE_DEPTH = int(os.environ.get('PIPELINE_QUEUE_DEPTH', '4'))
+VIDEO_WORKERS = int(os.environ.get('VIDEO_WORKERS', '2'))
 
 
-def draw_landmarks_on_image(rgb_image, detection_result):
+
+def _draw_pose(annotated_image, landmarks):
+    """Draw one pose given (x, y, z, visibility) tuples in normalized image coordinates"""
+    pose_landmarks_proto = landmark_pb2.NormalizedLandmarkList()
+    for x, y, z, visibility in landmarks:
+        landmark_proto = pose_landmarks_proto.landmark.add()  # Just call add() without arguments
+        landmark_proto.x = x
+        landmark_proto.y = y
+        landmark_proto.z = z
+        if visibility is not None:
+            landmark_proto.visibility = visibility
+
+    solutions.drawing_utils.draw_landmarks(
+        annotated_image,
+        pose_landmarks_proto,
+        solutions.pose.POSE_CONNECTIONS,
+        solutions.drawing_styles.get_default_pose_landmarks_style())
+
+def draw_landmarks_on_image(rgb_image, detection_result, copy=True):
     pose_landmarks_list = detection_result.pose_landmarks
-    annotated_image = np.copy(rgb_image)
+    annotated_image = np.copy(rgb_image) if copy else rgb_image
 
     # Loop through the detected poses to visualize.
     for idx in range(len(pose_landmarks_list)):
-        pose_landmarks = pose_landmarks_list[idx]
-
-        # Draw the pose landmarks.
-        pose_landmarks_proto = landmark_pb2.NormalizedLandmarkList()
-        for landmark in pose_landmarks:
-            landmark_proto = pose_landmarks_proto.landmark.add()  # Just call add() without arguments
-            landmark_proto.x = landmark.x
-            landmark_proto.y = landmark.y
-            landmark_proto.z = landmark.z
-            if hasattr(landmark, 'visibility'):
-                landmark_proto.visibility = landmark.visibility
-
-        solutions.drawing_utils.draw_landmarks(
-            annotated_image,
-            pose_landmarks_proto,
-            solutions.pose.POSE_CONNECTIONS,
-            solutions.drawing_styles.get_default_pose_landmarks_style())
+        _draw_pose(annotated_image, [
+            (lm.x, lm.y, lm.z, getattr(lm, 'visibility', None))
+            for lm in pose_landmarks_list[idx]
+        ])
     
     return annotated_image
 
+def draw_stored_landmarks(rgb_image, image_landmarks):
+    """Draw a pose stored as [x, y, visibility] triples (the image landmarks process_video records)"""
+    annotated_image = np.copy(rgb_image)
+    if image_landmarks:
+        _draw_pose(annotated_image, [(x, y, 0.0, visibility) for x, y, visibility in image_landmarks])
+    return annotated_image
+
+def image_landmarks(detection_result):
+    """Normalized image coordinates of the first pose, enough to render it later"""
+    if not detection_result.pose_landmarks:
+        return []
+    return [[lm.x, lm.y, lm.visibility] for lm in detection_result.pose_landmarks[0]]
 
+def _crop_region(bbox, orig_width, orig_height):
+    """Clamp a (x, y, width, height) bbox to the frame; the whole frame if bbox is None"""
+    if not bbox:
+        return 0, 0, orig_width, orig_height
+    x, y, width, height = bbox
+    # Ensure bbox stays within video boundaries
+    x = max(0, min(x, orig_width))
+    y = max(0, min(y, orig_height))
+    width = min(width, orig_width - x)
+    height = min(height, orig_height - y)
+    return x, y, width, height
+
+
+
+def frame_landmarks(detection_result, profile=PROFILE_SCORING):
+    """
+    Convert a detection result's world landmarks into JSON-friendly poses
+
+    The 'scoring' profile keeps only the first pose and the x/y/z/visibility
+    values compare_landmarks reads; 'full' keeps every pose with its ids.
+    """
+    poses = []
+    world_landmarks = detection_result.pose_world_landmarks or []
+    if profile == PROFILE_SCORING:
+        world_landmarks = world_landmarks[:1]
+    for pose_idx, pose_landmarks in enumerate(world_landmarks):
+        if profile == PROFILE_SCORING:
+            poses.append({'landmarks': [
+                {'x': lm.x, 'y': lm.y, 'z': lm.z, 'visibility': lm.visibility}
+                for lm in pose_landmarks
+            ]})
+            continue
+        pose_data = {
+            'pose_id': pose_idx,
+            'landmarks': []
+        }
+        for landmark_idx, landmark in enumerate(pose_landmarks):
+            pose_data['landmarks'].append({
+                'landmark_id': landmark_idx,
+                'x': landmark.x,
+                'y': landmark.y,
+                'z': landmark.z,
+                'visibility': landmark.visibility
+            })
+        poses.append(pose_data)
+    return poses
 
-def process_video(video_path, output_path, bbox=None, landmarks_path=None):
+def process_video(video_path, output_path=None, bbox=None, landmarks_path=None,
+                  running_mode=RUNNING_MODE_IMAGE, profile=PROFILE_SCORING, detector_pool=None,
+                  queue_depth=PIPELINE_QUEUE_DEPTH, target_fps=None, adaptive_sampling=False):
     """
     Process video with optional bounding box cropping
+    output_path: where to write the annotated video. If None, only landmarks are
+        extracted (no drawing or encoding). Either way each frame also records
+        its image landmarks so render_annotated_video can produce the video later
     bbox: tuple of (x, y, width, height) in pixels
-    landmarks_path: path where to save the landmarks JSON file
+    landmarks_path: where to save the landmarks; a .npz path uses the compact
+        array format from landmark_store, anything else is written as JSON
+    running_mode: 'image' runs full detection on every frame, 'video' uses
+        detect_for_video so MediaPipe can track the pose between frames
+    profile: 'scoring' detects a single pose without segmentation masks and
+        writes compact landmarks; 'full' keeps all poses and masks for debugging
+    detector_pool: DetectorPool to check a PoseLandmarker out of (defaults to
+        the process-wide pool for running_mode and profile)
+    queue_depth: frames buffered between the decode, inference, annotate and
+        encode stages, which run concurrently in their own threads
+    target_fps: run the landmarker at about this rate instead of on every
+        frame; skipped frames get interpolated landmarks (see frame_sampling)
+    adaptive_sampling: with target_fps, detect more densely while the pose
+        moves quickly
     """
-    # Create PoseLandmarker
-    base_options = python.BaseOptions(model_asset_path='pose_landmarker_lite.task')
-    options = vision.PoseLandmarkerOptions(
-        base_options=base_options,
-        output_segmentation_masks=True,
-        num_poses=5,
-        min_pose_detection_confidence=0.5,
-        min_pose_presence_confidence=0.5,
-        min_tracking_confidence=0.5
-    )
-    detector = vision.PoseLandmarker.create_from_options(options)
-    
+    pool = detector_pool or get_detector_pool(running_mode, profile)
+    with pool.checkout() as detector:
+        return _process_video(detector, video_path, output_path, bbox, landmarks_path, queue_depth,
+                              target_fps, adaptive_sampling)
+
+def _process_video(detector, video_path, output_path, bbox, landmarks_path, queue_depth,
+                   target_fps=None, adaptive_sampling=False):
+    profile = detector.profile
     # Open video file
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
@@ -72,195 +157,447 @@ def process_video(video_path, output_path, bbox=None, landmarks_path=None):
     orig_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     orig_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = int(cap.get(cv2.CAP_PROP_FPS))
+    if fps <= 0:
+        fps = 30  # Some containers don't report a frame rate
     
     # Set output dimensions based on bbox if provided
-    if bbox:
-        x, y, width, height = bbox
-        # Ensure bbox stays within video boundaries
-        x = max(0, min(x, orig_width))
-        y = max(0, min(y, orig_height))
-        width = min(width, orig_width - x)
-        height = min(height, orig_height - y)
-        output_width, output_height = width, height
-    else:
-        output_width, output_height = orig_width, orig_height
-        x, y = 0, 0
-        width, height = orig_width, orig_height
+    x, y, width, height = _crop_region(bbox, orig_width, orig_height)
+    output_width, output_height = width, height
     
-    # Create video writer
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_path, fourcc, fps, (output_width, output_height))
+    # Create video writer unless only landmarks were requested
+    render = output_path is not None
+    out = None
+    if render:
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        out = cv2.VideoWriter(output_path, fourcc, fps, (output_width, output_height))
+    
+    num_stages = 3 if render else 1
+    preprocessor = FramePreprocessor((x, y, width, height), (orig_width, orig_height),
+                                     max_in_flight(num_stages, queue_depth))
     
     world_landmarks_data = {
         'fps': fps,
         'frames': [],
         'bbox': bbox if bbox else None,
         'video_path': video_path,
+        'profile': profile,
         'dimensions': {
             'original': {'width': orig_width, 'height': orig_height},
-            'processed': {'width': output_width, 'height': output_height}
+            'processed': {'width': output_width, 'height': output_height},
+            'detection': {'width': preprocessor.detection_width, 'height': preprocessor.detection_height}
         }
     }
     
+    sampler = FrameSampler(fps, target_fps, adaptive_sampling)
     frame_count = 0
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
+    
+    def decode_frames():
+        nonlocal frame_count
+        while cap.isOpened():
+            sampled = sampler.take(frame_count)
+            if not sampled and not render:
+                # Nothing to detect or draw: advance without converting the frame
+                if not cap.grab():
+                    break
+                frame_count += 1
+                continue
             
-        # Crop frame if bbox provided
-        if bbox:
-            frame = frame[y:y+height, x:x+width]
-        
-        # Convert BGR to RGB
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            # Crop, downscale and convert to RGB into recycled buffers
+            ret, rgb_frame, crop = preprocessor.read(cap)
+            if not ret:
+                break
+            yield frame_count, rgb_frame, crop, sampled
+            frame_count += 1
+    
+    last_result = None
+    
+    def infer(item):
+        nonlocal last_result
+        frame_count, rgb_frame, crop, sampled = item
+        if not sampled:
+            # Skipped frames are still encoded, annotated with the last detection
+            return rgb_frame, crop, last_result
         
-        # Create MediaPipe image
+        # Create MediaPipe image and detect poses
         mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
-        
-        # Detect poses
-        detection_result = detector.detect(mp_image)
+        detection_result = detector.detect(mp_image, int(frame_count * 1000 / fps))
         
         # Store world landmarks for this frame
         frame_data = {
             'frame_id': frame_count,
             'timestamp': frame_count / fps,
-            'poses': []
+            'poses': frame_landmarks(detection_result, profile)
         }
-        
-        if detection_result.pose_world_landmarks:
-            for pose_idx, pose_landmarks in enumerate(detection_result.pose_world_landmarks):
-                pose_data = {
-                    'pose_id': pose_idx,
-                    'landmarks': []
-                }
-                for landmark_idx, landmark in enumerate(pose_landmarks):
-                    pose_data['landmarks'].append({
-                        'landmark_id': landmark_idx,
-                        'x': landmark.x,
-                        'y': landmark.y,
-                        'z': landmark.z,
-                        'visibility': landmark.visibility
-                    })
-                frame_data['poses'].append(pose_data)
-        
+        # Recorded even when rendering, so any stored or cached landmarks can be re-rendered
+        frame_data['image_landmarks'] = image_landmarks(detection_result)
         world_landmarks_data['frames'].append(frame_data)
-        
-        # Draw landmarks on the frame
-        annotated_frame = draw_landmarks_on_image(mp_image.numpy_view(), detection_result)
+        sampler.observe(frame_count, frame_data['poses'])
+        last_result = detection_result
+        return rgb_frame, crop, detection_result
+    
+    annotated_buffers = BufferRing(max_in_flight(num_stages, queue_depth))
+    
+    def annotate(item):
+        rgb_frame, crop, detection_result = item
+        if detection_result is None:
+            return np.ascontiguousarray(crop)
+        # Draw at full resolution; the detection image may have been downscaled.
+        # Either way the buffer drawn on belongs to this frame, so no copy is needed.
+        canvas = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB) if preprocessor.scaled else rgb_frame
+        annotated_frame = draw_landmarks_on_image(canvas, detection_result, copy=False)
         
         # Convert back to BGR for video writing
-        output_frame = cv2.cvtColor(annotated_frame, cv2.COLOR_RGB2BGR)
-        
-        # Write frame
-        out.write(output_frame)
-        
-        frame_count += 1
+        return cv2.cvtColor(annotated_frame, cv2.COLOR_RGB2BGR, dst=annotated_buffers.next(annotated_frame.shape))
     
-    # Release resources
-    cap.release()
-    out.release()
+    stages = [('inference', infer)]
+    if render:
+        stages += [('annotate', annotate), ('encode', out.write)]
     
-    # Save world landmarks to JSON file
-    if landmarks_path:
+    detector.begin_stream()
+    try:
+        stage_timings = run_pipeline(decode_frames(), stages, queue_depth=queue_depth)
+    finally:
+        # Release resources
+        cap.release()
+        if out is not None:
+            out.release()
+    
+    world_landmarks_data['stage_timings'] = stage_timings
+    if sampler.active:
+        world_landmarks_data['frames'] = fill_skipped_frames(world_landmarks_data['frames'], frame_count, fps)
+        world_landmarks_data['sampling'] = sampler.summary(frame_count)
+        print(f"Detected {sampler.detected} of {frame_count} frames (target {target_fps} fps)")
+    print(f"Stage timings: {stage_timings} (bottleneck: {bottleneck(stage_timings)})")
+    
+    # Save world landmarks
+    if landmarks_path and is_landmark_arrays_path(landmarks_path):
+        save_landmark_arrays(landmarks_path, world_landmarks_data)
+    elif landmarks_path:
         with open(landmarks_path, 'w') as f:
-            json.dump(world_landmarks_data, f, indent=2)
+            json.dump(world_landmarks_data, f, indent=2 if profile == PROFILE_FULL else None)
     
-    print(f"Video processing complete. Output saved to {output_path}")
+    if render:
+        print(f"Video processing complete. Output saved to {output_path}")
+    else:
+        print("Landmark extraction complete (annotated video not rendered)")
     if landmarks_path:
         print(f"World landmarks saved to {landmarks_path}")
     
     return world_landmarks_data
 
-def process_and_upload_comparison(json_data, bucket):
+def render_annotated_video(video_path, landmarks_data, output_path, queue_depth=PIPELINE_QUEUE_DEPTH):
+    """
+    Render the annotated video from stored landmarks instead of re-running detection
+
+    landmarks_data (a landmarks dict or LandmarkArrays) must come from
+    process_video, which records each frame's image landmarks alongside the
+    world landmarks.
+    """
+    if not isinstance(landmarks_data, LandmarkArrays):
+        landmarks_data = from_dict(landmarks_data)
+    if landmarks_data.image_landmarks is None:
+        raise ValueError("Landmarks were saved without image landmarks; run process_video on the video again")
+    image_points = landmarks_data.image_landmarks
+    has_pose = landmarks_data.present[:, 0] if landmarks_data.present.shape[1] else np.zeros(len(image_points), dtype=bool)
+    
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError("Could not open video file")
+    
+    orig_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    orig_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = landmarks_data.meta.get('fps') or 30
+    x, y, width, height = _crop_region(landmarks_data.meta.get('bbox'), orig_width, orig_height)
+    
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+    
+    def decode_frames():
+        for i in range(len(image_points)):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame[y:y+height, x:x+width], image_points[i].tolist() if has_pose[i] else None
+    
+    def annotate(item):
+        frame, landmarks = item
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        return cv2.cvtColor(draw_stored_landmarks(rgb_frame, landmarks), cv2.COLOR_RGB2BGR)
+    
+    try:
+        stage_timings = run_pipeline(
+            decode_frames(),
+            [('annotate', annotate), ('encode', out.write)],
+            queue_depth=queue_depth
+        )
+    finally:
+        cap.release()
+        out.release()
+    
+    print(f"Rendered annotated video to {output_path} (stage timings: {stage_timings})")
+    return output_path
+
+def landmarks_path_for(user_id, kind, timestamp):
+    """Local path of the landmarks saved for a user's 'user' or 'reference' video"""
+    return os.path.join(os.getcwd(), 'output', user_id, f'{kind}_landmarks', f'landmarks_{timestamp}.npz')
+
+def _process_video_task(video_path, output_path, bbox, running_mode, profile, sampling):
+    """
+    Video worker entry point: detect poses and return the landmarks as
+    LandmarkArrays, with the worker's detector pool stats (worker_pool_report)
+    """
+    # Arrays pickle back to the parent far faster than the nested landmarks dict
+    landmarks = from_dict(process_video(video_path, output_path, bbox, running_mode=running_mode,
+                                        profile=profile, **sampling))
+    return landmarks, worker_pool_report()
+
+def _init_video_worker(running_mode, profile):
+    """Video worker initializer: load the detectors once so every task finds them warm"""
+    return get_detector_pool(running_mode, profile).warm()
+
+def _warm_video_worker(running_mode, profile):
+    """Warm-up task: (seconds spent loading detectors, worker_pool_report)"""
+    return _init_video_worker(running_mode, profile), worker_pool_report()
+
+# Detector pools of the spawned video workers, as reported with each task
+video_worker_pools = WorkerPoolStats()
+
+_video_executor = None
+_video_executor_lock = threading.Lock()
+
+def get_video_executor():
+    """
+    Shared executor that runs process_video for the user and reference videos side by side
+    
+    Detection is CPU-bound, so by default the videos go to VIDEO_WORKERS
+    spawned processes that each keep a warm detector pool between requests.
+    With VIDEO_WORKERS=0 they run in threads of the calling process instead
+    (e.g. inside job workers, which are already separate processes).
+    """
+    global _video_executor
+    with _video_executor_lock:
+        if _video_executor is None:
+            if VIDEO_WORKERS > 0:
+                _video_executor = ProcessPoolExecutor(
+                    max_workers=VIDEO_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_video_worker,
+                    initargs=(RUNNING_MODE_VIDEO, PROFILE_SCORING)
+                )
+            else:
+                _video_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='video')
+        return _video_executor
+
+def warm_video_workers():
+    """Start the video workers and load their detectors ahead of the first request"""
+    executor = get_video_executor()
+    if isinstance(executor, ThreadPoolExecutor):
+        return [get_detector_pool(RUNNING_MODE_VIDEO).warm()]
+    futures = [executor.submit(_warm_video_worker, RUNNING_MODE_VIDEO, PROFILE_SCORING)
+               for _ in range(VIDEO_WORKERS)]
+    warmup_seconds = []
+    for future in futures:
+        seconds, report = future.result()
+        video_worker_pools.record(report)
+        warmup_seconds.append(seconds)
+    return warmup_seconds
+
+def _video_bbox(video):
+    return (
+        int(video['x']),
+        int(video['y']),
+        int(video['width']),
+        int(video['height'])
+    )
+
+def _arrivals(json_data, downloads):
+    """(key, content hash) of each requested video, in the order their files become available"""
+    keys = [key for key in ('userVideo', 'referenceVideo') if key in json_data]
+    for key in keys:
+        if key not in downloads:
+            yield key, None
+    waiting = {downloads[key]: key for key in keys if key in downloads}
+    for future in as_completed(waiting):
+        yield waiting[future], future.result().sha256
+
+def _cache_reference(landmark_cache, cache_key, landmarks, upload=None):
+    """Cache processed reference landmarks, with the processed video's URL once its upload succeeds"""
+    if upload is None:
+        persist_in_background(landmark_cache.put, cache_key, landmarks, processedUrl=None)
+        return
+    
+    def uploaded(future):
+        if future.exception() is None:
+            persist_in_background(landmark_cache.put, cache_key, landmarks, processedUrl=future.result())
+    upload.add_done_callback(uploaded)
+
+def finish_uploads(results):
+    """
+    Wait for the processed video uploads process_and_upload_comparison left
+    running (see its work_dir) and fill in each result's 'processedUrl'
+    """
+    for result in results.values():
+        if 'upload' in result:
+            result['processedUrl'] = result.pop('upload').result()
+    return results
+
+def process_and_upload_comparison(json_data, storage, landmark_cache=None, video_executor=None, downloads=None,
+                                  work_dir=None):
     """
     Process both user and reference videos and save landmarks locally
     
+    The two videos are processed concurrently, and each processed video is
+    uploaded as soon as it is ready, overlapping with work on the other one.
+    
     Args:
         json_data: Dictionary containing video metadata and paths
-        bucket: Firebase storage bucket instance (only used for processed videos)
+        storage: artifact_storage.StorageBackend (or a Firebase bucket) for
+            the processed videos
+        landmark_cache: optional LandmarkCache; on a hit the reference video is
+            not processed at all
+        video_executor: executor to run process_video in (defaults to
+            get_video_executor())
+        downloads: optional {'userVideo': Future, 'referenceVideo': Future}
+            of downloads.Download for files that are still arriving; each
+            video is processed as soon as its own download completes
+        work_dir: optional directory for the processed videos. If given, their
+            uploads are not waited for: results[...]['upload'] holds the
+            Future of each URL instead of 'processedUrl', and the caller keeps
+            work_dir until they are done (see finish_uploads)
     
     Returns:
-        Dictionary containing results and local paths to landmark files
+        Dictionary containing results, the in-memory landmarks of each video
+        (results[...]['landmarks'], ready for compare_videos) and the local
+        paths they are persisted to in the background
     """
     try:
+        storage = as_storage(storage)
         user_id = json_data['userId']
+        running_mode = json_data.get('runningMode', RUNNING_MODE_VIDEO)
+        profile = json_data.get('detectionProfile', PROFILE_SCORING)
+        # Optional reduced detection rate for high frame rate uploads
+        sampling = {}
+        if json_data.get('targetFps'):
+            sampling = {
+                'target_fps': float(json_data['targetFps']),
+                'adaptive_sampling': bool(json_data.get('adaptiveSampling', False))
+            }
         results = {}
         
+        # Landmarks-only requests skip drawing, encoding and uploading; the
+        # annotated videos can be rendered later through /api/render
+        render = not json_data.get('landmarksOnly', False)
+        # Landmarks are handed to the comparison in memory; saving them to disk
+        # (needed by /api/render) happens in the background and can be skipped
+        persist = json_data.get('persistLandmarks', True)
+        timestamp = json_data.get('timestamp', 'default')
+        
         # Create output directories if they don't exist
         output_dir = os.path.join(os.getcwd(), 'output', user_id)
-        user_landmarks_dir = os.path.join(output_dir, 'user_landmarks')
-        ref_landmarks_dir = os.path.join(output_dir, 'reference_landmarks')
-        os.makedirs(user_landmarks_dir, exist_ok=True)
-        os.makedirs(ref_landmarks_dir, exist_ok=True)
+        user_landmarks = landmarks_path_for(user_id, 'user', timestamp)
+        ref_landmarks = landmarks_path_for(user_id, 'reference', timestamp)
+        os.makedirs(os.path.dirname(user_landmarks), exist_ok=True)
+        os.makedirs(os.path.dirname(ref_landmarks), exist_ok=True)
         
-        # Create temporary directory for video processing
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Process user video
-            if 'userVideo' in json_data:
-                user_video = json_data['userVideo']
-                user_output = os.path.join(temp_dir, f'processed_user_{user_id}.mp4')
-                timestamp = json_data.get('timestamp', 'default')
-                user_landmarks = os.path.join(user_landmarks_dir, f'landmarks_{timestamp}.json')
-                user_bbox = (
-                    int(user_video['x']),
-                    int(user_video['y']),
-                    int(user_video['width']),
-                    int(user_video['height'])
-                )
-                
-                # Process the video and get landmarks
-                user_landmarks_data = process_video(
-                    user_video['filePath'], 
-                    user_output, 
-                    user_bbox,
-                    user_landmarks
-                )
+        executor = video_executor or get_video_executor()
+        # Videos being processed: key -> (bbox, processed output, landmarks path, upload path)
+        pending = {}
+        futures = {}
+        
+        # Create temporary directory for video processing unless the caller gave one
+        with nullcontext(work_dir) if work_dir else tempfile.TemporaryDirectory() as temp_dir:
+            cache_key = None
+            for key, content_hash in _arrivals(json_data, downloads or {}):
+                video = json_data[key]
+                bbox = _video_bbox(video)
                 
-                # Upload only processed video to Firebase
-                video_upload_path = f'processed_videos/{user_id}/user_video.mp4'
-                video_blob = bucket.blob(video_upload_path)
-                video_blob.upload_from_filename(user_output)
-                video_blob.make_public()
+                if key == 'userVideo':
+                    pending[key] = (
+                        bbox,
+                        os.path.join(temp_dir, f'processed_user_{user_id}.mp4') if render else None,
+                        user_landmarks,
+                        f'processed_videos/{user_id}/user_video.mp4'
+                    )
+                else:
+                    # Reference clips are shared between users, so reuse landmarks
+                    # (and the processed video) from an earlier run when possible
+                    cached = None
+                    if landmark_cache is not None:
+                        cache_key = landmark_cache.key_for(
+                            video['filePath'], bbox, content_hash=content_hash,
+                            running_mode=running_mode, profile=profile, model=MODEL_ASSET_PATH,
+                            detection_max_side=DETECTION_MAX_SIDE, **sampling
+                        )
+                        cached = landmark_cache.get(cache_key)
+                        if cached and render and not cached[1].get('processedUrl'):
+                            cached = None  # Cached without a processed video but one was requested
+                    
+                    if cached:
+                        cached_path, cached_metadata = cached
+                        if persist:
+                            # /api/render looks the landmarks up under this request's path
+                            persist_in_background(landmark_cache.export, cache_key, ref_landmarks)
+                        results['referenceVideo'] = {
+                            'processedUrl': cached_metadata.get('processedUrl') if render else None,
+                            'landmarks': load_landmark_arrays(cached_path),
+                            'landmarksPath': ref_landmarks if persist else cached_path,
+                            'bbox': bbox,
+                            'cacheHit': True
+                        }
+                        continue
+                    
+                    # Cached references are uploaded under their cache key so
+                    # the URL stays valid for every user that hits the cache later
+                    pending[key] = (
+                        bbox,
+                        os.path.join(temp_dir, f'processed_reference_{user_id}.mp4') if render else None,
+                        ref_landmarks,
+                        f'processed_videos/reference/{cache_key}.mp4' if cache_key
+                        else f'processed_videos/{user_id}/reference_video.mp4'
+                    )
                 
-                results['userVideo'] = {
-                    'processedUrl': video_blob.public_url,
-                    'landmarksPath': user_landmarks,  # Local file path
-                    'bbox': user_bbox
-                }
+                output = pending[key][1]
+                futures[executor.submit(_process_video_task, video['filePath'], output, bbox,
+                                        running_mode, profile, sampling)] = key
             
-            # Process reference video
-            if 'referenceVideo' in json_data:
-                ref_video = json_data['referenceVideo']
-                ref_output = os.path.join(temp_dir, f'processed_reference_{user_id}.mp4')
-                timestamp = json_data.get('timestamp', 'default')
-                ref_landmarks = os.path.join(ref_landmarks_dir, f'landmarks_{timestamp}.json')
-                ref_bbox = (
-                    int(ref_video['x']),
-                    int(ref_video['y']),
-                    int(ref_video['width']),
-                    int(ref_video['height'])
-                )
-                
-                # Process the video and get landmarks
-                ref_landmarks_data = process_video(
-                    ref_video['filePath'], 
-                    ref_output, 
-                    ref_bbox,
-                    ref_landmarks
-                )
-                
-                # Upload only processed video to Firebase
-                video_upload_path = f'processed_videos/{user_id}/reference_video.mp4'
-                video_blob = bucket.blob(video_upload_path)
-                video_blob.upload_from_filename(ref_output)
-                video_blob.make_public()
-                
-                results['referenceVideo'] = {
-                    'processedUrl': video_blob.public_url,
-                    'landmarksPath': ref_landmarks,  # Local file path
-                    'bbox': ref_bbox
+            # Upload each processed video while the other one is still being processed
+            uploads = {}
+            landmarks = {}
+            processed = False
+            try:
+                for future in as_completed(futures):
+                    key = futures[future]
+                    _, output, landmarks_path, upload_path = pending[key]
+                    landmarks[key], pool_report = future.result()
+                    video_worker_pools.record(pool_report)
+                    if persist:
+                        persist_in_background(save_landmark_arrays, landmarks_path, landmarks[key])
+                    if render:
+                        uploads[key] = storage.upload_async(output, upload_path, 'video/mp4')
+                processed = True
+            finally:
+                # Uploads read from temp_dir, so they finish before it is removed
+                # (after this function returns, if the caller owns it)
+                if work_dir is None or not processed:
+                    wait(uploads.values())
+            
+            for key, (bbox, _, landmarks_path, _) in pending.items():
+                results[key] = {
+                    'processedUrl': None,
+                    'landmarks': landmarks[key],
+                    'landmarksPath': landmarks_path if persist else None,  # Local file path
+                    'bbox': bbox
                 }
+                if key in uploads and work_dir:
+                    results[key]['upload'] = uploads[key]
+                elif key in uploads:
+                    results[key]['processedUrl'] = uploads[key].result()
+            
+            if 'referenceVideo' in pending:
+                results['referenceVideo']['cacheHit'] = False
+                if cache_key:
+                    _cache_reference(landmark_cache, cache_key, landmarks['referenceVideo'],
+                                     uploads.get('referenceVideo'))
         
         return {
             'status': 'success',
@@ -286,6 +623,17 @@ def main():
     parser.add_argument('output_video', help='Path for the output video file')
     parser.add_argument('--bbox', nargs=4, type=int, metavar=('X', 'Y', 'WIDTH', 'HEIGHT'),
                       help='Bounding box coordinates (x y width height) in pixels')
+    parser.add_argument('--running-mode', choices=[RUNNING_MODE_IMAGE, RUNNING_MODE_VIDEO],
+                      default=RUNNING_MODE_IMAGE, help='MediaPipe running mode')
+    parser.add_argument('--profile', choices=[PROFILE_SCORING, PROFILE_FULL],
+                      default=PROFILE_FULL, help='Detection profile (full keeps all poses and masks)')
+    parser.add_argument('--landmarks', help='Where to save landmarks (.npz for the compact format, else JSON)')
+    parser.add_argument('--queue-depth', type=int, default=PIPELINE_QUEUE_DEPTH,
+                      help='Frames buffered between pipeline stages')
+    parser.add_argument('--target-fps', type=float,
+                      help='Run detection at about this frame rate and interpolate the frames in between')
+    parser.add_argument('--adaptive-sampling', action='store_true',
+                      help='With --target-fps, detect more densely while the pose moves quickly')
     
     # Parse arguments
     args = parser.parse_args()
@@ -294,50 +642,11 @@ def main():
     bbox = tuple(args.bbox) if args.bbox else None
     
     try:
-        process_video(args.input_video, args.output_video, bbox)
+        process_video(args.input_video, args.output_video, bbox, args.landmarks, running_mode=args.running_mode,
+                      profile=args.profile, queue_depth=args.queue_depth, target_fps=args.target_fps,
+                      adaptive_sampling=args.adaptive_sampling)
     except Exception as e:
         print(f"Error processing video: {e}")
 
 if __name__ == "__main__":
     main()
-
-def compare_videos(user_landmarks_path, ref_landmarks_path, output_dir=None):
-    try:
-        # Load landmarks
-        user_data = load_landmarks(user_landmarks_path)
-        ref_data = load_landmarks(ref_landmarks_path)
-        
-        # Extract pose sequences
-        user_seq = extract_pose_sequence(user_data)
-        ref_seq = extract_pose_sequence(ref_data)
-        
-        # Calculate similarity
-        comparison = calculate_pose_similarity(user_seq, ref_seq)
-        
-        # Generate visualization if output directory is provided
-        if output_dir:
-            os.makedirs(output_dir, exist_ok=True)
-            
-            # Ensure proper cleanup of matplotlib resources
-            plt.figure(figsize=(12, 6))
-            try:
-                plt.plot([f['similarity'] for f in comparison['frame_by_frame']])
-                plt.title('Frame-by-Frame Pose Similarity')
-                plt.xlabel('Frame')
-                plt.ylabel('Similarity Score')
-                plt.grid(True)
-                plt.savefig(os.path.join(output_dir, 'similarity_graph.png'))
-            finally:
-                plt.close('all')  # Ensure all figures are closed
-        
-        return comparison
-        
-    except Exception as e:
-        print(f"Error in compare_videos: {str(e)}")
-        return {
-            'overall_similarity': 0.0,
-            'timing_alignment': 0.0,
-            'key_points_analysis': {},
-            'frame_by_frame': [],
-            'error': str(e)
-        }
\ No newline at end of file
@@ -0,0 +1,228 @@
+import os
+import uuid
+import tempfile
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import ExitStack
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
+from train import process_and_upload_comparison, finish_uploads
+from compare_landmarks import compare_videos, render_similarity_graph
+from downloads import download_in_background
+from artifact_storage import as_storage
+
+logger = logging.getLogger(__name__)
+
+# Similarity graphs are rendered after the response, one at a time
+_graph_renderer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='graph-renderer')
+
+GRAPH_PENDING = 'pending'
+GRAPH_READY = 'ready'
+GRAPH_FAILED = 'failed'
+
+# Background renders by graph id, so clients can poll for the URL; the oldest
+# finished ones are forgotten once more than this many are tracked
+MAX_TRACKED_GRAPHS = int(os.environ.get('MAX_TRACKED_GRAPHS', '256'))
+_graphs = OrderedDict()
+_graphs_lock = threading.Lock()
+
+def render_graph_in_background(comparison, storage, remote_path):
+    """
+    Render the similarity graph and upload it to remote_path off the request path
+
+    Failures are logged rather than raised. Returns the graph's id for
+    graph_status: its URL is only handed out once the upload has succeeded.
+    """
+    def run():
+        try:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                graph_path = render_similarity_graph(comparison, os.path.join(temp_dir, 'similarity_graph.png'))
+                return storage.upload(graph_path, remote_path, 'image/png')
+        except Exception as e:
+            logger.error(f"Background graph rendering failed: {str(e)}")
+            raise
+    
+    graph_id = uuid.uuid4().hex
+    with _graphs_lock:
+        finished = [key for key, future in _graphs.items() if future.done()]
+        for key in finished[:max(0, len(_graphs) + 1 - MAX_TRACKED_GRAPHS)]:
+            del _graphs[key]
+        _graphs[graph_id] = _graph_renderer.submit(run)
+    return graph_id
+
+def _graph_status(graph_id, future):
+    status = {'id': graph_id, 'status': GRAPH_PENDING, 'url': None}
+    if future.done():
+        error = future.exception()
+        if error is None:
+            status.update(status=GRAPH_READY, url=future.result())
+        else:
+            status.update(status=GRAPH_FAILED, error=str(error))
+    return status
+
+def graph_status(graph_id):
+    """Status and (once uploaded) URL of a background graph, or None if it isn't tracked here"""
+    with _graphs_lock:
+        future = _graphs.get(graph_id)
+    return _graph_status(graph_id, future) if future is not None else None
+
+def when_graph_done(graph_id, callback):
+    """Call callback(graph status) once a background graph is uploaded or has failed (now, if it has)"""
+    with _graphs_lock:
+        future = _graphs.get(graph_id)
+    if future is not None:
+        future.add_done_callback(lambda done: callback(_graph_status(graph_id, done)))
+
+def run_training(json_data, storage, landmark_cache=None, progress=None, video_executor=None):
+    """
+    Run the full /api/train pipeline: download, detect, compare and upload
+    
+    Args:
+        json_data: request body (userId, userVideo, referenceVideo, options);
+            renderGraph requests a similarity_graph.png, rendered and uploaded
+            in the background after the response; the response gives its
+            similarity_graph_status, and the URL is in graph_status once the
+            upload has succeeded
+        storage: artifact_storage.StorageBackend (or a Firebase bucket) for
+            processed videos and artifacts
+        landmark_cache: optional LandmarkCache for reference videos
+        progress: optional callback progress(stage, fraction) for job status
+        video_executor: optional executor for process_video (see get_video_executor)
+    
+    Returns:
+        The response dict; its 'status' is 'error' if video processing failed
+    """
+    def report(stage, fraction):
+        if progress:
+            progress(stage, fraction)
+    
+    logger.info(f"Processing request for user: {json_data.get('userId')}")
+    storage = as_storage(storage)
+    
+    # Create temporary directory for processing; uploads still reading from it
+    # are waited for on the way out, before it is removed
+    with tempfile.TemporaryDirectory() as temp_dir, ExitStack() as pending_uploads:
+        logger.info(f"Created temporary directory: {temp_dir}")
+        
+        # Download videos
+        user_video_path = os.path.join(temp_dir, 'user_video.mp4')
+        ref_video_path = os.path.join(temp_dir, 'reference_video.mp4')
+        
+        # Both videos download concurrently; each one is processed as soon as
+        # it has arrived, while the other may still be downloading
+        report('downloading', 0.0)
+        logger.info("Downloading user and reference videos...")
+        downloads = {
+            'userVideo': download_in_background(
+                json_data['userVideo']['videoUrl'], user_video_path, json_data['userVideo'].get('sha256')
+            ),
+            'referenceVideo': download_in_background(
+                json_data['referenceVideo']['videoUrl'], ref_video_path, json_data['referenceVideo'].get('sha256')
+            )
+        }
+        
+        # Update file paths in JSON data
+        json_data['userVideo']['filePath'] = user_video_path
+        json_data['referenceVideo']['filePath'] = ref_video_path
+        
+        # Process videos and generate landmarks
+        report('processing', 0.1)
+        logger.info("Processing videos and generating landmarks...")
+        # The processed videos keep uploading from temp_dir while the landmarks are compared
+        processing_result = process_and_upload_comparison(json_data, storage, landmark_cache, video_executor,
+                                                          downloads=downloads, work_dir=temp_dir)
+        # Don't let the temporary directory go while a failed request's other download is still writing
+        wait(downloads.values())
+        
+        if processing_result['status'] != 'success':
+            logger.error(f"Processing failed: {processing_result.get('error')}")
+            return processing_result
+        pending_uploads.callback(wait, [result['upload'] for result in processing_result['results'].values()
+                                        if 'upload' in result])
+        
+        # Landmarks come straight from processing; no disk round-trip
+        user_landmarks = processing_result['results']['userVideo']['landmarks']
+        ref_landmarks = processing_result['results']['referenceVideo']['landmarks']
+        
+        # Create comparison output directory
+        comparison_dir = os.path.join(processing_result['outputDirectory'], 'comparison')
+        os.makedirs(comparison_dir, exist_ok=True)
+        
+        # Compare landmarks
+        report('comparing', 0.8)
+        logger.info("Comparing landmarks...")
+        try:
+            comparison_results = compare_videos(
+                user_landmarks,
+                ref_landmarks,
+                output_dir=comparison_dir,
+                # The user practised one section of the reference routine
+                subsequence=json_data.get('partialMatch', False)
+            )
+            logger.info("Landmark comparison completed successfully")
+        except Exception as e:
+            logger.error(f"Error during landmark comparison: {str(e)}")
+            raise
+        
+        # Upload comparison results to artifact storage
+        try:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            comparison_path = f'comparison_results/{json_data["userId"]}/{timestamp}'
+            
+            report('uploading', 0.9)
+            logger.info("Uploading comparison results...")
+            
+            # The client plots similarity_series itself; a PNG is only rendered
+            # on request, after the response, so only its status is known here
+            graph = None
+            if json_data.get('renderGraph', False):
+                graph_path = f'{comparison_path}/similarity_graph.png'
+                graph = graph_status(render_graph_in_background(comparison_results, storage, graph_path))
+            
+            # Upload detailed results JSON alongside the processed videos still in flight
+            results_upload = storage.upload_async(os.path.join(comparison_dir, 'comparison_results.json'),
+                                                  f'{comparison_path}/comparison_results.json', 'application/json')
+            finish_uploads(processing_result['results'])
+            results_url = results_upload.result()
+            
+            logger.info("Successfully uploaded comparison results")
+            
+        except Exception as e:
+            logger.error(f"Error uploading comparison results: {str(e)}")
+            raise
+        
+        # Prepare response
+        response = {
+            'status': 'success',
+            'userId': json_data['userId'],
+            'timestamp': timestamp,
+            'comparison': {
+                'overall_similarity': comparison_results['overall_similarity'],
+                'timing_alignment': comparison_results['timing_alignment'],
+                'key_points_analysis': comparison_results['key_points_analysis'],
+                'reference_window': comparison_results.get('reference_window'),
+                'part_timelines': comparison_results.get('part_timelines'),
+                'similarity_series': comparison_results.get('similarity_series')
+            },
+            'videos': {
+                'user': {
+                    'processed': processing_result['results']['userVideo']['processedUrl'],
+                    'landmarks': processing_result['results']['userVideo']['landmarksPath']
+                },
+                'reference': {
+                    'processed': processing_result['results']['referenceVideo']['processedUrl'],
+                    'landmarks': processing_result['results']['referenceVideo']['landmarksPath'],
+                    'cacheHit': processing_result['results']['referenceVideo']['cacheHit']
+                }
+            },
+            'artifacts': {
+                'similarity_graph': graph['url'] if graph else None,
+                'similarity_graph_status': graph,
+                'detailed_results': results_url
+            }
+        }
+        
+        logger.info("Successfully prepared response")
+        report('done', 1.0)
+        return response